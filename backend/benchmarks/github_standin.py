@@ -0,0 +1,357 @@
+"""
+A local stand-in for the GitHub API, to benchmark GithubAPI (term searches,
+user recent activity, watchlist refreshes) offline and reproducibly.
+
+Record responses once through the stand-in (it forwards requests to GitHub):
+
+    python -m benchmarks.github_standin record --fixtures github_fixtures.json
+
+then point github_args.base_url in server_config.jsonc (or GithubAPI's
+base_url) at http://127.0.0.1:8765 and run the searches / refreshes to record.
+Replay them later without GitHub:
+
+    python -m benchmarks.github_standin replay --fixtures github_fixtures.json \\
+        --latency .2 --jitter .1 --error_rate .01 --limit search=30/60
+
+Fixtures are a JSON file:
+
+    {
+    'version': 1,
+    'responses': {
+        request key ('GET /search/repositories?q=...' with sorted query
+        params, or 'POST /graphql sha256(body)'): {
+            'status': int,
+            'headers': {header: value},
+            'body': str
+            }
+        }
+    }
+
+Upstream API URLs in bodies and headers are stored as {base_url} and replaced
+with the stand-in's URL on replay, so PyGithub follows links (lazy owner info,
+pagination) back to the stand-in.
+
+On replay, X-RateLimit-* headers are made up from --limit (calls per window
+per token and resource; GraphQL requests count as one call) and requests over
+the limit get GitHub's 403 rate limit response. --error_rate responses are 502
+errors. Requests that weren't recorded get a 404. GET /_standin/stats returns
+request counts.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+UPSTREAM = 'https://api.github.com'
+BASE_URL_PLACEHOLDER = '{base_url}'
+# Headers that no longer apply to the stored (decoded) body, or that are made
+# up on replay.
+DROP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding',
+                'connection', 'date', 'server', 'strict-transport-security',
+                'x-ratelimit-limit', 'x-ratelimit-remaining', 'x-ratelimit-reset',
+                'x-ratelimit-used', 'x-ratelimit-resource'}
+# GitHub's limits per token: {resource: (calls, window seconds)}.
+GITHUB_LIMITS = {'search': (30, 60), 'core': (5000, 3600), 'graphql': (5000, 3600)}
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('mode', choices=['record', 'replay'])
+parser.add_argument('--fixtures', type=str, default='github_fixtures.json')
+parser.add_argument('--host', type=str, default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8765)
+parser.add_argument('--upstream', type=str, default=UPSTREAM,
+                    help='API to record from.')
+parser.add_argument('--token', type=str, default=None,
+                    help="Token for recording, instead of the client's.")
+parser.add_argument('--latency', type=float, default=0,
+                    help='Seconds added to each replayed response.')
+parser.add_argument('--jitter', type=float, default=0,
+                    help='Random extra seconds (up to) added to latency.')
+parser.add_argument('--error_rate', type=float, default=0,
+                    help='Fraction of replayed responses that are 502 errors.')
+parser.add_argument('--limit', nargs='*', default=[],
+                    help="Rate limits as resource=calls/seconds (e.g. search=30/60). "
+                    "Defaults to GitHub's; calls=0 is unlimited.")
+parser.add_argument('--seed', type=int, default=None)
+
+
+def get_resource(path):
+    if path.startswith('/graphql'):
+        return 'graphql'
+    if path.startswith('/search'):
+        return 'search'
+    return 'core'
+
+
+def make_key(method, path, body=b''):
+    """Request key of fixtures (see module docstring)."""
+    url = urlsplit(path)
+    key = f'{method} {url.path}'
+    if url.query:
+        key += '?' + urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode('utf-8')
+        except ValueError:
+            pass
+        key += ' ' + hashlib.sha256(body).hexdigest()
+    return key
+
+
+class Fixtures():
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.responses = json.load(f)['responses']
+        except FileNotFoundError:
+            self.responses = {}
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def add(self, key, response):
+        with self.lock:
+            self.responses[key] = response
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'responses': self.responses},
+                          f, indent=1)
+
+
+class RateLimiter():
+    """Fixed window call counts per (token, resource)."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.lock = threading.Lock()
+        # {(token, resource): [calls, window reset time]}
+        self.windows = {}
+
+    def call(self, token, resource):
+        """Returns (allowed, rate limit headers)."""
+        calls, seconds = self.limits.get(resource, (0, 0))
+        if not calls:
+            return True, {}
+        with self.lock:
+            now = time.time()
+            window = self.windows.get((token, resource))
+            if not window or now >= window[1]:
+                window = self.windows[(token, resource)] = [0, now + seconds]
+            allowed = window[0] < calls
+            if allowed:
+                window[0] += 1
+            return allowed, {
+                'X-RateLimit-Limit': str(calls),
+                'X-RateLimit-Remaining': str(calls - window[0]),
+                'X-RateLimit-Reset': str(int(window[1]) + 1),
+                'X-RateLimit-Used': str(window[0]),
+                'X-RateLimit-Resource': resource
+            }
+
+
+class GithubStandIn():
+    """
+    Stand-in server (see module docstring). start() serves it from a thread
+    and returns its URL, for use from benchmark scripts.
+
+    Parameters
+    ----------
+    fixtures : str
+        Path to fixtures file.
+    mode : str, default 'replay'
+        'replay' or 'record'.
+    host : str, default '127.0.0.1'
+    port : int, default 0
+        0 for any free port.
+    upstream : str, default 'https://api.github.com'
+    token : str, optional
+        Token for recording, instead of the client's.
+    latency : float, default 0
+    jitter : float, default 0
+    error_rate : float, default 0
+    limits : dict, optional
+        {resource: (calls, window seconds)}, updating GitHub's limits.
+    seed : int, optional
+        Seeds latency jitter and errors.
+    """
+
+    def __init__(self,
+                 fixtures,
+                 mode='replay',
+                 host='127.0.0.1',
+                 port=0,
+                 upstream=UPSTREAM,
+                 token=None,
+                 latency=0,
+                 jitter=0,
+                 error_rate=0,
+                 limits=None,
+                 seed=None):
+        self.fixtures = Fixtures(fixtures)
+        self.mode = mode
+        self.upstream = upstream.rstrip('/')
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limiter = RateLimiter({**GITHUB_LIMITS, **(limits or {})})
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'recorded': 0, 'missing': 0,
+                      'rate_limited': 0, 'errors': 0, 'by_resource': {}}
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, stat, resource=None):
+        with self.stats_lock:
+            self.stats[stat] += 1
+            if resource:
+                by_resource = self.stats['by_resource']
+                by_resource[resource] = by_resource.get(resource, 0) + 1
+
+    def handle(self, method, path, headers, body):
+        """Returns (status, headers, body) for a request."""
+        if path == '/_standin/stats':
+            with self.stats_lock:
+                return 200, {'Content-Type': 'application/json'}, json.dumps(self.stats)
+        resource = get_resource(path)
+        self.count('requests', resource)
+        key = make_key(method, path, body)
+        if self.mode == 'record':
+            return self.record(key, method, path, headers, body)
+
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        token = headers.get('Authorization', '')
+        allowed, rate_headers = self.rate_limiter.call(token, resource)
+        if not allowed:
+            self.count('rate_limited')
+            return 403, {'Content-Type': 'application/json', **rate_headers}, json.dumps({
+                'message': f'API rate limit exceeded for {resource}.',
+                'documentation_url': 'https://docs.github.com/rest/overview/resources-in-the-rest-api#rate-limiting'})
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.count('errors')
+            return 502, {'Content-Type': 'application/json', **rate_headers}, json.dumps(
+                {'message': 'Server Error'})
+        response = self.fixtures.get(key)
+        if not response:
+            self.count('missing')
+            print(f'Not recorded: {key}')
+            return 404, {'Content-Type': 'application/json', **rate_headers}, json.dumps(
+                {'message': 'Not Found (not recorded)'})
+        return (response['status'],
+                {**self.from_fixture(response['headers']), **rate_headers},
+                self.from_fixture(response['body']))
+
+    def record(self, key, method, path, headers, body):
+        headers = {header: value for header, value in headers.items()
+                   if header.lower() not in ('host', 'content-length', 'accept-encoding')}
+        if self.token:
+            headers['Authorization'] = f'token {self.token}'
+        r = self.session.request(method, self.upstream + path, headers=headers,
+                                 data=body or None, allow_redirects=False, timeout=60)
+        response_headers = {header: value for header, value in r.headers.items()
+                            if header.lower() not in DROP_HEADERS}
+        if r.status_code < 500 and not (r.status_code == 403 and 'rate limit' in r.text.lower()):
+            self.fixtures.add(key, {'status': r.status_code,
+                                    'headers': self.to_fixture(response_headers),
+                                    'body': self.to_fixture(r.text)})
+            self.count('recorded')
+        rate_headers = {header: value for header, value in r.headers.items()
+                        if header.lower().startswith('x-ratelimit')}
+        return r.status_code, {**response_headers, **rate_headers}, r.text.replace(
+            self.upstream, self.url)
+
+    def to_fixture(self, value):
+        if isinstance(value, dict):
+            return {k: self.to_fixture(v) for k, v in value.items()}
+        return value.replace(self.upstream, BASE_URL_PLACEHOLDER)
+
+    def from_fixture(self, value):
+        if isinstance(value, dict):
+            return {k: self.from_fixture(v) for k, v in value.items()}
+        return value.replace(BASE_URL_PLACEHOLDER, self.url)
+
+    def make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; don't wait for ACKs.
+            disable_nagle_algorithm = True
+
+            def respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, headers, response_body = standin.handle(
+                    self.command, self.path, dict(self.headers), body)
+                response_body = response_body.encode('utf-8')
+                self.send_response(status)
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', str(len(response_body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(response_body)
+
+            do_GET = do_POST = do_HEAD = do_PATCH = do_PUT = do_DELETE = respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parse_limits(limits):
+    """['search=30/60', ...] -> {'search': (30, 60.0), ...}"""
+    parsed = {}
+    for limit in limits:
+        resource, value = limit.split('=')
+        calls, seconds = value.split('/')
+        parsed[resource] = (int(calls), float(seconds))
+    return parsed
+
+
+def main():
+    args = parser.parse_args()
+    standin = GithubStandIn(args.fixtures,
+                            mode=args.mode,
+                            host=args.host,
+                            port=args.port,
+                            upstream=args.upstream,
+                            token=args.token,
+                            latency=args.latency,
+                            jitter=args.jitter,
+                            error_rate=args.error_rate,
+                            limits=parse_limits(args.limit),
+                            seed=args.seed)
+    print(f'GitHub stand-in ({args.mode}) at {standin.url}')
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        print(json.dumps(standin.stats))
+
+
+if __name__ == '__main__':
+    main()
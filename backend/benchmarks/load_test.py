@@ -0,0 +1,577 @@
+"""
+Load test of the /home request types, for sizing hardware and catching
+regressions between releases.
+
+Run from backend:
+
+    python -m benchmarks.load_test --corpus benchmarks/corpus \\
+        --fixtures github_fixtures.json --concurrency 8 --requests 50
+
+--corpus is a directory of saved pages (.html) and PDFs (.pdf). --fixtures are
+recorded GitHub responses (see benchmarks/github_standin.py); record them by
+running this once with --record (which forwards to GitHub, with the token in
+server_config.jsonc) and the same --seed.
+
+The server is started with gunicorn (serving settings from server_config.jsonc
+or --workers / --threads) and a copy of server_config.jsonc (passed in
+TOOL_FETCHER_CONFIG) that:
+    - points github_args.base_url at a GitHub stand-in replaying --fixtures
+      (with --github_latency, --github_error_rate),
+    - keeps the watchlist, jobs, caches and user excluded words in a
+      temporary directory (caches start empty; --no_caches disables them),
+    - sends page fetches (findTermsInURL, blogs of watchlist authors) to a
+      local origin serving --corpus, with --origin_latency. Pages are served
+      by file name (any other URL gets the first page), and https URLs
+      (which can't be served without TLS) fail right away.
+Models are loaded offline (HF_HUB_OFFLINE), so they must be downloaded first.
+
+Or use --url to load test a server that's already running (--pid to measure
+its memory).
+
+Each branch (request type) is run on its own, and reported with p50/p95/p99
+latency, throughput, errors and peak memory of the server's processes (RSS
+summed over processes, and PSS, which counts pages shared by forked workers
+once).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.github_standin import GithubStandIn
+from config import load_config
+from find_terms.utils import read_lines
+
+BRANCHES = ['HTML', 'PDF', 'findResultsForTerms', 'findTermsInURL',
+            'updateWatchlist', 'rateResults', 'recentActivityGet']
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--corpus', type=str, default='benchmarks/corpus')
+parser.add_argument('--fixtures', type=str, default='github_fixtures.json')
+parser.add_argument('--record', action='store_true',
+                    help='Record GitHub responses to --fixtures instead of replaying them.')
+parser.add_argument('--branches', nargs='+', default=BRANCHES, choices=BRANCHES)
+parser.add_argument('--concurrency', type=int, default=4)
+parser.add_argument('--requests', type=int, default=20,
+                    help='Requests per branch.')
+parser.add_argument('--warmup', type=int, default=1,
+                    help='Requests per branch before measuring.')
+parser.add_argument('--stream', type=str, default=None, choices=['ndjson', 'sse'],
+                    help='Stream header for HTML, PDF and findTermsInURL.')
+parser.add_argument('--terms_per_request', type=int, default=5)
+parser.add_argument('--terms_file', type=str,
+                    default='data/find_terms/tool_names_keep_case.txt',
+                    help='Terms for findResultsForTerms and rateResults.')
+parser.add_argument('--authors', nargs='*', default=None,
+                    help='GitHub users for updateWatchlist (by default, users in --fixtures).')
+parser.add_argument('--github_latency', type=float, default=.1)
+parser.add_argument('--github_error_rate', type=float, default=0)
+parser.add_argument('--origin_latency', type=float, default=.05)
+parser.add_argument('--no_caches', action='store_true')
+parser.add_argument('--workers', type=int, default=None)
+parser.add_argument('--threads', type=int, default=None)
+parser.add_argument('--port', type=int, default=5055)
+parser.add_argument('--url', type=str, default=None,
+                    help='Server to load test instead of starting one.')
+parser.add_argument('--pid', type=int, default=None,
+                    help='Process (and children) to measure memory of with --url.')
+parser.add_argument('--startup_timeout', type=float, default=600)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output', type=str, default=None,
+                    help='Writes results to this JSON file.')
+
+
+class TextParser(HTMLParser):
+    """Text of a page, one paragraph per block of text (like the extension sends)."""
+
+    def __init__(self):
+        super().__init__()
+        self.paragraphs = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style', 'noscript'):
+            self.skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style', 'noscript') and self.skip:
+            self.skip -= 1
+
+    def handle_data(self, data):
+        if not self.skip and data.strip():
+            self.paragraphs.append(data.strip())
+
+
+def get_paragraphs(html):
+    text_parser = TextParser()
+    text_parser.feed(html)
+    return text_parser.paragraphs
+
+
+class Corpus():
+    def __init__(self, corpus_dir):
+        self.pages, self.pdfs = {}, {}
+        for name in sorted(os.listdir(corpus_dir)):
+            path = os.path.join(corpus_dir, name)
+            if name.lower().endswith(('.html', '.htm')):
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    self.pages[name] = f.read()
+            elif name.lower().endswith('.pdf'):
+                with open(path, 'rb') as f:
+                    self.pdfs[name] = f.read()
+        if not self.pages:
+            raise ValueError(f'No .html pages in {corpus_dir}.')
+
+
+class Origin():
+    """
+    Serves corpus pages by file name, directly or as an HTTP proxy (for any
+    http URL). CONNECT (https) is refused.
+    """
+
+    def __init__(self, corpus, latency=0, host='127.0.0.1'):
+        self.corpus = corpus
+        self.latency = latency
+        self.server = ThreadingHTTPServer((host, 0), self.make_handler())
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def page(self, path):
+        name = os.path.basename(urlsplit(path).path)
+        return self.corpus.pages.get(name) or next(iter(self.corpus.pages.values()))
+
+    def make_handler(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; don't wait for ACKs.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if origin.latency:
+                    time.sleep(origin.latency)
+                body = origin.page(self.path).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            do_HEAD = do_GET
+
+            def do_CONNECT(self):
+                self.send_response(502)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def get_fixture_authors(fixtures_path):
+    """Users searched for in recorded fixtures ('<login> in:login' searches)."""
+    try:
+        with open(fixtures_path, encoding='utf-8') as f:
+            keys = json.load(f)['responses']
+    except FileNotFoundError:
+        return []
+    authors = []
+    for key in keys:
+        url = urlsplit(key.split(' ')[1])
+        if url.path == '/search/users':
+            query = dict(parse_qsl(url.query)).get('q', '')
+            if query.endswith(' in:login'):
+                authors.append(query[:-len(' in:login')])
+    return authors
+
+
+class ProcessMemory():
+    """Samples memory of a process and its children from /proc (Linux)."""
+
+    def __init__(self, pid, interval=.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = {'rss': 0, 'pss': 0}
+        self.running = False
+
+    def pids(self):
+        children = {}
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(name))
+        pids, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(children.get(pid, []))
+        return pids
+
+    def sample(self):
+        """Returns {'rss': bytes, 'pss': bytes} summed over processes."""
+        total = {'rss': 0, 'pss': 0}
+        for pid in self.pids():
+            try:
+                with open(f'/proc/{pid}/smaps_rollup') as f:
+                    for line in f:
+                        field, value = line.split(':', 1)
+                        if field in ('Rss', 'Pss'):
+                            total[field.lower()] += int(value.split()[0]) * 1024
+            except (OSError, ValueError):
+                continue
+        return total
+
+    def __enter__(self):
+        self.peak = {'rss': 0, 'pss': 0}
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            for key, value in self.sample().items():
+                self.peak[key] = max(self.peak[key], value)
+            time.sleep(self.interval)
+
+
+class NoMemory():
+    peak = {'rss': None, 'pss': None}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def make_config(args, tmp_dir, github_url, origin_url):
+    config = load_config()
+    data = os.path.join(tmp_dir, 'data')
+    os.makedirs(data)
+    config['author_watchlist_db'] = os.path.join(data, 'author_watchlist.sqlite')
+    config['author_watchlist_file'] = os.path.join(data, 'author_watchlist.json')
+    config['jobs_args']['store_args'] = {
+        'path': os.path.join(data, 'jobs.sqlite'),
+        'jobs_dir': os.path.join(data, 'jobs')}
+    serving = config.setdefault('serving', {})
+    serving['bind'] = f'127.0.0.1:{args.port}'
+    serving['metrics_dir'] = os.path.join(data, 'metrics')
+    if args.workers:
+        serving['workers'] = args.workers
+    if args.threads:
+        serving['threads'] = args.threads
+
+    find_terms_args = config['find_terms_args']
+    user_file = find_terms_args.get('excluded_words_by_user_file')
+    if user_file:
+        find_terms_args['excluded_words_by_user_file'] = os.path.join(
+            data, 'excluded_words_by_user.txt')
+        if os.path.exists(user_file):
+            shutil.copy(user_file, find_terms_args['excluded_words_by_user_file'])
+    if args.no_caches:
+        find_terms_args.pop('doc_cache_args', None)
+        find_terms_args.pop('sent_cache_args', None)
+    else:
+        if 'doc_cache_args' in find_terms_args:
+            find_terms_args['doc_cache_args']['cache_dir'] = os.path.join(
+                data, 'doc_cache')
+        if 'sent_cache_args' in find_terms_args:
+            find_terms_args['sent_cache_args']['path'] = os.path.join(
+                data, 'sent_cache.sqlite')
+
+    github_args = config['github_args']
+    github_args['base_url'] = github_url
+    relevance_args = github_args.get('relevance_classifier_args', {})
+    for cache_args in (github_args, relevance_args):
+        if args.no_caches:
+            cache_args.pop('cache_args', None)
+        elif cache_args.get('cache_args'):
+            cache_args['cache_args']['path'] = os.path.join(
+                data, 'repo_cache.sqlite')
+
+    path = os.path.join(tmp_dir, 'server_config.jsonc')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+    env = dict(os.environ,
+               TOOL_FETCHER_CONFIG=path,
+               HTTP_PROXY=origin_url,
+               HTTPS_PROXY=origin_url,
+               NO_PROXY='127.0.0.1,localhost',
+               HF_HUB_OFFLINE='1',
+               TRANSFORMERS_OFFLINE='1')
+    return env
+
+
+def start_server(env, url, timeout):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'server:app'],
+        env=env, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with {process.returncode}.')
+        try:
+            if requests.get(f'{url}/metrics', timeout=2).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    stop_server(process)
+    raise RuntimeError(f'Server not up after {timeout} seconds.')
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+class RequestMaker():
+    """Makes (headers, body) for each request of a branch."""
+
+    def __init__(self, args, corpus, origin_url, terms, authors):
+        self.args = args
+        self.corpus = corpus
+        self.origin_url = origin_url
+        self.terms = terms
+        self.authors = authors
+        self.random = random.Random(args.seed)
+        self.page_names = list(corpus.pages)
+        self.pdf_names = list(corpus.pdfs)
+        self.added_authors = []
+
+    def make(self, branch, index):
+        headers = {'type': branch}
+        if self.args.stream and branch in ('HTML', 'PDF', 'findTermsInURL'):
+            headers['stream'] = self.args.stream
+        if branch == 'HTML':
+            page = self.corpus.pages[self.page_names[index % len(self.page_names)]]
+            return headers, json.dumps(get_paragraphs(page))
+        if branch == 'PDF':
+            return headers, self.corpus.pdfs[self.pdf_names[index % len(self.pdf_names)]]
+        if branch == 'findResultsForTerms':
+            return headers, json.dumps(self.random.sample(
+                self.terms, min(self.args.terms_per_request, len(self.terms))))
+        if branch == 'findTermsInURL':
+            name = self.page_names[index % len(self.page_names)]
+            return headers, json.dumps(f'{self.origin_url}/{name}')
+        if branch == 'updateWatchlist':
+            # Adds each author in turn, then refreshes them all, then removes
+            # them.
+            n_authors = len(self.authors)
+            if index < n_authors:
+                return headers, json.dumps({'action': 'add',
+                                            'author': {'name': self.authors[index]}})
+            if index == n_authors:
+                return headers, json.dumps({'action': 'update_all'})
+            return headers, json.dumps({'action': 'remove',
+                                        'authorName': self.authors[index - n_authors - 1]})
+        if branch == 'rateResults':
+            return headers, json.dumps({'term': self.random.choice(self.terms),
+                                        'rating': self.random.random() < .5})
+        return headers, None
+
+    def n_requests(self, branch):
+        if branch == 'updateWatchlist':
+            return 2 * len(self.authors) + 1 if self.authors else 0
+        if branch == 'PDF' and not self.pdf_names:
+            return 0
+        return self.args.requests
+
+
+def parse_messages(content, content_type):
+    """
+    Messages (dictionaries) in a response body: each line of NDJSON, each
+    'data:' line of server-sent events, or the body if it's a JSON object.
+    Returns (messages, whether the body was streamed).
+    """
+    text = content.decode('utf-8')
+    if content_type.startswith('application/x-ndjson'):
+        lines = text.splitlines()
+    elif content_type.startswith('text/event-stream'):
+        lines = [line[len('data:'):] for line in text.splitlines()
+                 if line.startswith('data:')]
+    else:
+        return [json.loads(text)] if text[:1] == '{' else [], False
+    return [json.loads(line) for line in lines if line.strip()], True
+
+
+def send(session, url, headers, body):
+    """Returns (seconds, error or None)."""
+    start = time.perf_counter()
+    try:
+        with session.post(url, headers=headers, data=body, stream=True,
+                          timeout=600) as r:
+            content = b''.join(r.iter_content(65536))
+        if not r.ok:
+            return time.perf_counter() - start, f'HTTP {r.status_code}'
+        messages, streamed = parse_messages(
+            content, r.headers.get('Content-Type', ''))
+        for message in messages:
+            if isinstance(message, dict) and message.get('error'):
+                return time.perf_counter() - start, message['error']
+        # Term result streams (the only ones requested here) end with
+        # {'done': True} unless the server failed midway.
+        if streamed and not (messages and messages[-1].get('done')):
+            return time.perf_counter() - start, 'Stream ended early'
+        return time.perf_counter() - start, None
+    except (requests.RequestException, ValueError) as ex:
+        return time.perf_counter() - start, type(ex).__name__
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(round(p / 100 * len(sorted_values) + .5)) - 1,
+                len(sorted_values) - 1)
+    return sorted_values[max(index, 0)]
+
+
+def run_branch(branch, request_maker, url, concurrency, warmup, memory):
+    n_requests = request_maker.n_requests(branch)
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+    if branch == 'updateWatchlist':
+        # Requests depend on each other (add, refresh, remove).
+        requests_ = [request_maker.make(branch, index)
+                     for index in range(n_requests)]
+        warmup, concurrency = 0, 1
+    else:
+        for index in range(warmup):
+            send(session, url, *request_maker.make(branch, index))
+        requests_ = [request_maker.make(branch, index + warmup)
+                     for index in range(n_requests)]
+
+    with memory:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(
+                lambda request: send(session, url, *request), requests_))
+        seconds = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = {}
+    for _, error in results:
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'seconds': seconds,
+        'throughput': len(results) / seconds if seconds else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'errors': errors,
+        'peak_rss': memory.peak['rss'],
+        'peak_pss': memory.peak['pss']
+    }
+
+
+def format_result(branch, result):
+    def ms(seconds):
+        return f'{seconds * 1000:8.0f}' if seconds is not None else '       -'
+
+    def mb(n_bytes):
+        return f'{n_bytes / 2**20:8.0f}' if n_bytes else '       -'
+    throughput = f"{result['throughput']:8.2f}" if result['throughput'] else '       -'
+    return (f"{branch:<20}{result['requests']:>6}{ms(result['p50'])}{ms(result['p95'])}"
+            f"{ms(result['p99'])}{throughput}{mb(result['peak_rss'])}{mb(result['peak_pss'])}"
+            f"  {sum(result['errors'].values())} {json.dumps(result['errors']) if result['errors'] else ''}")
+
+
+def main():
+    args = parser.parse_args()
+    corpus = Corpus(args.corpus)
+    terms = [line.strip() for line in read_lines(args.terms_file) if line.strip()]
+    authors = args.authors if args.authors is not None else get_fixture_authors(
+        args.fixtures)
+
+    origin = Origin(corpus, latency=args.origin_latency)
+    origin_url = origin.start()
+    standin, process, tmp_dir = None, None, None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            pid = args.pid
+        else:
+            standin = GithubStandIn(args.fixtures,
+                                    mode='record' if args.record else 'replay',
+                                    token=load_config()['github_args']['token'] if args.record else None,
+                                    latency=args.github_latency,
+                                    error_rate=args.github_error_rate,
+                                    seed=args.seed)
+            github_url = standin.start()
+            tmp_dir = tempfile.mkdtemp(prefix='load_test_')
+            env = make_config(args, tmp_dir, github_url, origin_url)
+            url = f'http://127.0.0.1:{args.port}'
+            print('Starting server...')
+            process = start_server(env, url, args.startup_timeout)
+            pid = process.pid
+
+        request_maker = RequestMaker(args, corpus, origin_url, terms, authors)
+        results = {}
+        print(f"\n{'branch':<20}{'n':>6}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}"
+              f"{'req/s':>8}{'RSS MB':>8}{'PSS MB':>8}  errors")
+        for branch in args.branches:
+            memory = ProcessMemory(pid) if pid else NoMemory()
+            result = run_branch(branch, request_maker, f'{url}/home',
+                                args.concurrency, args.warmup, memory)
+            results[branch] = result
+            print(format_result(branch, result))
+        if standin:
+            print(f'\nGitHub stand-in: {json.dumps(standin.stats)}')
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    finally:
+        if process:
+            stop_server(process)
+        if standin:
+            standin.stop()
+        origin.stop()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares RelevanceClassifier backends on accuracy and latency.
+
+Run from backend:
+
+    python -m benchmarks.relevance_backends --data descriptions.csv
+
+--data is a CSV with 'description' and 'label' (True if relevant) columns. Or
+use --repo_cache to take descriptions from the term results cache
+(data/repo_cache.sqlite); those are unlabeled, so backends are compared by
+agreement with the first backend instead of accuracy.
+"""
+import argparse
+import json
+import sqlite3
+import time
+
+import pandas as pd
+
+from relevance_classifier import RelevanceClassifier
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+source = parser.add_mutually_exclusive_group(required=True)
+source.add_argument('--data', type=str, default=None,
+                    help="CSV with 'description' and 'label' columns.")
+source.add_argument('--repo_cache', type=str, default=None,
+                    help='Term results cache to take (unlabeled) descriptions from.')
+parser.add_argument('--limit', type=int, default=200,
+                    help='Maximum number of descriptions.')
+parser.add_argument('--backends', nargs='+', default=['zero-shot', 'embedding'],
+                    help='Backends to compare (the first is the reference for agreement).')
+parser.add_argument('--model', type=str, default='facebook/bart-large-mnli',
+                    help="Model for the 'zero-shot' backend.")
+parser.add_argument('--embedding_model', type=str, default='sentence-transformers/all-MiniLM-L6-v2',
+                    help="Model for the 'embedding' backend.")
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--n_sequential', type=int, default=20,
+                    help='Descriptions classified one at a time to measure unbatched latency.')
+
+
+def load_descriptions(args):
+    """Returns (descriptions, labels or None)."""
+    if args.data:
+        df = pd.read_csv(args.data).dropna(subset=['description'])[:args.limit]
+        labels = [str(label).lower() in ('true', '1') for label in df['label']]
+        return list(df['description']), labels
+    conn = sqlite3.connect(args.repo_cache)
+    descriptions = []
+    for (value,) in conn.execute('SELECT value FROM term_repos'):
+        for repo in (json.loads(value) or {}).get('repos', []):
+            if repo.get('description'):
+                descriptions.append(repo['description'])
+    return list(dict.fromkeys(descriptions))[:args.limit], None
+
+
+def main():
+    args = parser.parse_args()
+    descriptions, labels = load_descriptions(args)
+    print(f'{len(descriptions)} descriptions\n')
+
+    reference = None
+    for backend in args.backends:
+        start = time.perf_counter()
+        classifier = RelevanceClassifier(model=args.model,
+                                         backend=backend,
+                                         embedding_model=args.embedding_model,
+                                         batch_size=args.batch_size)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for description in descriptions[:args.n_sequential]:
+            classifier.classify_text(description)
+        sequential = (time.perf_counter() - start) / \
+            max(min(args.n_sequential, len(descriptions)), 1)
+
+        start = time.perf_counter()
+        results = classifier.classify_texts(descriptions)
+        batched = (time.perf_counter() - start) / max(len(descriptions), 1)
+
+        predicted = [result['label'] for result in results]
+        print(backend)
+        print(f'  load: {load_seconds:.1f}s')
+        print(f'  one at a time: {sequential * 1000:.1f} ms/description')
+        print(f'  batched: {batched * 1000:.1f} ms/description '
+              f'({1 / batched if batched else 0:.1f} descriptions/s)')
+        if labels:
+            correct = sum(p == l for p, l in zip(predicted, labels))
+            print(f'  accuracy: {correct / len(labels):.3f}')
+        if reference is None:
+            reference = predicted
+        else:
+            agreement = sum(p == r for p, r in zip(predicted, reference))
+            print(f'  agreement with {args.backends[0]}: '
+                  f'{agreement / max(len(reference), 1):.3f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Compares TermMatcher (find_terms/term_matcher.py) with the alternation regex
+it replaced, on startup time and matching throughput, and checks that they
+find the same spans.
+
+Run from backend:
+
+    python -m benchmarks.term_matcher --corpus benchmarks/corpus
+
+--corpus is a directory of saved pages (.html) and PDFs (.pdf), as for
+benchmarks/load_test.py. Sentences are tokenized and prepared like
+FindTerms.match_terms_re does, and matched --repeat times with each term list
+(from server_config.jsonc, or --terms_ignore_case_file /
+--terms_keep_case_file).
+"""
+import argparse
+import os
+import pickle
+import re
+import tempfile
+import time
+
+from nltk import sent_tokenize
+
+from benchmarks.load_test import Corpus, get_paragraphs
+from config import load_config
+from find_terms.pdf_utils import pdf_to_txt, sent_tokenize_pdf
+from find_terms.utils import (make_term_patterns, prepare_sent_NER, read_lines,
+                              sent_filter, sent_tokenize_web_doc)
+
+parser = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--corpus', type=str, default='benchmarks/corpus')
+parser.add_argument('--terms_ignore_case_file', type=str, default=None)
+parser.add_argument('--terms_keep_case_file', type=str, default=None)
+parser.add_argument('--repeat', type=int, default=3,
+                    help='Passes over the sentences (the best is reported).')
+
+
+def make_regex_patterns(terms_ignore_case, terms_keep_case=None):
+    """The patterns make_term_patterns made before TermMatcher."""
+    regex_patterns = {}
+    for terms in (terms_ignore_case, terms_keep_case):
+        key = 'ignore_case' if terms is terms_ignore_case else 'keep_case'
+        if not terms:
+            regex_patterns[key] = None
+            continue
+        terms = set(terms)
+        update = set()
+        for term in terms:
+            update.add(term.replace('-', ' '))
+            update.add(term.replace(' ', '-'))
+        terms.update(update)
+        sorted_terms = sorted(terms, key=len, reverse=True)
+        escaped_terms = [re.escape(term) for term in sorted_terms]
+        flags = re.IGNORECASE if key == 'ignore_case' else 0
+        regex_patterns[key] = re.compile(
+            rf'\b({"|".join(escaped_terms)})\b', flags=flags)
+    return regex_patterns
+
+
+def get_sents(corpus_dir):
+    corpus = Corpus(corpus_dir)
+    sents = []
+    for html in corpus.pages.values():
+        sents.extend(sent_tokenize_web_doc(
+            '\n'.join(get_paragraphs(html)), sent_tokenize))
+    for pdf in corpus.pdfs.values():
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(pdf)
+        try:
+            sents.extend(sent_tokenize_pdf(pdf_to_txt(f.name), sent_tokenize))
+        finally:
+            os.remove(f.name)
+    return [prepare_sent_NER(sent) for sent in sents if sent_filter(sent)]
+
+
+def timed(func, repeat=1):
+    """Returns (result, best seconds)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+
+def find_spans(pattern, sents):
+    return [[match.span() for match in pattern.finditer(sent)] for sent in sents]
+
+
+def main():
+    args = parser.parse_args()
+    find_terms_args = load_config()['find_terms_args']
+    terms_ignore_case = read_lines(
+        args.terms_ignore_case_file or find_terms_args['terms_ignore_case_file'])
+    terms_keep_case_file = args.terms_keep_case_file or find_terms_args.get(
+        'terms_keep_case_file')
+    terms_keep_case = read_lines(
+        terms_keep_case_file) if terms_keep_case_file else None
+
+    sents = get_sents(args.corpus)
+    n_chars = sum(len(sent) for sent in sents)
+    print(f'{len(sents)} sentences ({n_chars / 1e6:.2f}M characters), '
+          f'{len(terms_ignore_case)} + {len(terms_keep_case or [])} terms\n')
+
+    regex_patterns, regex_build = timed(lambda: make_regex_patterns(
+        terms_ignore_case, terms_keep_case))
+    term_patterns, trie_build = timed(lambda: make_term_patterns(
+        terms_ignore_case, terms_keep_case))
+    pickled = pickle.dumps(term_patterns, protocol=pickle.HIGHEST_PROTOCOL)
+    _, trie_load = timed(lambda: pickle.loads(pickled), args.repeat)
+    print(f'Startup: regex compile {regex_build:.3f}s, trie build '
+          f'{trie_build:.3f}s, trie unpickle {trie_load:.3f}s '
+          f'({len(pickled) / 1e6:.2f} MB)\n')
+
+    print(f'{"patterns":<12} {"regex sents/s":>14} {"trie sents/s":>14} '
+          f'{"trie MB/s":>10} {"speedup":>8} {"matches":>8}')
+    for key in ('ignore_case', 'keep_case'):
+        if not regex_patterns[key]:
+            continue
+        regex_spans, regex_seconds = timed(
+            lambda: find_spans(regex_patterns[key], sents), args.repeat)
+        trie_spans, trie_seconds = timed(
+            lambda: find_spans(term_patterns[key], sents), args.repeat)
+        mismatches = [sent for sent, a, b in zip(sents, regex_spans, trie_spans)
+                      if a != b]
+        if mismatches:
+            raise AssertionError(
+                f'{len(mismatches)} sentences matched differently ({key}), '
+                f'e.g. {mismatches[0]!r}')
+        print(f'{key:<12} {len(sents) / regex_seconds:>14.0f} '
+              f'{len(sents) / trie_seconds:>14.0f} '
+              f'{n_chars / trie_seconds / 1e6:>10.2f} '
+              f'{regex_seconds / trie_seconds:>7.1f}x '
+              f'{sum(len(spans) for spans in trie_spans):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+Loads server_config.jsonc (JSON with // comment lines), or the file in the
+TOOL_FETCHER_CONFIG environment variable.
+"""
+import json
+import os
+
+from find_terms.utils import read_lines
+
+
+def load_config(path=None):
+    path = path or os.environ.get('TOOL_FETCHER_CONFIG', 'server_config.jsonc')
+    config_text = read_lines(path)
+    config_text = '\n'.join(
+        line for line in config_text if not line.strip().startswith('/'))
+    return json.loads(config_text)
@@ -0,0 +1,100 @@
+"""
+Content-addressed on-disk cache for document results (found terms, highlighted
+PDFs), keyed by a hash of the raw document and a version string.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+class DocCache():
+    """
+    Each document has a directory (named after its key) containing a file for
+    each cached result. Least recently used documents are deleted when the
+    cache is larger than max_bytes.
+
+    Parameters
+    ----------
+    cache_dir : str
+    max_bytes : int, default 1 GB
+    version : str, default ''
+        Included in keys, so results from different models/settings aren't
+        mixed up.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1 << 30, version=''):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def key(self, doc, *args):
+        """
+        Key for doc (bytes or str) and any other args that affect the results.
+        """
+        if type(doc) == str:
+            doc = doc.encode('utf-8')
+        sha256 = hashlib.sha256(json.dumps(
+            [self.version, *args]).encode('utf-8'))
+        sha256.update(doc)
+        return sha256.hexdigest()
+
+    def get(self, key, name):
+        """Returns cached bytes for name under key, or None."""
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry_dir, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key, name, data):
+        entry_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        path = os.path.join(entry_dir, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        os.utime(entry_dir)
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def get_json(self, key, name):
+        data = self.get(key, name)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key, name, value):
+        self.put(key, name, json.dumps(value).encode('utf-8'))
+
+    def evict(self):
+        """Deletes least recently used documents until under 90% of max_bytes."""
+        entries = sorted(self._entries(), key=lambda x: x[2])
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for entry_dir, entry_size, _ in entries:
+            if size <= self.max_bytes * .9:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            size -= entry_size
+        self.size = size
+
+    def _entries(self):
+        """Yields (directory, size, last used time) for each document."""
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                yield entry.path, size, entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,187 @@
+"""
+Words excluded from term results: a fixed list and a list of terms the user
+marked as false positives.
+
+User changes are applied in memory and appended to a journal next to the user
+file, which is compacted into the user file every compact_after changes, so
+rating a term doesn't rewrite or re-read either list. Other processes apply
+new journal entries when they sync.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No locking between processes on Windows (only one process is run there).
+    fcntl = None
+
+
+def read_words(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line for line in f.read().split('\n') if line.strip()]
+
+
+class ExclusionList():
+    """
+    Parameters
+    ----------
+    excluded_words_file : str
+        Words excluded by default (read once).
+    excluded_words_by_user_file : str, optional
+        Terms excluded by the user. Changes are journaled to
+        excluded_words_by_user_file + '.journal'.
+    compact_after : int, default 500
+        Journal entries before the journal is merged into the user file.
+
+    Words are compared lowercased, so lowercase words before checking them
+    with `in`.
+    """
+
+    def __init__(self, excluded_words_file, excluded_words_by_user_file=None, compact_after=500):
+        self.base = set(word.lower()
+                        for word in read_words(excluded_words_file))
+        self.user_file = excluded_words_by_user_file
+        self.journal_file = self.user_file + '.journal' if self.user_file else None
+        self.lock_file = self.user_file + '.lock' if self.user_file else None
+        self.compact_after = compact_after
+        self.user = {}
+        self.user_lower = Counter()
+        self.journal_id = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.lock = threading.RLock()
+        if self.user_file:
+            with self.file_lock(shared=True):
+                self.reload()
+
+    def __contains__(self, word):
+        return word in self.base or word in self.user_lower
+
+    def user_terms(self):
+        """Terms excluded by the user, in the order they were added."""
+        self.sync()
+        return list(self.user)
+
+    def add(self, term):
+        """Excludes term (adds it to the user list)."""
+        term = ' '.join(term.split())
+        self.sync()
+        if term and term not in self.user:
+            self._write('+', term)
+
+    def remove(self, term):
+        """Removes term from the user list."""
+        term = ' '.join(term.split())
+        self.sync()
+        if term in self.user:
+            self._write('-', term)
+
+    def sync(self):
+        """Applies changes journaled by other processes."""
+        if not self.user_file:
+            return
+        try:
+            stat = os.stat(self.journal_file)
+            journal_id, size = (stat.st_dev, stat.st_ino), stat.st_size
+        except FileNotFoundError:
+            journal_id, size = None, 0
+        if journal_id == self.journal_id and size == self.journal_offset:
+            return
+        with self.file_lock(shared=True):
+            self._catch_up()
+
+    def reload(self):
+        """Reads the user file and journal. Call with the file lock held."""
+        self.user = {}
+        self.user_lower = Counter()
+        for term in read_words(self.user_file):
+            self._apply('+', term)
+        self.journal_id, self.journal_offset, self.journal_entries = None, 0, 0
+        self._read_journal()
+
+    def compact(self):
+        """Writes the user list to the user file and empties the journal."""
+        with self.file_lock():
+            self._catch_up()
+            with open(self.user_file + '.tmp', 'w', encoding='utf-8') as w:
+                w.write('\n'.join(self.user))
+            os.replace(self.user_file + '.tmp', self.user_file)
+            open(self.journal_file + '.tmp', 'w').close()
+            os.replace(self.journal_file + '.tmp', self.journal_file)
+            stat = os.stat(self.journal_file)
+            self.journal_id = (stat.st_dev, stat.st_ino)
+            self.journal_offset, self.journal_entries = 0, 0
+
+    @contextmanager
+    def file_lock(self, shared=False):
+        """Locks the user file and journal for this thread and process."""
+        with self.lock:
+            if not fcntl:
+                yield
+                return
+            with open(self.lock_file, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _catch_up(self):
+        """Applies new journal entries. Call with the file lock held."""
+        try:
+            stat = os.stat(self.journal_file)
+            journal_id, size = (stat.st_dev, stat.st_ino), stat.st_size
+        except FileNotFoundError:
+            journal_id, size = None, 0
+        if journal_id != self.journal_id or size < self.journal_offset:
+            # Compacted by another process.
+            self.reload()
+        else:
+            self._read_journal()
+
+    def _apply(self, op, term):
+        if op == '+' and term not in self.user:
+            self.user[term] = None
+            self.user_lower[term.lower()] += 1
+        elif op == '-' and term in self.user:
+            del self.user[term]
+            self.user_lower[term.lower()] -= 1
+            if not self.user_lower[term.lower()]:
+                del self.user_lower[term.lower()]
+
+    def _read_journal(self):
+        """Applies journal entries after journal_offset."""
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            self.journal_id = (stat.st_dev, stat.st_ino)
+            f.seek(self.journal_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.journal_offset += len(line)
+                self.journal_entries += 1
+                line = line.decode('utf-8').rstrip('\n')
+                if line:
+                    self._apply(line[0], line[1:])
+
+    def _write(self, op, term):
+        """Journals a change and applies it (after any earlier entries)."""
+        if not self.user_file:
+            self._apply(op, term)
+            return
+        with self.file_lock():
+            self._catch_up()
+            with open(self.journal_file, 'ab') as f:
+                f.write(f'{op}{term}\n'.encode('utf-8'))
+            self._read_journal()
+        if self.journal_entries >= self.compact_after:
+            self.compact()
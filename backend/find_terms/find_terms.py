@@ -1,8 +1,13 @@
 """
 Finds terms in documents using NER models and regex matching. 
 """
+import hashlib
+import json
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+import torch
 from bs4 import BeautifulSoup
 from flair.data import Sentence
 from flair.models import SequenceTagger
@@ -15,8 +20,12 @@ from .utils import (
     sent_filter,
     sent_tokenize_web_doc,
 )
-from .pdf_utils import pdf_to_txt, sent_tokenize_pdf
-from find_terms.roster_ner.predict import RoSTerPredictor
+from .doc_cache import DocCache
+from .exclusions import ExclusionList
+from .pdf_utils import pdf_highlight, pdf_to_txt, sent_tokenize_pdf
+from .sent_cache import SentenceCache
+from find_terms.roster_ner.predict import RoSTerPredictor, is_out_of_memory
+from metrics import CACHE_LOOKUPS, DOC_SENTENCES, DOC_TERMS, time_stage
 
 
 class FindTerms():
@@ -25,14 +34,20 @@ class FindTerms():
                  excluded_words_by_user_file=None,
                  terms_ignore_case_file=None,
                  terms_keep_case_file=None,
+                 term_patterns_cache=None,
                  use_roster=False,
                  roster_model_path=None,
                  roster_args={},
                  use_flair=False,
                  flair_model=None,
+                 flair_batch_size=32,
                  sent_tokenize_method='nltk',
                  use_line_ends_for_pdf_tokenization=True,
-                 combine_re_and_ner_terms=True):
+                 combine_re_and_ner_terms=True,
+                 doc_cache_args=None,
+                 sent_cache_args=None,
+                 concurrent_extractors=False,
+                 extractor_torch_threads=None):
 
         if terms_ignore_case_file or terms_keep_case_file:
             terms_ignore_case = read_lines(
@@ -40,16 +55,11 @@ class FindTerms():
             terms_keep_case = read_lines(
                 terms_keep_case_file) if terms_keep_case_file else None
             self.term_patterns = make_term_patterns(
-                terms_ignore_case, terms_keep_case)
+                terms_ignore_case, terms_keep_case, cache_path=term_patterns_cache)
         else:
             self.term_patterns = None
-        self.excluded_words_file = excluded_words_file
-        self.excluded_words_by_user_file = excluded_words_by_user_file
-        self.excluded_words = set([x.lower()
-                                  for x in read_lines(excluded_words_file)])
-        if excluded_words_by_user_file:
-            self.excluded_words = self.excluded_words | set([x.lower()
-                                                             for x in read_lines(excluded_words_by_user_file)])
+        self.excluded_words = ExclusionList(
+            excluded_words_file, excluded_words_by_user_file)
 
         self.use_roster = use_roster
         self.roster = None
@@ -59,6 +69,7 @@ class FindTerms():
 
         self.use_flair = use_flair
         self.flair = None
+        self.flair_batch_size = flair_batch_size
         if self.use_flair:
             self.load_flair(flair_model)
 
@@ -67,20 +78,59 @@ class FindTerms():
             self.sent_tokenize = sent_tokenize
 
         self.combine_re_and_ner_terms = combine_re_and_ner_terms
+        # Run regex matching, RoSTER and Flair in separate threads.
+        self.concurrent_extractors = concurrent_extractors
+        # {'roster': n, 'flair': n}, torch intra-op threads set in each 
+        # extractor's thread, so concurrent models split the CPU instead of
+        # oversubscribing it (see run_extractor).
+        self.extractor_torch_threads = extractor_torch_threads or {}
         self.use_line_ends_for_pdf_tokenization = use_line_ends_for_pdf_tokenization
 
+        self.model_version = self.get_model_version(
+            terms_ignore_case_file=terms_ignore_case_file,
+            terms_keep_case_file=terms_keep_case_file,
+            use_roster=use_roster,
+            roster_model_path=roster_model_path,
+            roster_args=roster_args,
+            use_flair=use_flair,
+            flair_model=flair_model,
+            sent_tokenize_method=sent_tokenize_method,
+            use_line_ends_for_pdf_tokenization=use_line_ends_for_pdf_tokenization)
+        self.doc_cache = DocCache(
+            version=self.model_version, **doc_cache_args) if doc_cache_args else None
+        self.sent_cache = SentenceCache(
+            version=self.model_version, **sent_cache_args) if sent_cache_args else None
+
+    @staticmethod
+    def get_model_version(**settings):
+        """
+        Hash of the settings, model files and term lists that affect which 
+        terms are found (excluded words aren't included since they're applied
+        to cached results).
+        """
+        version = {'settings': settings, 'files': {}}
+        for key in ('terms_ignore_case_file', 'terms_keep_case_file', 'roster_model_path'):
+            path = settings.get(key)
+            if path and os.path.exists(path):
+                stat = os.stat(path)
+                version['files'][key] = [stat.st_size, stat.st_mtime_ns]
+        return hashlib.sha256(json.dumps(
+            version, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
     def init_roster(self,
                     model_type='roberta-base',
                     entity_types=['Term'],
                     dropout=.1,
                     max_seq_length=120,
-                    eval_batch_size=64):
+                    eval_batch_size=64,
+                    max_tokens_per_batch=None):
 
         self.roster = RoSTerPredictor(model_type=model_type,
                                       entity_types=entity_types,
                                       dropout=dropout,
                                       max_seq_length=max_seq_length,
-                                      eval_batch_size=eval_batch_size)
+                                      eval_batch_size=eval_batch_size,
+                                      max_tokens_per_batch=max_tokens_per_batch)
 
     def load_roster_model(self, roster_model_path):
         if not self.roster:
@@ -95,27 +145,62 @@ class FindTerms():
         return self.roster.predict(sents, return_sents=return_sents)
 
     def predict_flair(self, sents):
-        terms = set()
-        for sent in sents:
-            sent = Sentence(sent)
-            predicted = False
-            mini_batch_size = 32
-            while not predicted and mini_batch_size >= 1:
+        return set().union(*self.predict_flair_by_sent(sents))
+
+    def predict_roster_by_sent(self, sents):
+        """Returns a list of RoSTER terms for each sentence."""
+        with time_stage('predict_roster'):
+            tagged_sents = self.predict_roster(sents)
+        return [get_terms_from_tagged_sents([tagged_sent]) for tagged_sent in tagged_sents]
+
+    def predict_flair_by_sent(self, sents):
+        """
+        Returns a list of Flair terms for each sentence. Sentences are
+        predicted together, longest first, flair_batch_size at a time (halved
+        for the rest of the call if memory runs out), without keeping
+        embeddings.
+        """
+        with time_stage('predict_flair'):
+            sentences = [Sentence(sent) for sent in sents]
+            order = sorted(range(len(sentences)),
+                           key=lambda index: len(sentences[index]), reverse=True)
+            # Shrunk for this call only (calls run concurrently, and one large
+            # document shouldn't slow down later ones).
+            batch_size = self.flair_batch_size
+            start = 0
+            while start < len(order):
+                batch = [sentences[index]
+                         for index in order[start:start + batch_size]]
                 try:
-                    self.flair.predict(sent, mini_batch_size=mini_batch_size)
-                    predicted = True
+                    self.flair.predict(batch,
+                                       mini_batch_size=batch_size,
+                                       embedding_storage_mode='none')
                 except RuntimeError as e:
-                    if 'out of memory' in str(e):
-                        mini_batch_size = int(mini_batch_size / 2)
-                    else:
-                        raise RuntimeError(e)
-            for entity in sent.get_spans('ner'):
-                if entity.tag in ('PRODUCT'):
-                    terms.add(entity.text)
+                    if not is_out_of_memory(e) or batch_size == 1:
+                        raise
+                    batch_size = max(batch_size // 2, 1)
+                    print(f'Flair out of memory, batch size: {batch_size}')
+                    continue
+                start += len(batch)
+        return [sorted({entity.text for entity in sentence.get_spans('ner')
+                        if entity.tag in ('PRODUCT')})
+                for sentence in sentences]
 
-        return terms
+    def get_ner_terms(self, model, sents, predict_by_sent):
+        """
+        Terms found by model ('roster' or 'flair') in sents with 
+        predict_by_sent, only predicting sentences that aren't in the sentence
+        cache if there is one.
+        """
+        if self.sent_cache:
+            terms_by_sent = self.sent_cache.get_terms(
+                model, sents, predict_by_sent)
+        else:
+            terms_by_sent = predict_by_sent(sents)
+        return set().union(*terms_by_sent)
 
     def filter_terms(self, terms):
+        self.excluded_words.sync()
         filtered_terms = set()
         for term in terms:
             term = re.sub(r'^[^a-z0-9]*|[^a-z0-9]*$|\'s$',
@@ -133,44 +218,123 @@ class FindTerms():
                           doc,
                           pdf=False,
                           html=False,
-                          filter_sents=True):
-        if pdf:
-            text = pdf_to_txt(doc)
-            sents = sent_tokenize_pdf(text,
-                                      self.sent_tokenize,
-                                      use_line_ends=self.use_line_ends_for_pdf_tokenization)
+                          filter_sents=True,
+                          progress=None):
+        """
+        progress (optional) is called with (pages done, total pages) while 
+        text is extracted from a PDF.
+        """
+        if self.doc_cache:
+            key = self.doc_cache.key(doc, pdf, html, filter_sents)
+            unfiltered_terms_dict = self.doc_cache.get_json(key, 'terms.json')
+            CACHE_LOOKUPS.inc(cache='doc_terms',
+                              result='miss' if unfiltered_terms_dict is None else 'fresh')
+            if unfiltered_terms_dict is None:
+                unfiltered_terms_dict = self._find_unfiltered_terms_in_doc(
+                    doc, pdf=pdf, html=html, filter_sents=filter_sents, progress=progress)
+                self.doc_cache.put_json(key, 'terms.json', {
+                    source: sorted(terms) for source, terms in unfiltered_terms_dict.items()})
         else:
-            if html:
-                doc = BeautifulSoup(doc, 'lxml').text
-            sents = sent_tokenize_web_doc(doc, self.sent_tokenize)
-        terms_dict = self.find_terms_in_sents(sents, filter_sents=filter_sents)
+            unfiltered_terms_dict = self._find_unfiltered_terms_in_doc(
+                doc, pdf=pdf, html=html, filter_sents=filter_sents, progress=progress)
+        terms_dict = self.filter_terms_dict(unfiltered_terms_dict)
+        DOC_TERMS.observe(len(set().union(*terms_dict.values())))
         if self.combine_re_and_ner_terms:
             return set().union(*terms_dict.values())
         return terms_dict
 
-    def find_terms_in_sents(self, sents, filter_sents=True):
+    def _find_unfiltered_terms_in_doc(self, doc, pdf=False, html=False, filter_sents=True, progress=None):
+        if pdf:
+            with time_stage('pdf_to_txt'):
+                text = pdf_to_txt(doc, progress=progress)
+            with time_stage('sent_tokenize'):
+                sents = sent_tokenize_pdf(text,
+                                          self.sent_tokenize,
+                                          use_line_ends=self.use_line_ends_for_pdf_tokenization)
+        else:
+            if html:
+                doc = BeautifulSoup(doc, 'lxml').text
+            with time_stage('sent_tokenize'):
+                sents = sent_tokenize_web_doc(doc, self.sent_tokenize)
+        return self.find_terms_in_sents(sents, filter_sents=filter_sents, filter_terms=False)
+
+    def find_terms_in_sents(self, sents, filter_sents=True, filter_terms=True):
         if filter_sents:
             sents = [sent for sent in sents if sent_filter(sent)]
-        terms_from_regex, terms_from_roster, terms_from_flair = set(), set(), set()
+        DOC_SENTENCES.observe(len(sents))
+        extractors = {}
         if self.term_patterns:
-            terms_from_regex = match_terms_in_sents(
-                self.term_patterns, sents, return_terms_only=True)
+            extractors['from_re'] = self.match_terms_re
         if self.use_roster:
-            tagged_sents = self.predict_roster(sents)
-            terms_from_roster = set(get_terms_from_tagged_sents(tagged_sents))
+            extractors['from_roster'] = lambda sents: self.get_ner_terms(
+                'roster', sents, self.predict_roster_by_sent)
         if self.use_flair:
-            terms_from_flair = self.predict_flair(sents)
+            extractors['from_flair'] = lambda sents: self.get_ner_terms(
+                'flair', sents, self.predict_flair_by_sent)
+
+        terms = {'from_re': set(), 'from_roster': set(), 'from_flair': set()}
+        if self.concurrent_extractors and len(extractors) > 1:
+            torch_threads = torch.get_num_threads()
+            with ThreadPoolExecutor(max_workers=len(extractors)) as executor:
+                futures = {source: executor.submit(self.run_extractor, source, extractor, sents,
+                                                   torch_threads)
+                           for source, extractor in extractors.items()}
+                terms.update({source: future.result()
+                             for source, future in futures.items()})
+        else:
+            terms.update({source: extractor(sents)
+                         for source, extractor in extractors.items()})
+        if filter_terms:
+            terms = self.filter_terms_dict(terms)
+        return terms
+
+    def match_terms_re(self, sents):
+        with time_stage('match_terms_re'):
+            return match_terms_in_sents(
+                self.term_patterns, sents, return_terms_only=True)
 
-        terms_from_roster = self.filter_terms(terms_from_roster)
-        terms_from_flair = self.filter_terms(terms_from_flair)
+    def run_extractor(self, source, extractor, sents, default_torch_threads):
+        """
+        Runs extractor in a thread of find_terms_in_sents, with its torch
+        threads from extractor_torch_threads (default_torch_threads, the
+        caller's, if it has none).
 
-        terms = {
-            'from_re': terms_from_regex,
-            'from_roster': terms_from_roster,
-            'from_flair': terms_from_flair
+        torch.set_num_threads sets the calling thread's intra-op threads, and
+        also the number that threads started afterwards get. So the caller's
+        number is put back when the extractor is done. Otherwise the last
+        extractor's number would be used by request and job threads started
+        later, instead of the torch_threads set in post_fork.
+        """
+        torch.set_num_threads(self.extractor_torch_threads.get(
+            source.replace('from_', ''), default_torch_threads))
+        try:
+            return extractor(sents)
+        finally:
+            torch.set_num_threads(default_torch_threads)
+
+    def filter_terms_dict(self, terms_dict):
+        """Filters NER terms (regex terms are kept as is)."""
+        return {
+            'from_re': set(terms_dict['from_re']),
+            'from_roster': self.filter_terms(terms_dict['from_roster']),
+            'from_flair': self.filter_terms(terms_dict['from_flair'])
         }
-        return terms
+
+    def highlight_pdf(self, pdf, terms):
+        """pdf_highlight, using the document cache if there is one."""
+        if not self.doc_cache:
+            with time_stage('pdf_highlight'):
+                return pdf_highlight(pdf, terms)
+        key = self.doc_cache.key(pdf, sorted(terms))
+        highlighted_pdf = self.doc_cache.get(key, 'highlighted.pdf')
+        CACHE_LOOKUPS.inc(cache='doc_highlighted_pdf',
+                          result='miss' if highlighted_pdf is None else 'fresh')
+        if highlighted_pdf is None:
+            with time_stage('pdf_highlight'):
+                highlighted_pdf = pdf_highlight(pdf, terms)
+            self.doc_cache.put(key, 'highlighted.pdf', highlighted_pdf)
+        return highlighted_pdf
 
     def update_excluded(self):
-        self.excluded_words = set([x.lower() for x in read_lines(self.excluded_words_file)]) | set([x.lower()
-                                                                                                    for x in read_lines(self.excluded_words_by_user_file)])
+        """Applies exclusions changed by other processes (see ExclusionList)."""
+        self.excluded_words.sync()
@@ -5,7 +5,6 @@ from collections import OrderedDict
 import json
 import os
 import random
-import re
 
 from tqdm.auto import tqdm
 from bs4 import BeautifulSoup
@@ -51,15 +50,15 @@ def replace_terms_with_oov(term_patterns, term_sets, train_sents, test1_sents, t
     vocab = set(get_terms_from_tagged_sents(train_sents))
     vocab_ignore_case, vocab_keep_case = set(), set()
     for term in vocab:
-        if re.match(term_patterns['ignore_case'], rf'{term}$'):
+        if term_patterns['ignore_case'].match(rf'{term}$'):
             vocab_ignore_case.add(term)
-        if re.match(term_patterns['keep_case'], rf'{term}$'):
+        if term_patterns['keep_case'].match(rf'{term}$'):
             vocab_keep_case.add(term)
     vocab_patterns = make_term_patterns(
         vocab_ignore_case, vocab_keep_case)
     all_oov_terms = []
     for term in ignore_case_terms:
-        if not re.match(vocab_patterns['ignore_case'], rf'{term}$'):
+        if not vocab_patterns['ignore_case'].match(rf'{term}$'):
             all_oov_terms.append(term)
     return_sets = {}
     for sents in (test1_sents, test2_sents):
@@ -90,15 +89,13 @@ def replace_terms_with_oov(term_patterns, term_sets, train_sents, test1_sents, t
             if not get_terms_from_tagged_sents([sent_dict]):
                 continue
             sent = ' '.join(sent_dict['text'])
-            sent = re.sub(vocab_patterns['ignore_case'], re_sub_oov, sent)
+            sent = vocab_patterns['ignore_case'].sub(re_sub_oov, sent)
             if vocab_patterns['keep_case']:
-                sent = re.sub(vocab_patterns['keep_case'], re_sub_oov, sent)
+                sent = vocab_patterns['keep_case'].sub(re_sub_oov, sent)
             if key == 'test2':
-                sent = re.sub(test1_patterns['ignore_case'],
-                              re_sub_oov, sent)
+                sent = test1_patterns['ignore_case'].sub(re_sub_oov, sent)
                 if test1_patterns['keep_case']:
-                    sent = re.sub(test1_patterns['keep_case'],
-                                  re_sub_oov, sent)
+                    sent = test1_patterns['keep_case'].sub(re_sub_oov, sent)
             sent_dict = match_terms_in_sents(
                 term_patterns, [sent])
             sents[index] = sent_dict[0]
@@ -108,11 +105,11 @@ def replace_terms_with_oov(term_patterns, term_sets, train_sents, test1_sents, t
         if key == 'test1' and test2_sents:
             test_terms_ignore_case, test_terms_keep_case = set(), set()
             for term in terms:
-                if re.match(vocab_patterns['ignore_case'], f'{term}$') or re.match(vocab_patterns['keep_case'], f'{term}$'):
+                if vocab_patterns['ignore_case'].match(f'{term}$') or vocab_patterns['keep_case'].match(f'{term}$'):
                     continue
-                if re.match(term_patterns['ignore_case'], f'{term}$'):
+                if term_patterns['ignore_case'].match(f'{term}$'):
                     test_terms_ignore_case.add(term)
-                if re.match(term_patterns['keep_case'], f'{term}$'):
+                if term_patterns['keep_case'].match(f'{term}$'):
                     test_terms_keep_case.add(term)
             test1_patterns = make_term_patterns(
                 test_terms_ignore_case, test_terms_keep_case)
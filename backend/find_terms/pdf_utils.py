@@ -4,8 +4,10 @@ PDF text extraction, sentence tokenization, and highlighting.
 import io
 
 import fitz
-from pdfminer import high_level
+from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
 
 PUNCT = '\'"‘’“”\(\)\[\]:,;.!?'
 
@@ -117,7 +119,7 @@ def tokenize_doc_from_filepath(filepath, sent_tokenize_method, use_line_ends):
                              use_line_ends=use_line_ends)
 
 
-def pdf_to_txt(doc, output_path=None):
+def pdf_to_txt(doc, output_path=None, progress=None):
     """
     Extracts text from PDF.
 
@@ -125,6 +127,8 @@ def pdf_to_txt(doc, output_path=None):
     ----------
     doc : file object or str
         PDF or path to PDF. 
+    progress : callable, optional
+        Called with (pages done, total pages) after each page.
     """
     if type(doc) == str:
         fp = open(doc, 'rb')
@@ -132,7 +136,27 @@ def pdf_to_txt(doc, output_path=None):
         fp = io.BytesIO(doc)
     else:
         fp = doc
-    text = high_level.extract_text(fp, laparams=LAParams())
+    # Same as pdfminer's high_level.extract_text, page by page.
+    output = io.StringIO()
+    device = None
+    try:
+        n_pages = None
+        if progress:
+            n_pages = len(list(PDFPage.get_pages(fp)))
+            fp.seek(0)
+        resource_manager = PDFResourceManager()
+        device = TextConverter(resource_manager, output, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        for index, page in enumerate(PDFPage.get_pages(fp)):
+            interpreter.process_page(page)
+            if progress:
+                progress(index + 1, n_pages)
+    finally:
+        if device:
+            device.close()
+        if fp is not doc:
+            fp.close()
+    text = output.getvalue()
     if output_path:
         with open(output_path, 'w', encoding='utf-8') as outputfile:
             outputfile.write(text)
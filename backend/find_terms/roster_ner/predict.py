@@ -1,9 +1,13 @@
 import torch
-from torch.utils.data import (
-    DataLoader, SequentialSampler, TensorDataset)
-from transformers import RobertaTokenizer
+from transformers import RobertaTokenizerFast
 from tqdm import tqdm
 from .model import RoSTERModel
+from .utils import encode_sents, get_word_starts
+
+
+def is_out_of_memory(e):
+    # CUDA and CPU allocator errors.
+    return 'out of memory' in str(e) or "can't allocate memory" in str(e)
 
 
 class RoSTerPredictor(object):
@@ -13,13 +17,15 @@ class RoSTerPredictor(object):
                  dropout,
                  entity_types,
                  max_seq_length,
-                 eval_batch_size):
+                 eval_batch_size,
+                 max_tokens_per_batch=None):
 
         self.entity_types = entity_types
         self.model_type = model_type
         self.dropout = dropout
         self.max_seq_length = max_seq_length
         self.eval_batch_size = eval_batch_size
+        self.max_tokens_per_batch = max_tokens_per_batch
         self.label_map, self.inv_label_map = self.get_label_map()
         self.num_labels = len(self.inv_label_map) - 1
         self.model = RoSTERModel.from_pretrained(self.model_type,
@@ -29,8 +35,8 @@ class RoSTerPredictor(object):
         self.device = torch.device(
             "cuda" if torch.cuda.is_available() else "cpu")
         self.model.to(self.device)
-        self.tokenizer = RobertaTokenizer.from_pretrained(
-            self.model_type, do_lower_case=False)
+        self.tokenizer = RobertaTokenizerFast.from_pretrained(self.model_type)
+        self.word_starts = get_word_starts(self.tokenizer)
         self.device = torch.device(
             "cuda" if torch.cuda.is_available() else "cpu")
         print(f"***** Using {torch.cuda.device_count()} GPU(s)! *****\n")
@@ -63,36 +69,8 @@ class RoSTerPredictor(object):
         return tensor_data
 
     def get_tensor(self, sents, max_seq_length, drop_o_ratio=0):
-        all_input_ids = []
-        all_attention_mask = []
-        all_valid_pos = []
-        for sent in tqdm(sents, desc="Converting to tensors"):
-            encoded_dict = self.tokenizer.encode_plus(sent,
-                                                      add_special_tokens=True,
-                                                      max_length=max_seq_length,
-                                                      padding='max_length',
-                                                      return_attention_mask=True,
-                                                      truncation=True,
-                                                      return_tensors='pt')
-            input_ids = encoded_dict['input_ids']
-            attention_mask = encoded_dict['attention_mask']
-            all_input_ids.append(input_ids)
-            all_attention_mask.append(attention_mask)
-            valid_pos = torch.zeros(max_seq_length, dtype=torch.long)
-            tokens = self.tokenizer.convert_ids_to_tokens(
-                input_ids[0])
-            j = 0
-            for i, token in enumerate(tokens[1:], start=1):  # skip [CLS]
-                if token == self.tokenizer.sep_token:
-                    break
-                if i == 1 or token.startswith('Ġ'):
-                    valid_pos[i] = 1
-                    j += 1
-            all_valid_pos.append(valid_pos.unsqueeze(0))
-
-        all_input_ids = torch.cat(all_input_ids, dim=0)
-        all_attention_mask = torch.cat(all_attention_mask, dim=0)
-        all_valid_pos = torch.cat(all_valid_pos, dim=0)
+        all_input_ids, all_attention_mask, all_valid_pos = encode_sents(
+            self.tokenizer, sents, max_seq_length, self.word_starts)
         all_idx = torch.arange(all_input_ids.size(0))
         tensor_data = {"all_idx": all_idx,
                        "all_input_ids": all_input_ids,
@@ -101,53 +79,49 @@ class RoSTerPredictor(object):
         return self.drop_o(tensor_data, drop_o_ratio)
 
     def predict(self, sents, return_sents=True):
+        """
+        Predicts labels for each word of sents. With max_tokens_per_batch,
+        sentences are sorted by length and batched by padded token count
+        (restoring their order afterwards), so short sentences aren't padded to
+        the length of long ones; otherwise they're batched in order,
+        eval_batch_size at a time. Batches shrink for the rest of the call if
+        memory runs out.
+        """
         sents = [' '.join(sent.split()) for sent in sents]
+        if not sents:
+            return []
         tensor_data = self.get_tensor(
             sents, max_seq_length=self.max_seq_length)
-
-        all_idx = tensor_data["all_idx"]
-        all_input_ids = tensor_data["all_input_ids"]
-        all_attention_mask = tensor_data["all_attention_mask"]
-        all_valid_pos = tensor_data["all_valid_pos"]
-
-        eval_data = TensorDataset(
-            all_idx, all_input_ids, all_attention_mask, all_valid_pos)
-        eval_sampler = SequentialSampler(eval_data)
-        eval_dataloader = DataLoader(
-            eval_data, sampler=eval_sampler, batch_size=self.eval_batch_size)
+        lengths = tensor_data["all_attention_mask"].sum(dim=-1).tolist()
+        if self.max_tokens_per_batch:
+            order = sorted(range(len(sents)), key=lengths.__getitem__)
+        else:
+            order = list(range(len(sents)))
 
         self.model.eval()
-        # self.model = self.model.to(self.device)
-        y_pred = []
-        pred_probs = []
-        for batch in tqdm(eval_dataloader, desc="Evaluating"):
-            _, input_ids, attention_mask, valid_pos = tuple(
-                t.to(self.device) for t in batch)
-
-            max_len = attention_mask.sum(-1).max().item()
-            input_ids, attention_mask, valid_pos = tuple(t[:, :max_len] for t in
-                                                         (input_ids, attention_mask, valid_pos))
-
-            with torch.no_grad():
-                logits, bin_logits = self.model(
-                    input_ids, attention_mask, valid_pos)
-                entity_prob = torch.sigmoid(bin_logits)
-                type_prob = torch.nn.functional.softmax(
-                    logits, dim=-1) * entity_prob
-                non_type_prob = 1 - entity_prob
-                type_prob = torch.cat([non_type_prob, type_prob], dim=-1)
-
-                preds = torch.argmax(type_prob, dim=-1)
-                preds = preds.cpu().numpy()
-                pred_prob = type_prob.cpu()
-
-            num_valid_tokens = valid_pos.sum(dim=-1)
-            i = 0
-            for j in range(len(num_valid_tokens)):
-                pred_probs.append(pred_prob[i:i + num_valid_tokens[j]])
-                y_pred.append([self.inv_label_map[pred]
-                              for pred in preds[i:i + num_valid_tokens[j]]])
-                i += num_valid_tokens[j]
+        y_pred = [None] * len(sents)
+        progress = tqdm(total=len(sents), desc="Evaluating")
+        # Shrunk for this call only (the predictor is shared by request
+        # threads, and one large document shouldn't slow down later ones).
+        batch_limits = {'max_tokens_per_batch': self.max_tokens_per_batch,
+                        'eval_batch_size': self.eval_batch_size}
+        start = 0
+        while start < len(order):
+            batch = order[start:self.get_batch_end(
+                order, lengths, start, **batch_limits)]
+            try:
+                batch_preds = self.predict_batch(tensor_data, batch)
+            except RuntimeError as e:
+                if not is_out_of_memory(e) or len(batch) == 1:
+                    raise
+                batch_limits = self.shrink_batches(
+                    batch, lengths, **batch_limits)
+                continue
+            for index, preds in zip(batch, batch_preds):
+                y_pred[index] = [self.inv_label_map[pred] for pred in preds]
+            start += len(batch)
+            progress.update(len(batch))
+        progress.close()
 
         if return_sents:
             sent_dicts = [{'text': sent.split(), 'labels': labels}
@@ -155,6 +129,66 @@ class RoSTerPredictor(object):
             return sent_dicts
         return y_pred
 
+    def get_batch_end(self, order, lengths, start, max_tokens_per_batch, eval_batch_size):
+        """End (in order) of the batch starting at start."""
+        if not max_tokens_per_batch:
+            return start + eval_batch_size
+        # Sorted by length, so the last sentence is the longest (the length
+        # the batch is padded to).
+        end = start + 1
+        while end < len(order) and \
+                (end + 1 - start) * lengths[order[end]] <= max_tokens_per_batch:
+            end += 1
+        return end
+
+    def shrink_batches(self, batch, lengths, max_tokens_per_batch, eval_batch_size):
+        """
+        Returns batch limits (the arguments of get_batch_end) with half the
+        batch size (or token budget), after running out of memory.
+        """
+        if max_tokens_per_batch:
+            max_tokens_per_batch = max(
+                len(batch) // 2 * max(lengths[index] for index in batch), 1)
+            print(
+                f'RoSTER out of memory, max_tokens_per_batch: {max_tokens_per_batch}')
+        else:
+            eval_batch_size = max(len(batch) // 2, 1)
+            print(f'RoSTER out of memory, eval_batch_size: {eval_batch_size}')
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+        return {'max_tokens_per_batch': max_tokens_per_batch,
+                'eval_batch_size': eval_batch_size}
+
+    def predict_batch(self, tensor_data, batch):
+        """Returns a list of label ids (for each word) for each sentence in batch."""
+        batch = torch.tensor(batch)
+        input_ids, attention_mask, valid_pos = tuple(
+            tensor_data[key][batch].to(self.device)
+            for key in ("all_input_ids", "all_attention_mask", "all_valid_pos"))
+
+        max_len = attention_mask.sum(-1).max().item()
+        input_ids, attention_mask, valid_pos = tuple(t[:, :max_len] for t in
+                                                     (input_ids, attention_mask, valid_pos))
+
+        with torch.no_grad():
+            logits, bin_logits = self.model(
+                input_ids, attention_mask, valid_pos)
+            entity_prob = torch.sigmoid(bin_logits)
+            type_prob = torch.nn.functional.softmax(
+                logits, dim=-1) * entity_prob
+            non_type_prob = 1 - entity_prob
+            type_prob = torch.cat([non_type_prob, type_prob], dim=-1)
+
+            preds = torch.argmax(type_prob, dim=-1)
+            preds = preds.cpu().tolist()
+
+        batch_preds = []
+        i = 0
+        for num_valid_tokens in valid_pos.sum(dim=-1).tolist():
+            batch_preds.append(preds[i:i + num_valid_tokens])
+            i += num_valid_tokens
+        return batch_preds
+
     def load_model(self, model_path):
         map_location = torch.device(
             'cpu') if self.device.type == 'cpu' else None
@@ -8,7 +8,7 @@ import torch.nn.functional as F
 from torch import nn
 from torch.utils.data import (
     DataLoader, RandomSampler, SequentialSampler, TensorDataset)
-from transformers import (AdamW, RobertaTokenizer,
+from transformers import (AdamW, RobertaTokenizerFast,
                           get_linear_schedule_with_warmup)
 from tqdm import tqdm
 from seqeval.metrics import classification_report
@@ -61,8 +61,8 @@ class RoSTERTrainer(object):
         self.ensemble_train_lr = args.ensemble_train_lr
         self.self_train_lr = args.self_train_lr
 
-        self.tokenizer = RobertaTokenizer.from_pretrained(
-            args.pretrained_model, do_lower_case=False)
+        self.tokenizer = RobertaTokenizerFast.from_pretrained(
+            args.pretrained_model)
         self.processor = RoSTERUtils(self.corpus_dir, self.tokenizer)
         # Removed tag_scheme option due to errors; only uses 'io'.
         # self.label_map, self.inv_label_map = self.processor.get_label_map(
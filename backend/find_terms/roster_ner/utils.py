@@ -1,15 +1,55 @@
 import os
 from collections import defaultdict
-from tqdm import tqdm
 import torch
 import numpy as np
 
 
+def get_word_starts(tokenizer):
+    """
+    Bool tensor over the vocab, True for tokens that start a word (byte-level
+    BPE tokens with the 'Ġ' space prefix).
+    """
+    tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    return torch.tensor([token.startswith('Ġ') for token in tokens])
+
+
+def get_valid_pos(input_ids, attention_mask, word_starts, sep_token_id):
+    """
+    Marks the first token of each word in a batch of encoded sentences (1 for
+    the first token after <s> and tokens in word_starts, up to the first
+    </s>), as (n_sents x seq_length) long tensor.
+    """
+    before_sep = torch.cumsum(input_ids == sep_token_id, dim=1) == 0
+    valid_pos = word_starts[input_ids] & before_sep & attention_mask.bool()
+    valid_pos[:, 1] = before_sep[:, 1]
+    valid_pos[:, 0] = False
+    return valid_pos.long()
+
+
+def encode_sents(tokenizer, sents, max_seq_length, word_starts):
+    """
+    Encodes sents in one batched call (use a fast tokenizer), padded to
+    max_seq_length. Returns (input_ids, attention_mask, valid_pos).
+    """
+    encoded = tokenizer(sents,
+                        add_special_tokens=True,
+                        max_length=max_seq_length,
+                        padding='max_length',
+                        return_attention_mask=True,
+                        truncation=True,
+                        return_tensors='pt')
+    input_ids, attention_mask = encoded['input_ids'], encoded['attention_mask']
+    valid_pos = get_valid_pos(
+        input_ids, attention_mask, word_starts, tokenizer.sep_token_id)
+    return input_ids, attention_mask, valid_pos
+
+
 class RoSTERUtils(object):
 
     def __init__(self, data_dir, tokenizer):
         self.data_dir = data_dir
         self.tokenizer = tokenizer
+        self.word_starts = get_word_starts(tokenizer)
         self.read_types(self.data_dir)
 
     def read_file(self, file_dir="conll", dataset_name="train"):
@@ -89,37 +129,20 @@ class RoSTERUtils(object):
             all_data = self.get_data(
                 dataset_name=dataset_name)
             raw_labels = [data[1] for data in all_data]
-            all_input_ids = []
-            all_attention_mask = []
-            all_labels = []
-            all_valid_pos = []
-            for text, labels in tqdm(all_data, desc="Converting to tensors"):
-                encoded_dict = self.tokenizer.encode_plus(text, add_special_tokens=True, max_length=max_seq_length,
-                                                          padding='max_length', return_attention_mask=True, truncation=True, return_tensors='pt')
-                input_ids = encoded_dict['input_ids']
-                attention_mask = encoded_dict['attention_mask']
-                all_input_ids.append(input_ids)
-                all_attention_mask.append(attention_mask)
-                label_idx = -100 * torch.ones(max_seq_length, dtype=torch.long)
-                valid_pos = torch.zeros(max_seq_length, dtype=torch.long)
-                tokens = self.tokenizer.convert_ids_to_tokens(input_ids[0])
-                j = 0
-                for i, token in enumerate(tokens[1:], start=1):  # skip [CLS]
-                    if token == self.tokenizer.sep_token:
-                        break
-                    if i == 1 or token.startswith('Ġ'):
-                        label = labels[j]
-                        label_idx[i] = self.label_map[label]
-                        valid_pos[i] = 1
-                        j += 1
-                assert j == len(labels) or i == max_seq_length - 1
-                all_labels.append(label_idx.unsqueeze(0))
-                all_valid_pos.append(valid_pos.unsqueeze(0))
-
-            all_input_ids = torch.cat(all_input_ids, dim=0)
-            all_attention_mask = torch.cat(all_attention_mask, dim=0)
-            all_labels = torch.cat(all_labels, dim=0)
-            all_valid_pos = torch.cat(all_valid_pos, dim=0)
+            all_input_ids, all_attention_mask, all_valid_pos = encode_sents(
+                self.tokenizer, [data[0] for data in all_data], max_seq_length,
+                self.word_starts)
+            n_valid = all_valid_pos.sum(dim=1).tolist()
+            truncated = all_attention_mask.sum(dim=1) == max_seq_length
+            label_ids = []
+            for labels, n, is_truncated in zip(raw_labels, n_valid, truncated.tolist()):
+                assert n == len(labels) or is_truncated
+                label_ids.extend(self.label_map[label] for label in labels[:n])
+            # Labels of the first token of each word (row by row, so in the
+            # same order as label_ids).
+            all_labels = -100 * torch.ones_like(all_input_ids)
+            all_labels[all_valid_pos.bool()] = torch.tensor(
+                label_ids, dtype=torch.long)
             all_idx = torch.arange(all_input_ids.size(0))
             tensor_data = {"all_idx": all_idx, "all_input_ids": all_input_ids, "all_attention_mask": all_attention_mask,
                            "all_labels": all_labels, "all_valid_pos": all_valid_pos, "raw_labels": raw_labels}
@@ -0,0 +1,101 @@
+"""
+Cache for NER results by sentence, so sentences repeated across pages (site
+navigation, footers, cookie banners) only go through the models once.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+from sqlite_cache import SQLiteCache
+
+
+def normalize_sent(sent):
+    return ' '.join(sent.split())
+
+
+class SentenceCache():
+    """
+    Terms found in each sentence by each model, in a least recently used
+    in-memory cache (per process) backed by SQLiteCache (shared by processes).
+    Lookups are counted in CACHE_LOOKUPS as cache '<table>_<model>_memory'
+    (fresh or miss) and '<table>_<model>' (by SQLiteCache).
+
+    Parameters
+    ----------
+    path : str
+        Path to SQLite database.
+    version : str, default ''
+        Included in keys (FindTerms.model_version), so results from different
+        models/settings aren't mixed up.
+    memory_entries : int, default 50000
+        Sentences kept in memory (for each model).
+    max_entries : int, default 1000000
+        Sentences kept on disk (for each model).
+    table : str, default 'sent_terms'
+        Prefix of table names (one table per model).
+    """
+
+    def __init__(self,
+                 path,
+                 version='',
+                 memory_entries=50000,
+                 max_entries=1000000,
+                 table='sent_terms'):
+        self.path = path
+        self.version = version
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.table = table
+        self.lock = threading.Lock()
+        # {model: SQLiteCache}
+        self.disk = {}
+        # {model: OrderedDict of {key: terms}}
+        self.memory = {}
+
+    def key(self, model, sent):
+        return hashlib.sha256(json.dumps(
+            [self.version, model, sent]).encode('utf-8')).hexdigest()
+
+    def get_terms(self, model, sents, predict):
+        """
+        Returns a list of terms for each sentence in sents. Sentences are
+        keyed by their text normalized with normalize_sent, but predict gets
+        the original text: it takes a list of sentences that aren't cached
+        (the first of each with the same key) and returns a list of terms for
+        each, in the same order.
+        """
+        keys = [self.key(model, normalize_sent(sent)) for sent in sents]
+        table = f'{self.table}_{model}'
+        with self.lock:
+            if model not in self.memory:
+                self.memory[model] = OrderedDict()
+                self.disk[model] = SQLiteCache(
+                    self.path, table=table, max_entries=self.max_entries)
+            memory, disk = self.memory[model], self.disk[model]
+            found, missing = {}, {}
+            for sent, key in zip(sents, keys):
+                if key in found or key in missing:
+                    continue
+                if key in memory:
+                    memory.move_to_end(key)
+                    found[key] = memory[key]
+                    CACHE_LOOKUPS.inc(cache=f'{table}_memory', result='fresh')
+                else:
+                    missing[key] = sent
+                    CACHE_LOOKUPS.inc(cache=f'{table}_memory', result='miss')
+
+        if missing:
+            missing_sents = list(missing.values())
+            terms = disk.get_many(
+                missing_sents, predict,
+                key=lambda sent: self.key(model, normalize_sent(sent)))
+            with self.lock:
+                for key, sent_terms in zip(missing, terms):
+                    found[key] = sent_terms
+                    memory[key] = sent_terms
+                    memory.move_to_end(key)
+                while len(memory) > self.memory_entries:
+                    memory.popitem(last=False)
+        return [found[key] for key in keys]
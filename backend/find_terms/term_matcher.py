@@ -0,0 +1,159 @@
+"""
+Trie matcher for term lists, replacing the \\b(term|term|...)\\b alternation
+regex (which tries every term at every word boundary).
+"""
+import re
+
+try:
+    # Case folding of re.IGNORECASE: simple lowercase of each character, plus
+    # characters that match more than one lowercase form (i/ı, s/ſ, σ/ς, ...).
+    from _sre import unicode_tolower
+    from re._casefix import _EXTRA_CASES
+except ImportError:
+    from sre_compile import _ignorecase_fixes as _EXTRA_CASES
+
+    def unicode_tolower(ch):
+        lower = chr(ch).lower()
+        return ord(lower) if len(lower) == 1 else ch
+
+# Bump when TermMatcher's attributes change (invalidates pickled matchers).
+TERM_MATCHER_VERSION = 1
+BOUNDARY_PATTERN = re.compile(r'\b')
+# Marks the end of a term in trie nodes (keys are otherwise single characters).
+END = ''
+
+# {character: character all its equivalent lowercase forms are folded to}
+FOLD_TABLE = {}
+for lower, others in _EXTRA_CASES.items():
+    FOLD_TABLE[lower] = min((lower,) + others)
+
+
+def fold_char(char):
+    lower = unicode_tolower(ord(char))
+    return chr(FOLD_TABLE.get(lower, lower))
+
+
+def fold(text):
+    """Folds case like re.IGNORECASE, keeping character positions."""
+    lower = text.lower()
+    # str.lower uses full lowercase mappings, which differ from re's simple
+    # ones only in length (İ) and for final sigma (folded with σ below).
+    if len(lower) != len(text):
+        return ''.join([fold_char(char) for char in text])
+    return lower.translate(FOLD_TABLE)
+
+
+class TermMatch():
+    """Match found by TermMatcher, with the methods of re.Match used here."""
+
+    def __init__(self, string, start, end):
+        self.string = string
+        self._start = start
+        self._end = end
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def span(self):
+        return self._start, self._end
+
+    def group(self, index=0):
+        # Group 1 is the term group of the regex, the same as the whole match.
+        if index not in (0, 1):
+            raise IndexError('no such group')
+        return self.string[self._start:self._end]
+
+    def __repr__(self):
+        return f'<TermMatch span={self.span()} match={self.group()!r}>'
+
+
+class TermMatcher():
+    """
+    Finds terms with the same matches as re.compile(rf'\\b({"|".join(terms)})\\b')
+    (terms escaped, longest first): scanning left to right, the longest term
+    at a word boundary that ends at a word boundary, with re.IGNORECASE case
+    folding if ignore_case. Has the finditer, match and sub methods of
+    compiled patterns, and can be pickled so it doesn't need to be rebuilt at
+    startup (see make_term_patterns in utils.py).
+
+    Parameters
+    ----------
+    terms : iterable
+        Terms to match (empty ones are skipped).
+    ignore_case : bool, default False
+    """
+
+    def __init__(self, terms, ignore_case=False):
+        self.ignore_case = ignore_case
+        self.root = {}
+        self.n_terms = 0
+        for term in terms:
+            self.add(term)
+
+    def add(self, term):
+        if not term:
+            return
+        if self.ignore_case:
+            term = ''.join([fold_char(char) for char in term])
+        node = self.root
+        for char in term:
+            node = node.setdefault(char, {})
+        if END not in node:
+            node[END] = True
+            self.n_terms += 1
+
+    def iter_spans(self, text, pos=0, anchored=False):
+        """
+        Yields (start, end) of matches, from pos on (only at pos if
+        anchored).
+        """
+        folded = fold(text) if self.ignore_case else text
+        boundaries = [match.start()
+                      for match in BOUNDARY_PATTERN.finditer(text, pos)]
+        boundary_set = set(boundaries)
+        root, n = self.root, len(text)
+        for start in boundaries:
+            if start < pos:
+                continue
+            if anchored and start != pos:
+                return
+            node, index, end = root, start, None
+            while index < n:
+                node = node.get(folded[index])
+                if node is None:
+                    break
+                index += 1
+                if END in node and index in boundary_set:
+                    end = index
+            if end is not None:
+                yield start, end
+                pos = end
+            if anchored:
+                return
+
+    def finditer(self, text):
+        for start, end in self.iter_spans(text):
+            yield TermMatch(text, start, end)
+
+    def match(self, text):
+        """Match at the start of text, or None."""
+        for start, end in self.iter_spans(text, anchored=True):
+            return TermMatch(text, start, end)
+        return None
+
+    def sub(self, repl, text):
+        """
+        Replaces matches with repl(match), or repl if it's a string (taken
+        literally, without backreferences).
+        """
+        parts, last_end = [], 0
+        for start, end in self.iter_spans(text):
+            parts.append(text[last_end:start])
+            parts.append(repl if isinstance(repl, str)
+                         else repl(TermMatch(text, start, end)))
+            last_end = end
+        parts.append(text[last_end:])
+        return ''.join(parts)
@@ -1,11 +1,15 @@
 """
 Utility functions
 """
+import hashlib
 import json
 import os
+import pickle
 import random
 import re
 
+from .term_matcher import TERM_MATCHER_VERSION, TermMatcher
+
 
 PUNCT = ',;:\'‘’"“”()[]{}\\/|'
 PUNCT_PATTERN = rf'({"|".join([re.escape(char) for char in PUNCT])}|[.!?]+$)'
@@ -48,9 +52,10 @@ def get_terms_from_tagged_sents(tagged_sents):
     return terms
 
 
-def make_term_patterns(terms_ignore_case, terms_keep_case=None):
+def make_term_patterns(terms_ignore_case, terms_keep_case=None, cache_path=None):
     """
-    Makes regex patterns to find terms in text.
+    Makes TermMatchers (with the methods of compiled regex patterns) to find
+    terms in text.
 
     Parameters
     ----------
@@ -58,9 +63,23 @@ def make_term_patterns(terms_ignore_case, terms_keep_case=None):
         Terms to match ignoring case (don't have common word aliases).
     terms_keep_case : iterable, optional
         Terms to match case-sensitively.
+    cache_path : str, optional
+        Pickle file to load the matchers from if it was made from the same
+        terms, or to save them to otherwise.
     """
-    term_patterns = {}
+    if cache_path:
+        cache_key = hashlib.sha256(json.dumps(
+            [TERM_MATCHER_VERSION, sorted(terms_ignore_case or []),
+             sorted(terms_keep_case or [])]).encode('utf-8')).hexdigest()
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['key'] == cache_key:
+                return cached['term_patterns']
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError):
+            pass
 
+    term_patterns = {}
     for terms in (terms_ignore_case, terms_keep_case):
         key = 'ignore_case' if terms is terms_ignore_case else 'keep_case'
         if not terms:
@@ -72,19 +91,22 @@ def make_term_patterns(terms_ignore_case, terms_keep_case=None):
             update.add(term.replace('-', ' '))
             update.add(term.replace(' ', '-'))
         terms.update(update)
-        sorted_terms = sorted(terms, key=len, reverse=True)
-        escaped_terms = [re.escape(term) for term in sorted_terms]
-        flags = re.IGNORECASE if key == 'ignore_case' else 0
-        term_pattern = re.compile(
-            rf'\b({"|".join(escaped_terms)})\b', flags=flags)
-        term_patterns[key] = term_pattern
-
+        term_patterns[key] = TermMatcher(
+            terms, ignore_case=key == 'ignore_case')
+
+    if cache_path:
+        # Written to a temporary file first, in case other workers are loading it.
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'key': cache_key, 'term_patterns': term_patterns}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
     return term_patterns
 
 
 def match_terms_in_sents(term_patterns, sents, return_terms_only=False):
     """
-    Finds terms in sentences using regex, returning a dictionary of tagged
+    Finds terms in sentences using term patterns, returning a dictionary of tagged
     sentences and a list of matched terms.
     """
     tagged_sents = []
@@ -93,10 +115,10 @@ def match_terms_in_sents(term_patterns, sents, return_terms_only=False):
         sent = prepare_sent_NER(sent)
         spans = set()
         spans.update([match.span()
-                     for match in re.finditer(term_patterns['ignore_case'], sent)])
+                     for match in term_patterns['ignore_case'].finditer(sent)])
         if term_patterns['keep_case']:
             spans.update([match.span()
-                          for match in re.finditer(term_patterns['keep_case'], sent)])
+                          for match in term_patterns['keep_case'].finditer(sent)])
         spans = sorted(spans, key=lambda x: (x[0], -x[1]))
         last_stop = 0
         text, labels = [], []
@@ -1,6 +1,9 @@
+import hashlib
 import os
 
+import joblib
 import pandas as pd
+import sklearn
 from sklearn import metrics
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
@@ -8,6 +11,17 @@ from sklearn.feature_selection import SelectFromModel
 
 from get_posts.utils import get_web_page_features, get_post_set_features
 
+# Increment when the saved model format or training changes.
+MODEL_FILE_VERSION = 1
+
+
+def get_file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
 
 def make_training_test_data(csv_path, test_prop=.1, type_='post_set'):
     """Splits data into training and test sets with labels.
@@ -77,6 +91,10 @@ class Classifier():
     test_data_prop: float
         Reserves this proportion of samples as test data, tests model and saves accuracy
         score in self.accuracy
+    model_path : str, optional
+        Path to saved model. If it was trained on the current csv file (same hash
+        and features), it's loaded instead of training a new model. Otherwise a 
+        new model is trained and saved there.
 
     Attributes
     ----------
@@ -85,21 +103,67 @@ class Classifier():
         used to extract features from post sets in Model.predict
     """
 
-    def __init__(self, csv_path, type_, test_data_prop=0):
+    def __init__(self, csv_path, type_, test_data_prop=0, model_path=None):
         self.type_ = type_
         self.name = os.path.basename(csv_path)[:-4]
         self.test_data_prop = test_data_prop
+        self.csv_hash = get_file_hash(csv_path)
+        self.features = list(pd.read_csv(csv_path, nrows=0).columns)[1:]
+        if model_path and self.load_model(model_path):
+            return
+
         train_dict = make_training_test_data(
             csv_path, test_prop=self.test_data_prop, type_=self.type_)
         self.features = train_dict['features']
         X_train, y_train = train_dict['train_data']
         self.model = train_model(X_train.values, y_train)
 
+        self.accuracy = None
         if test_data_prop:
             X_test, y_test = train_dict['test_data']
             y_pred = self.model.predict(X_test.values)
             self.accuracy = metrics.accuracy_score(y_test, y_pred)
 
+        if model_path:
+            self.save_model(model_path)
+
+    def save_model(self, model_path):
+        if os.path.dirname(model_path):
+            os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        joblib.dump({
+            'version': MODEL_FILE_VERSION,
+            'sklearn_version': sklearn.__version__,
+            'type_': self.type_,
+            'csv_hash': self.csv_hash,
+            'features': self.features,
+            'test_data_prop': self.test_data_prop,
+            'accuracy': self.accuracy,
+            'model': self.model
+        }, model_path)
+
+    def load_model(self, model_path):
+        """
+        Loads model from model_path if it was trained on the current csv file.
+
+        Returns True if the model was loaded.
+        """
+        if not os.path.exists(model_path):
+            return False
+        try:
+            saved = joblib.load(model_path)
+        except Exception:
+            return False
+        if saved.get('version') != MODEL_FILE_VERSION or \
+                saved.get('sklearn_version') != sklearn.__version__ or \
+                saved.get('type_') != self.type_ or \
+                saved.get('csv_hash') != self.csv_hash or \
+                saved.get('features') != self.features or \
+                saved.get('test_data_prop') != self.test_data_prop:
+            return False
+        self.model = saved['model']
+        self.accuracy = saved['accuracy']
+        return True
+
     def predict(self, url, full_html, full_text, posts=None):
         """Runs model on post set and associated html and text files.
 
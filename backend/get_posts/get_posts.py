@@ -10,7 +10,6 @@ get_posts_element_method_only: Tries to get posts from elements containing
 
 """
 import re
-import requests
 from statistics import multimode
 import urllib.parse
 
@@ -22,6 +21,7 @@ import newspaper
 from trafilatura import feeds as t_feeds, extract as t_extract
 
 from get_posts.utils import date_time_pattern, post_term_pattern
+from page_fetcher import default_fetcher
 
 BLOG_LINK_TERMS = set([
     'recent',
@@ -492,19 +492,11 @@ def rate_posts(url, html, text, posts, classifier):
     return pred
 
 
-def get_pages(start_url, look_for_blog=True):
-    # Handle redirect
-    try:
-        r = requests.get(start_url)
-    except Exception as ex:
-        r = None
-    if not r or r.status_code != 200:
-        try:
-            html = newspaper.build(start_url).html
-        except Exception as ex:
-            return
-    else:
-        html = r.text
+def get_pages(start_url, look_for_blog=True, fetcher=None):
+    fetcher = fetcher or default_fetcher()
+    html = fetcher.get_html(start_url)
+    if html is None:
+        return
     start_domain = urllib.parse.urlparse(start_url).netloc
     if html:
         start_page = {'html': html, 'url': start_url}
@@ -525,17 +517,9 @@ def get_pages(start_url, look_for_blog=True):
                             to_add = diff_domain_pages
                         else:
                             to_add = same_domain_pages
-                        try:
-                            r = requests.get(url)
-                        except Exception as ex:
-                            r = None
-                        if not r or r.status_code != 200:
-                            try:
-                                html = newspaper.build(url).html
-                            except Exception as ex:
-                                continue
-                        else:
-                            html = r.text
+                        html = fetcher.get_html(url)
+                        if html is None:
+                            continue
                         collected_urls.append(url)
                         page_to_try = {'html': html, 'url': url}
                         to_add.append(page_to_try)
@@ -630,7 +614,7 @@ def prepare_posts(posts, max_posts, trim, clean_posts, root_url, method, valid=T
     return return_dict
 
 
-def get_posts_element_method_only(url, html=None, max_posts=5, trim=30, clean_posts=True, full_text=False, classifier=None):
+def get_posts_element_method_only(url, html=None, max_posts=5, trim=30, clean_posts=True, full_text=False, classifier=None, fetcher=None):
     """
     Gets posts by searching for elements with dates or post-related terms. 
     Tries various candidate post sets until the classifier finds a valid one.
@@ -646,6 +630,9 @@ def get_posts_element_method_only(url, html=None, max_posts=5, trim=30, clean_po
         by default 30
     full_text: bool, optional
         Includes extracted text of url in return.
+    fetcher : PageFetcher, optional
+        Used to get pages (see page_fetcher.py), by default a shared
+        PageFetcher with default settings.
 
     Returns
     -------
@@ -670,7 +657,8 @@ def get_posts_element_method_only(url, html=None, max_posts=5, trim=30, clean_po
         error_type = 'Page not found.'
         pages_to_try = None
         try:
-            pages_to_try = func_timeout(20, get_pages, args=(url, False))
+            pages_to_try = func_timeout(
+                20, get_pages, args=(url, False, fetcher))
         except FunctionTimedOut:
             error_type = 'Page timed out.'
         if not pages_to_try:
@@ -695,7 +683,7 @@ def get_posts_element_method_only(url, html=None, max_posts=5, trim=30, clean_po
                     return prepare_posts(posts, *post_args, method='class-based', valid=pred, full_text=full_text)
 
 
-def get_posts(url, html=None, max_posts=5, trim=30, clean_posts=True, classifier=None, print_status=False, look_for_blog=True):
+def get_posts(url, html=None, max_posts=5, trim=30, clean_posts=True, classifier=None, print_status=False, look_for_blog=True, fetcher=None):
     """
     Tries various methods in the following order, stopping when the classifier 
     finds a valid post set. 
@@ -723,6 +711,9 @@ def get_posts(url, html=None, max_posts=5, trim=30, clean_posts=True, classifier
     classifier : sklearn RandomForestClassifier, optional
         Clasifier for post sets. Used on each potential result until a valid post set is
         found or all methods are exhausted, by default None
+    fetcher : PageFetcher, optional
+        Used to get pages (see page_fetcher.py), by default a shared
+        PageFetcher with default settings.
 
     Returns
     -------
@@ -752,7 +743,7 @@ def get_posts(url, html=None, max_posts=5, trim=30, clean_posts=True, classifier
         pages_to_try = None
         try:
             pages_to_try = func_timeout(
-                20, get_pages, args=(url, look_for_blog))
+                20, get_pages, args=(url, look_for_blog, fetcher))
         except FunctionTimedOut:
             error_type = 'Page timed out.'
         if not pages_to_try:
@@ -0,0 +1,155 @@
+"""
+Searches GitHub repos for many terms at once with the GraphQL API.
+
+Each term is an aliased search in a single query, and repo owner fields are
+fetched in the same query, so a batch of terms costs one request (the REST
+search costs about 1 + 2 * n_repo_results requests per term because of lazily
+fetched owner info and archive links).
+"""
+import json
+
+import requests
+
+from metrics import GITHUB_CALLS
+
+REPO_FIELDS = """
+fragment RepoFields on Repository {
+  name
+  url
+  description
+  nameWithOwner
+  defaultBranchRef {
+    name
+  }
+  owner {
+    login
+    url
+    ... on User {
+      websiteUrl
+      bio
+      twitterUsername
+    }
+    ... on Organization {
+      websiteUrl
+      description
+      twitterUsername
+    }
+  }
+}
+"""
+
+
+class GraphQLRateLimitError(Exception):
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.headers = headers
+
+
+class SearchFailed():
+    """
+    In place of a term's repo list in search_repos' results when the term's
+    search failed (e.g. timed out), so it isn't taken for a search without
+    results.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def __repr__(self):
+        return f'SearchFailed({self.errors!r})'
+
+
+def get_archive_link(name_with_owner, default_branch):
+    """
+    Makes the zipball link returned by PyGithub's Repository.get_archive_link
+    without requesting it.
+    """
+    if not default_branch:
+        return f'https://api.github.com/repos/{name_with_owner}/zipball'
+    return f'https://codeload.github.com/{name_with_owner}/legacy.zip/refs/heads/{default_branch}'
+
+
+def make_repo_dict(node):
+    """Converts a Repository node to the repo format of GithubAPI._fetch_repos."""
+    owner = node['owner']
+    default_branch = node['defaultBranchRef']['name'] if node['defaultBranchRef'] else None
+    return {
+        'url': node['url'],
+        'name': node['name'],
+        'description': node['description'],
+        'downloadLink': get_archive_link(node['nameWithOwner'], default_branch),
+        'author': {
+            'name': owner['login'],
+            # REST returns '' for no blog, and None for no bio or twitter.
+            'blogURL': owner.get('websiteUrl') or '',
+            'bio': owner.get('bio', owner.get('description')) or None,
+            'url': owner['url'],
+            'twitter': owner.get('twitterUsername') or None
+        }
+    }
+
+
+class GithubGraphQL():
+    def __init__(self, token=None, url='https://api.github.com/graphql', timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers.update({'Authorization': f'bearer {token}'})
+
+    def make_search_query(self, terms, n_repo_results):
+        searches = []
+        for index, term in enumerate(terms):
+            query = json.dumps(f'{term} in:name')
+            searches.append(
+                f't{index}: search(query: {query}, type: REPOSITORY, first: {n_repo_results}) '
+                '{ nodes { ...RepoFields } }')
+        return 'query {\n' + '\n'.join(searches) + '\n}\n' + REPO_FIELDS
+
+    def search_repos(self, terms, n_repo_results, token=None, on_headers=None):
+        """
+        Searches repos with each term in their name.
+
+        Returns a list of repo lists (see GithubAPI._fetch_repos) in the same
+        order as terms, with a SearchFailed for terms whose search failed (an
+        error with the term's alias in its path, or no data for the alias).
+        Raises GraphQLRateLimitError.
+
+        token (optional) is used instead of the session's token, and 
+        on_headers (optional) is called with the response headers (for
+        TokenPool.update_from_headers).
+        """
+        if not terms:
+            return []
+        query = self.make_search_query(terms, n_repo_results)
+        headers = {'Authorization': f'bearer {token}'} if token else None
+        r = self.session.post(
+            self.url, json={'query': query}, headers=headers, timeout=self.timeout)
+        GITHUB_CALLS.inc(kind='graphql')
+        if on_headers:
+            on_headers(r.headers)
+        if r.status_code in (403, 429) and 'rate limit' in r.text.lower():
+            raise GraphQLRateLimitError(r.text, headers=r.headers)
+        r.raise_for_status()
+        response = r.json()
+        errors = response.get('errors') or []
+        if any(error.get('type') == 'RATE_LIMITED' for error in errors):
+            raise GraphQLRateLimitError(errors, headers=r.headers)
+        if not response.get('data'):
+            raise requests.HTTPError(errors, response=r)
+        # {alias: errors}
+        alias_errors = {}
+        for error in errors:
+            path = error.get('path') or [None]
+            alias_errors.setdefault(path[0], []).append(error)
+        results = []
+        for index in range(len(terms)):
+            alias = f't{index}'
+            search = response['data'].get(alias)
+            if alias in alias_errors or search is None:
+                results.append(SearchFailed(
+                    alias_errors.get(alias) or alias_errors.get(None)))
+                continue
+            results.append([make_repo_dict(node)
+                           for node in search['nodes'] if node])
+        return results
@@ -0,0 +1,198 @@
+"""
+Shares GitHub API quota between callers.
+
+A TokenPool holds one or more tokens and tracks each token's remaining calls
+and reset time per rate limit resource ('search', 'core', 'graphql') from
+response headers. Calls go to the token with the most remaining quota, calls
+wait for a reset (up to max_wait) instead of failing when every token is out,
+and interactive calls (term searches) are served before background calls
+(watchlist refreshes), which also leave background_reserve calls of each
+resource for interactive use. Each call should only use the resource it
+acquired (GithubAPI acquires 'search' for searches and 'core' for the lookups
+that follow them).
+
+Quota is tracked by each process (gunicorn worker) separately. Remaining
+calls come from GitHub's response headers, which count every process's calls,
+so each process's counts are at most one response behind the others, and the
+background reserve is kept across processes. The priority queue only orders
+calls within a process: an interactive call in one worker doesn't wait ahead
+of the watchlist refresher running in another one, but the refresher stops at
+the reserve.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from github import Github
+from github import RateLimitExceededException
+
+from github_graphql import GraphQLRateLimitError
+
+INTERACTIVE, BACKGROUND = 0, 1
+
+
+class QuotaExhausted(Exception):
+    """Raised when no token has quota for a resource within max_wait."""
+    pass
+
+
+class GithubToken():
+    def __init__(self, token, base_url=None):
+        self.token = token
+        self.client = Github(token, base_url=base_url) if base_url else Github(token)
+        # {resource: [remaining (None if unknown), reset time]}
+        self.quota = {}
+
+    def remaining(self, resource):
+        remaining, reset = self.quota.get(resource, (None, 0))
+        if remaining is not None and reset and time.time() >= reset:
+            self.quota.pop(resource)
+            return None
+        return remaining
+
+
+class TokenPool():
+    """
+    Parameters
+    ----------
+    tokens : str or list of str
+    max_wait : float, default 60
+        Seconds an interactive call waits for quota before QuotaExhausted is
+        raised.
+    background_max_wait : float, default 3600
+        Same for background calls.
+    background_reserve : dict, optional
+        {resource: calls} left for interactive calls. Defaults to 10 search,
+        500 core and 500 graphql calls per token.
+    base_url : str, optional
+        REST API URL for the tokens' clients, instead of 
+        https://api.github.com (e.g. a stand-in server, see 
+        benchmarks/github_standin.py).
+    """
+
+    def __init__(self,
+                 tokens,
+                 max_wait=60,
+                 background_max_wait=3600,
+                 background_reserve=None,
+                 base_url=None):
+        if isinstance(tokens, str):
+            tokens = [tokens]
+        self.tokens = [GithubToken(token, base_url=base_url)
+                       for token in tokens]
+        self.max_wait = {INTERACTIVE: max_wait,
+                         BACKGROUND: background_max_wait}
+        self.background_reserve = {'search': 10, 'core': 500, 'graphql': 500}
+        self.background_reserve.update(background_reserve or {})
+        self.cond = threading.Condition()
+        self.counter = itertools.count()
+        # {resource: heap of (priority, arrival) for waiting calls}
+        self.waiting = {}
+
+    def acquire(self, resource, priority=INTERACTIVE):
+        """
+        Returns a GithubToken with quota for resource, waiting (behind calls
+        with higher priority, then earlier calls) until one has quota. Raises
+        QuotaExhausted.
+        """
+        deadline = time.monotonic() + self.max_wait[priority]
+        ticket = (priority, next(self.counter))
+        with self.cond:
+            waiting = self.waiting.setdefault(resource, [])
+            heapq.heappush(waiting, ticket)
+            try:
+                while True:
+                    if waiting[0] == ticket:
+                        token = self._pick(resource, priority)
+                        if token:
+                            remaining = token.remaining(resource)
+                            if remaining is not None:
+                                token.quota[resource][0] = remaining - 1
+                            return token
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise QuotaExhausted(
+                            f'No GitHub {resource} quota for {self.max_wait[priority]} seconds.')
+                    self.cond.wait(min(timeout, self._next_reset(resource)))
+            finally:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                self.cond.notify_all()
+
+    def call(self, resource, func, priority=INTERACTIVE):
+        """
+        Returns func(token) for a token from acquire. If func hits the rate
+        limit, the token is marked as exhausted for the resource named in the
+        response's X-RateLimit-Resource header (resource if there's none). If
+        that's resource, func is retried with another token, or after the
+        reset. Otherwise func used quota it didn't acquire, and the exception
+        is raised, since retrying wouldn't help.
+        """
+        while True:
+            token = self.acquire(resource, priority)
+            try:
+                return func(token)
+            except (RateLimitExceededException, GraphQLRateLimitError) as ex:
+                exhausted = self.update_from_headers(
+                    token, getattr(ex, 'headers', None) or {}, resource=resource,
+                    exhausted=True)
+                if exhausted != resource:
+                    raise
+
+    def update(self, token, resource, remaining, reset):
+        with self.cond:
+            token.quota[resource] = [remaining, reset]
+            self.cond.notify_all()
+
+    def update_from_headers(self, token, headers, resource=None, exhausted=False):
+        """
+        Updates quota from X-RateLimit-* (and Retry-After) response headers.
+        Returns the resource (from X-RateLimit-Resource, or resource).
+        """
+        headers = {key.lower(): value for key, value in headers.items()}
+        resource = headers.get('x-ratelimit-resource', resource)
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if exhausted:
+            remaining = 0
+            if 'retry-after' in headers:
+                # Secondary rate limit.
+                reset = time.time() + float(headers['retry-after'])
+            elif not reset:
+                reset = time.time() + 60
+        if resource and remaining is not None and reset:
+            self.update(token, resource, int(float(remaining)), float(reset))
+        return resource
+
+    def update_from_client(self, token, resource):
+        """
+        Updates quota from token's PyGithub client, which keeps the rate limit
+        headers of its last response. Call right after a call to resource (the
+        last response could be another thread's, but the next one corrects it).
+        """
+        remaining, _ = token.client.rate_limiting
+        reset = token.client.rate_limiting_resettime
+        if remaining >= 0 and reset:
+            self.update(token, resource, remaining, reset)
+
+    def _pick(self, resource, priority):
+        """Token with the most quota left for resource, or None."""
+        reserve = self.background_reserve.get(
+            resource, 0) if priority == BACKGROUND else 0
+        best, best_remaining = None, None
+        for token in self.tokens:
+            remaining = token.remaining(resource)
+            if remaining is None:
+                return token
+            if remaining > reserve and (best is None or remaining > best_remaining):
+                best, best_remaining = token, remaining
+        return best
+
+    def _next_reset(self, resource):
+        """Seconds until a token's quota for resource resets (at most 5)."""
+        resets = [token.quota[resource][1] for token in self.tokens
+                  if resource in token.quota]
+        if not resets:
+            return 5
+        return min(max(min(resets) - time.time(), .1), 5)
@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for serving server.py in production:
+
+    gunicorn -c gunicorn.conf.py server:app
+
+The app is loaded once in the master process (preload_app), so Flair, RoSTER,
+the relevance classifier and the post set classifier are loaded once, and
+workers are forked from it, sharing model weights copy-on-write. Settings are
+in "serving" in server_config.jsonc.
+"""
+import os
+import sys
+
+from config import load_config
+from metrics import clear_metrics_dir
+
+SERVING = load_config().get('serving', {})
+
+# Workers keep metrics in files in metrics_dir, so a /metrics scrape shows all
+# of them (see metrics.py). Set before the app is loaded (metrics picks its
+# store when a value is first recorded), and emptied on start.
+METRICS_DIR = os.environ.setdefault(
+    'TOOL_FETCHER_METRICS_DIR', SERVING.get('metrics_dir', 'data/metrics'))
+clear_metrics_dir(METRICS_DIR)
+
+bind = SERVING.get('bind', '127.0.0.1:5000')
+workers = SERVING.get('workers', 2)
+threads = SERVING.get('threads', 4)
+worker_class = 'gthread'
+timeout = SERVING.get('timeout', 300)
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Intra-op threads per worker, so workers don't oversubscribe the CPU.
+    import torch
+    torch.set_num_threads(SERVING.get('torch_threads', 1))
+    # Each worker runs jobs (they're claimed from a shared store) and a
+    # watchlist refresher (one worker at a time refreshes, see
+    # WatchlistRefresher). No threads are started in the master, so workers
+    # aren't forked with locks held by its threads.
+    sys.modules['server'].start_worker_tasks()
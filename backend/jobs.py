@@ -0,0 +1,290 @@
+"""
+Background jobs for requests that take too long to answer in one HTTP request
+(e.g. finding terms in, highlighting and searching a 300-page PDF).
+
+Jobs are stored in SQLite (inputs and results in a directory per job), so any
+process can report a job's status and jobs survive restarts: a job whose
+worker stops sending heartbeats is run again by another runner.
+"""
+from contextlib import contextmanager
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+
+class JobStore():
+    """
+    Parameters
+    ----------
+    path : str
+        Path to SQLite database (created if it doesn't exist).
+    jobs_dir : str
+        Directory for job inputs and results.
+    """
+
+    def __init__(self, path, jobs_dir):
+        self.path = path
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn, self._pid = None, None
+        self.lock = threading.RLock()
+        with self.transaction():
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT,
+                status TEXT,
+                created REAL,
+                updated REAL,
+                owner TEXT,
+                heartbeat REAL,
+                attempts INTEGER,
+                progress TEXT,
+                error TEXT)''')
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS jobs_status
+                ON jobs (status, created)''')
+
+    @property
+    def conn(self):
+        # SQLite connections can't be shared with forked processes (gunicorn
+        # workers), so each process opens its own.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def create(self, type_, data):
+        """Adds a queued job with input data (bytes). Returns its id."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        with open(os.path.join(self.job_dir(job_id), 'input'), 'wb') as f:
+            f.write(data)
+        now = time.time()
+        with self.transaction():
+            self.conn.execute(
+                'INSERT INTO jobs VALUES (?, ?, ?, ?, ?, NULL, NULL, 0, ?, NULL)',
+                (job_id, type_, 'queued', now, now, json.dumps({})))
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns {'id', 'type', 'status', 'progress', 'error'} or None. status is
+        'queued', 'running', 'done' or 'failed'.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT id, type, status, progress, error FROM jobs WHERE id = ?',
+                (job_id,)).fetchone()
+        if not row:
+            return None
+        return {'id': row[0], 'type': row[1], 'status': row[2],
+                'progress': json.loads(row[3]), 'error': row[4]}
+
+    def claim(self, owner, stale_after, max_attempts):
+        """
+        Marks the oldest queued job (or running job without a heartbeat for
+        stale_after seconds) as running for owner and returns it, or None.
+        Stale jobs that already ran max_attempts times are failed instead.
+        """
+        now = time.time()
+        with self.transaction():
+            stale = self.conn.execute('''SELECT id FROM jobs
+                WHERE status = 'running' AND heartbeat < ? AND attempts >= ?''',
+                                      (now - stale_after, max_attempts)).fetchall()
+            for (job_id,) in stale:
+                self._set_status(job_id, 'failed',
+                                 error='Job stopped while running.')
+            row = self.conn.execute('''SELECT id FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?)
+                ORDER BY created LIMIT 1''', (now - stale_after,)).fetchone()
+            if not row:
+                return None
+            self.conn.execute('''UPDATE jobs SET status = 'running', owner = ?,
+                heartbeat = ?, updated = ?, attempts = attempts + 1 WHERE id = ?''',
+                              (owner, now, now, row[0]))
+        return self.get(row[0])
+
+    def heartbeat(self, job_ids):
+        with self.transaction():
+            self.conn.executemany('UPDATE jobs SET heartbeat = ? WHERE id = ?',
+                                  [(time.time(), job_id) for job_id in job_ids])
+
+    def set_progress(self, job_id, progress):
+        with self.transaction():
+            self.conn.execute('UPDATE jobs SET progress = ?, updated = ? WHERE id = ?',
+                              (json.dumps(progress), time.time(), job_id))
+
+    def finish(self, job_id, result):
+        """Saves result (JSON-serializable) and marks the job done."""
+        path = os.path.join(self.job_dir(job_id), 'result.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as w:
+            w.write(json.dumps(result))
+        os.replace(path + '.tmp', path)
+        with self.transaction():
+            self._set_status(job_id, 'done')
+
+    def fail(self, job_id, error):
+        with self.transaction():
+            self._set_status(job_id, 'failed', error=error)
+
+    def read_input(self, job_id):
+        with open(os.path.join(self.job_dir(job_id), 'input'), 'rb') as f:
+            return f.read()
+
+    def read_result(self, job_id):
+        with open(os.path.join(self.job_dir(job_id), 'result.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def delete_finished(self, older_than):
+        """Deletes done and failed jobs not updated for older_than seconds."""
+        with self.transaction():
+            rows = self.conn.execute('''SELECT id FROM jobs
+                WHERE status IN ('done', 'failed') AND updated < ?''',
+                                     (time.time() - older_than,)).fetchall()
+            self.conn.executemany(
+                'DELETE FROM jobs WHERE id = ?', rows)
+        for (job_id,) in rows:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def _set_status(self, job_id, status, error=None):
+        self.conn.execute('UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?',
+                          (status, error, time.time(), job_id))
+
+
+class JobRunner():
+    """
+    Runs jobs from a JobStore on worker threads. Several processes can each run
+    a JobRunner on the same store; each job is claimed by one of them.
+
+    Parameters
+    ----------
+    store : JobStore
+    handlers : dict
+        {job type: function}. Functions take (input data, report) and return
+        the result (JSON-serializable). report(**updates) updates the job's
+        progress (a dictionary).
+    workers : int, default 1
+        Jobs run at once by this runner.
+    poll_interval : float, default 2
+        Seconds between checks for queued jobs.
+    stale_after : float, default 120
+        Seconds without a heartbeat after which a running job is run again
+        (its runner is assumed to have stopped).
+    max_attempts : int, default 2
+        Runs of a job before it's failed.
+    keep_for : float, default 86400
+        Seconds finished jobs are kept.
+    """
+
+    def __init__(self,
+                 store,
+                 handlers,
+                 workers=1,
+                 poll_interval=2,
+                 stale_after=120,
+                 max_attempts=2,
+                 keep_for=86400):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.keep_for = keep_for
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.threads = []
+
+    def start(self):
+        if any(thread.is_alive() for thread in self.threads):
+            return
+        self.stop_event.clear()
+        self.threads = [threading.Thread(target=self.run_worker, name=f'job-worker-{i}', daemon=True)
+                        for i in range(self.workers)]
+        self.threads.append(threading.Thread(
+            target=self.run_heartbeat, name='job-heartbeat', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def submit(self, type_, data):
+        """Queues a job and returns its id."""
+        job_id = self.store.create(type_, data)
+        self.wake_event.set()
+        return job_id
+
+    def run_worker(self):
+        owner = f'{os.getpid()}-{threading.get_ident()}'
+        while not self.stop_event.is_set():
+            try:
+                job = self.store.claim(
+                    owner, self.stale_after, self.max_attempts)
+            except sqlite3.Error as ex:
+                print(f'Claiming job failed: {ex!r}')
+                job = None
+            if not job:
+                self.wake_event.wait(self.poll_interval)
+                self.wake_event.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        job_id = job['id']
+        with self.lock:
+            self.running.add(job_id)
+        progress = {}
+        try:
+            def report(**updates):
+                progress.update(updates)
+                self.store.set_progress(job_id, progress)
+
+            result = self.handlers[job['type']](
+                self.store.read_input(job_id), report)
+            self.store.finish(job_id, result)
+        except Exception as ex:
+            traceback.print_exc()
+            self.store.fail(job_id, repr(ex))
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+
+    def run_heartbeat(self):
+        last_cleanup = 0
+        while not self.stop_event.wait(self.stale_after / 4):
+            try:
+                with self.lock:
+                    running = list(self.running)
+                if running:
+                    self.store.heartbeat(running)
+                if time.time() - last_cleanup > 3600:
+                    self.store.delete_finished(self.keep_for)
+                    last_cleanup = time.time()
+            except sqlite3.Error as ex:
+                print(f'Job heartbeat failed: {ex!r}')
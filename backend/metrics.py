@@ -0,0 +1,305 @@
+"""
+Counters and histograms for the server pipeline, rendered in the Prometheus
+text format on the /metrics endpoint of server.py.
+
+Values are kept in memory, or, if the TOOL_FETCHER_METRICS_DIR environment
+variable is set (by gunicorn.conf.py), in a file per process in that
+directory (see MmapStore), and a scrape sums the files of every process, so
+it shows all gunicorn workers (including ones that have exited, so counters
+don't go down when a worker is replaced).
+"""
+from contextlib import contextmanager
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 25, 50, 100)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if type(value) == float else str(value)
+
+
+class MemoryStore():
+    """Values of this process, by key."""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, key, amount):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def read(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class MmapStore():
+    """
+    Values of each process in a memory-mapped file in directory
+    (<pid>.metrics), read by every process to render.
+
+    Files are a used byte count (8 bytes), then entries of a key length (4
+    bytes), the key (JSON, padded to 8 bytes) and a float value (8 bytes).
+    Entries are only appended and the used count is written after the entry,
+    so readers always see complete entries.
+    """
+
+    def __init__(self, directory, initial_size=1 << 20):
+        self.directory = directory
+        self.initial_size = initial_size
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def open(self):
+        # Forked processes (gunicorn workers) get their own file.
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = open(os.path.join(
+            self.directory, f'{os.getpid()}.metrics'), 'a+b')
+        size = max(os.fstat(self.file.fileno()).st_size, self.initial_size)
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        # {key: offset of value}
+        self.offsets = {}
+        self.used = 8
+        for key, offset in self.parse(self.map):
+            self.offsets[key] = offset
+            self.used = offset + 8
+        self.pid = os.getpid()
+
+    @staticmethod
+    def parse(data):
+        """Yields (key, offset of value) of the entries in data."""
+        used = struct.unpack_from('<Q', data, 0)[0]
+        position = 8
+        while position < used:
+            key_length = struct.unpack_from('<I', data, position)[0]
+            key = bytes(data[position + 4:position + 4 + key_length]).decode('utf-8')
+            position += 4 + key_length + (-(4 + key_length) % 8)
+            yield key, position
+            position += 8
+
+    def inc(self, key, amount):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self.add(key)
+            value = struct.unpack_from('<d', self.map, offset)[0]
+            struct.pack_into('<d', self.map, offset, value + amount)
+
+    def add(self, key):
+        encoded = key.encode('utf-8')
+        padding = -(4 + len(encoded)) % 8
+        end = self.used + 4 + len(encoded) + padding + 8
+        if end > len(self.map):
+            size = len(self.map)
+            while size < end:
+                size *= 2
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+        struct.pack_into(f'<I{len(encoded)}s{padding}xd', self.map, self.used,
+                         len(encoded), encoded, 0)
+        offset = end - 8
+        self.offsets[key] = offset
+        self.used = end
+        struct.pack_into('<Q', self.map, 0, self.used)
+        return offset
+
+    def read(self):
+        """Values summed over every process's file."""
+        values = {}
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if not name.endswith('.metrics'):
+                continue
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+            if len(data) < 8:
+                continue
+            for key, offset in self.parse(data):
+                values[key] = values.get(key, 0) + \
+                    struct.unpack_from('<d', data, offset)[0]
+        return values
+
+
+def clear_metrics_dir(directory):
+    """Deletes the files of MmapStore (call once, before workers start)."""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.metrics'):
+                os.remove(os.path.join(directory, name))
+
+
+class Registry():
+    """
+    Parameters
+    ----------
+    store : MemoryStore or MmapStore, optional
+        Defaults to an MmapStore in TOOL_FETCHER_METRICS_DIR if it's set,
+        otherwise a MemoryStore. The default is picked when a value is first
+        recorded or rendered, not on import, so gunicorn.conf.py can set the
+        variable after metrics is imported.
+    """
+
+    def __init__(self, store=None):
+        self.metrics = []
+        self._store = store
+        self.lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self.lock:
+                if self._store is None:
+                    directory = os.environ.get('TOOL_FETCHER_METRICS_DIR')
+                    self._store = MmapStore(
+                        directory) if directory else MemoryStore()
+        return self._store
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        # {metric name: {(sample, label values, le): value}}
+        samples = {}
+        for key, value in self.store.read().items():
+            name, sample, label_values, le = json.loads(key)
+            samples.setdefault(name, {})[
+                (sample, tuple(label_values), le)] = value
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type_}')
+            lines.extend(metric.render(samples.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def make_key(name, sample, label_values, le=None):
+    return json.dumps([name, sample, list(label_values), le])
+
+
+class Counter():
+    type_ = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        self.registry.store.inc(make_key(self.name, '', label_values), amount)
+
+    def render(self, samples):
+        """samples: {(sample, label values, le): value} of this metric."""
+        # Values read from MmapStore files are floats.
+        return [f'{self.name}{format_labels(zip(self.labelnames, label_values))} '
+                f'{format_value(int(value) if float(value).is_integer() else value)}'
+                for (_, label_values, _), value in sorted(samples.items())]
+
+
+class Histogram():
+    type_ = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.registry = registry
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        store = self.registry.store
+        for bound in self.buckets:
+            if value <= bound:
+                store.inc(make_key(self.name, 'bucket', label_values,
+                                   format_value(bound)), 1)
+        store.inc(make_key(self.name, 'sum', label_values), value)
+        store.inc(make_key(self.name, 'count', label_values), 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, samples):
+        """samples: {(sample, label values, le): value} of this metric."""
+        lines = []
+        for label_values in sorted({label_values for _, label_values, _ in samples}):
+            labels = list(zip(self.labelnames, label_values))
+            for bound in self.buckets:
+                bound = format_value(bound)
+                bucket_count = samples.get(('bucket', label_values, bound), 0)
+                lines.append(
+                    f'{self.name}_bucket{format_labels(labels, [("le", bound)])} {format_value(int(bucket_count))}')
+            total = samples.get(('sum', label_values, None), 0)
+            count = samples.get(('count', label_values, None), 0)
+            lines.append(
+                f'{self.name}_sum{format_labels(labels)} {format_value(float(total))}')
+            lines.append(
+                f'{self.name}_count{format_labels(labels)} {format_value(int(count))}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'tool_fetcher_request_seconds',
+    'Time to handle /home requests, by request type.',
+    ['type'])
+STAGE_SECONDS = Histogram(
+    'tool_fetcher_stage_seconds',
+    'Time spent in each stage of the pipeline.',
+    ['stage'])
+DOC_SENTENCES = Histogram(
+    'tool_fetcher_document_sentences',
+    'Sentences per document sent to the term extractors.',
+    buckets=COUNT_BUCKETS)
+DOC_TERMS = Histogram(
+    'tool_fetcher_document_terms',
+    'Terms found per document.',
+    buckets=COUNT_BUCKETS)
+GITHUB_CALLS = Counter(
+    'tool_fetcher_github_calls_total',
+    'GitHub API calls, by kind.',
+    ['kind'])
+CACHE_LOOKUPS = Counter(
+    'tool_fetcher_cache_lookups_total',
+    'Cache lookups, by cache and result (fresh, stale, miss or coalesced).',
+    ['cache', 'result'])
+
+
+def time_stage(stage):
+    """Context manager that records the time spent in stage."""
+    return STAGE_SECONDS.time(stage=stage)
@@ -0,0 +1,240 @@
+"""
+Fetches web pages with a shared, pooled session.
+
+Requests have connect/read timeouts, an overall deadline and a maximum body
+size (the body is streamed, so a slow or huge page is abandoned instead of
+tying up the thread), failed connections and 429/5xx responses are retried
+with backoff (within the deadline), and concurrent requests to the same host
+are limited.
+"""
+from contextlib import contextmanager
+import socket
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36')
+
+
+class PageTooLarge(requests.RequestException):
+    pass
+
+
+class PageFetcher():
+    """
+    Parameters
+    ----------
+    connect_timeout : float, default 5
+        Seconds to wait for a connection.
+    read_timeout : float, default 10
+        Seconds to wait between bytes from the server.
+    deadline : float, default 20
+        Seconds for the whole request, including retries, redirects and
+        reading the body.
+    max_bytes : int, default 5 MB
+        Pages larger than this (after decompression) aren't read.
+    retries : int, default 2
+        Retries for connection errors, timeouts and 429/5xx responses, as
+        long as the deadline allows.
+    backoff_factor : float, default .5
+        Retries wait backoff_factor * 2 ** (retry - 1) seconds (or the
+        Retry-After header).
+    max_per_host : int, default 4
+        Concurrent requests to one host.
+    pool_maxsize : int, default 32
+        Keep-alive connections per host kept in the pool.
+    user_agent : str, optional
+    """
+
+    def __init__(self,
+                 connect_timeout=5,
+                 read_timeout=10,
+                 deadline=20,
+                 max_bytes=5 << 20,
+                 retries=2,
+                 backoff_factor=.5,
+                 max_per_host=4,
+                 pool_maxsize=32,
+                 user_agent=DEFAULT_USER_AGENT):
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_per_host = max_per_host
+
+        # Retries are made by get, which fits them in the deadline (urllib3's
+        # would give every attempt the full timeouts).
+        adapter = HTTPAdapter(pool_connections=pool_maxsize,
+                              pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept-Language': 'en-US,en;q=0.9'
+        })
+
+        self.lock = threading.Lock()
+        self.host_semaphores = {}
+
+    @contextmanager
+    def host_slot(self, url):
+        """Limits concurrent requests to url's host to max_per_host."""
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self.lock:
+            semaphore = self.host_semaphores.setdefault(
+                host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+    def fetch(self, url):
+        """
+        Returns the page at url (str).
+
+        Raises requests.Timeout if the deadline passes, PageTooLarge if the page
+        is larger than max_bytes, requests.HTTPError for error statuses, and
+        other requests.RequestExceptions for connection errors.
+        """
+        start = time.monotonic()
+        with self.host_slot(url), self.get(url, start) as r:
+            r.raise_for_status()
+            content_length = r.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and \
+                    int(content_length) > self.max_bytes:
+                raise PageTooLarge(f'{url} is {content_length} bytes.')
+            # Reads only time out between bytes, so a server sending a byte
+            # at a time could hold the thread long past the deadline. The
+            # watchdog shuts the connection down when the deadline passes,
+            # which ends a blocked read.
+            expired = threading.Event()
+            watchdog = threading.Timer(
+                max(self.deadline - (time.monotonic() - start), 0),
+                self.expire, args=(r, expired))
+            watchdog.daemon = True
+            watchdog.start()
+            chunks, size = [], 0
+            try:
+                # Decompresses gzip/deflate, so max_bytes applies to the page.
+                for chunk in r.iter_content(chunk_size=65536):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PageTooLarge(
+                            f'{url} is over {self.max_bytes} bytes.')
+                    chunks.append(chunk)
+            except Exception:
+                # Closing the response mid-read can fail the read in several
+                # ways (OSError, ValueError, AttributeError in http.client).
+                if not expired.is_set():
+                    raise
+            finally:
+                watchdog.cancel()
+            if expired.is_set():
+                raise requests.Timeout(
+                    f'{url} took over {self.deadline} seconds.')
+            content = b''.join(chunks)
+            encoding = r.encoding
+            if not encoding or (encoding.lower() == 'iso-8859-1' and
+                                'charset' not in r.headers.get('Content-Type', '').lower()):
+                encoding = r.apparent_encoding or 'utf-8'
+        try:
+            return content.decode(encoding, errors='replace')
+        except LookupError:
+            return content.decode('utf-8', errors='replace')
+
+    def get(self, url, start):
+        """
+        Streamed GET of url, retried on connection errors, timeouts and
+        RETRY_STATUSES. Each attempt's timeouts and each wait are capped by the
+        time left before start + deadline, and redirects stop at the deadline.
+        Raises requests.Timeout if the deadline passes.
+        """
+        def time_left():
+            left = self.deadline - (time.monotonic() - start)
+            if left <= 0:
+                raise requests.Timeout(
+                    f'{url} took over {self.deadline} seconds.')
+            return left
+
+        def check_deadline(response, *args, **kwargs):
+            # Called for each response, including redirects.
+            if time.monotonic() - start >= self.deadline:
+                response.close()
+                time_left()
+
+        attempt = 0
+        while True:
+            left = time_left()
+            timeout = (min(self.timeout[0], left), min(self.timeout[1], left))
+            try:
+                r = self.session.get(url, timeout=timeout, stream=True,
+                                     hooks={'response': check_deadline})
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff(attempt)
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return r
+                wait = self.backoff(attempt, r.headers.get('Retry-After'))
+                if wait >= self.deadline - (time.monotonic() - start):
+                    # No time to retry, so the caller gets the error status.
+                    return r
+                r.close()
+            time.sleep(max(min(wait, self.deadline - (time.monotonic() - start)), 0))
+            attempt += 1
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retrying after attempt (0 for the first)."""
+        if retry_after:
+            try:
+                return Retry(0).parse_retry_after(retry_after)
+            except InvalidHeader:
+                pass
+        return self.backoff_factor * 2 ** attempt
+
+    @staticmethod
+    def expire(response, expired):
+        """Ends a streamed response's reads (see fetch)."""
+        expired.set()
+        sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+        if sock is None:
+            # The connection lets go of its socket when the server closes it
+            # after the response (HTTP/1.0, Connection: close), but the body
+            # is still read from it.
+            fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+            sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
+    def get_html(self, url):
+        """Same as fetch, but returns None if the page can't be fetched."""
+        try:
+            return self.fetch(url)
+        except requests.RequestException:
+            return None
+
+
+DEFAULT_FETCHER = None
+
+
+def default_fetcher():
+    """PageFetcher with default settings, for callers that aren't given one."""
+    global DEFAULT_FETCHER
+    if DEFAULT_FETCHER is None:
+        DEFAULT_FETCHER = PageFetcher()
+    return DEFAULT_FETCHER
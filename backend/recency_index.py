@@ -0,0 +1,136 @@
+"""
+Keeps the posts and repos of watchlist authors sorted by date, so the most
+recent ones (the Recent panel in the extension) can be served without going
+through the whole watchlist.
+"""
+import bisect
+
+
+def get_author_props(author, info):
+    return {
+        'name': author,
+        'url': info['url'],
+        'blogURL': info['blogURL'],
+        'twitter': info['twitter']
+    }
+
+
+def get_post_index_dicts(author, info):
+    """Index dicts for author's posts with dates (see RecencyIndex.get_recent)."""
+    index_dicts = []
+    try:
+        for index, post_dict in enumerate(info['recentBlog']['posts']):
+            if post_dict['date']:
+                index_dicts.append({'date': post_dict['date'],
+                                    'author': get_author_props(author, info),
+                                    'index': index})
+    except KeyError:
+        pass
+    return index_dicts
+
+
+def get_repo_index_dicts(author, info):
+    index_dicts = []
+    try:
+        for index, repo in enumerate(info['recentRepos']):
+            if type(repo) == dict:
+                index_dicts.append({'date': repo['pushed_at'],
+                                    'author': get_author_props(author, info),
+                                    'index': index})
+    except KeyError:
+        pass
+    return index_dicts
+
+
+class RecencyIndex():
+    """
+    Posts and repos are kept in lists sorted by (date, -author position,
+    -index), so the end of each list, read backwards, is newest first, with
+    ties in watchlist order. Adding, updating or removing an author only
+    touches that author's entries, and get_recent is O(n_recent).
+
+    Parameters
+    ----------
+    n_recent : int
+        Number of posts and repos returned by get_recent.
+    watchlist : dict, optional
+        {author: author_info}, in watchlist order.
+    """
+
+    def __init__(self, n_recent, watchlist=None):
+        self.n_recent = n_recent
+        self.rebuild(watchlist or {})
+
+    def rebuild(self, watchlist):
+        self.entries = {'posts': [], 'repos': []}
+        # {author: {'posts': keys, 'repos': keys}}
+        self.author_keys = {}
+        # Position of each author in the watchlist (for ties).
+        self.author_positions = {}
+        self.next_position = 0
+        for author, info in watchlist.items():
+            self.set_author(author, info)
+
+    def set_author(self, author, info):
+        """Adds author, or replaces their entries (keeping their position)."""
+        if author not in self.author_positions:
+            self.author_positions[author] = self.next_position
+            self.next_position += 1
+        self._remove_entries(author)
+        position = self.author_positions[author]
+        self.author_keys[author] = {}
+        for kind, index_dicts in (('posts', get_post_index_dicts(author, info)),
+                                  ('repos', get_repo_index_dicts(author, info))):
+            keys = []
+            for index_dict in index_dicts:
+                key = (index_dict['date'], -position, -index_dict['index'])
+                bisect.insort(self.entries[kind], (key, index_dict))
+                keys.append(key)
+            self.author_keys[author][kind] = keys
+
+    def remove_author(self, author):
+        self._remove_entries(author)
+        self.author_keys.pop(author, None)
+        self.author_positions.pop(author, None)
+
+    def clear(self):
+        self.rebuild({})
+
+    def recent(self, kind):
+        """Newest n_recent index dicts of kind ('posts' or 'repos')."""
+        entries = self.entries[kind]
+        return [index_dict for _, index_dict in
+                reversed(entries[max(len(entries) - self.n_recent, 0):])]
+
+    def get_recent(self, author_to_match=None):
+        """
+        Returns {'recentPostIndices': [...], 'recentRepoIndices': [...]}, the
+        newest n_recent posts and repos as:
+
+            {
+            'date': date (str),
+            'author': {'name', 'url', 'blogURL', 'twitter'},
+            'index': index of post in watchlist[author]['recentBlog']['posts']
+                or of repo in watchlist[author]['recentRepos'] (int)
+            }
+
+        If author_to_match is given, each list is only returned (otherwise it's
+        empty) if it includes that author.
+        """
+        recent = {'recentPostIndices': self.recent('posts'),
+                  'recentRepoIndices': self.recent('repos')}
+        if author_to_match:
+            for key, index_dicts in recent.items():
+                if not any(index_dict['author']['name'] == author_to_match
+                           for index_dict in index_dicts):
+                    recent[key] = []
+        return recent
+
+    def _remove_entries(self, author):
+        keys = self.author_keys.get(author, {})
+        for kind, author_keys in keys.items():
+            entries = self.entries[kind]
+            for key in author_keys:
+                position = bisect.bisect_left(entries, (key,))
+                if position < len(entries) and entries[position][0] == key:
+                    del entries[position]
@@ -0,0 +1,163 @@
+"""
+Classifies repo descriptions as relevant or not (used to sort and filter term
+results by relevance).
+
+Backends:
+    'zero-shot': a zero-shot classification pipeline (an NLI model scores each
+        description against each label).
+    'embedding': cosine similarity between sentence embeddings of the
+        description and of each label (one forward pass per description
+        instead of one per description and label, and a much smaller model).
+
+All descriptions in a request are classified in one batched call, and results
+can be cached by description.
+"""
+import hashlib
+import json
+
+import numpy as np
+from transformers import AutoModel, AutoTokenizer, pipeline
+
+from sqlite_cache import SQLiteCache
+
+
+class ZeroShotBackend():
+    def __init__(self, model, labels, task='zero-shot-classification', batch_size=16):
+        self.classifier = pipeline(task, model)
+        self.labels = labels
+        self.batch_size = batch_size
+
+    def scores(self, texts):
+        """Returns a list of {label: score} for texts."""
+        results = self.classifier(
+            texts, self.labels, batch_size=self.batch_size)
+        if isinstance(results, dict):
+            results = [results]
+        return [dict(zip(result['labels'], result['scores'])) for result in results]
+
+
+class EmbeddingBackend():
+    """
+    Scores are the softmax of the cosine similarities (divided by temperature)
+    between the text and each label.
+    """
+
+    def __init__(self, model, labels, batch_size=32, temperature=.05, max_length=256):
+        import torch
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self.model = AutoModel.from_pretrained(model)
+        self.model.eval()
+        self.labels = labels
+        self.batch_size = batch_size
+        self.temperature = temperature
+        self.max_length = max_length
+        self.label_embeddings = self.embed(labels)
+
+    def embed(self, texts):
+        """Mean-pooled, normalized embeddings (n_texts x dim array)."""
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(texts[start:start + self.batch_size],
+                                     padding=True,
+                                     truncation=True,
+                                     max_length=self.max_length,
+                                     return_tensors='pt')
+            with self.torch.no_grad():
+                hidden = self.model(**encoded).last_hidden_state
+            mask = encoded['attention_mask'].unsqueeze(-1).float()
+            pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            pooled = self.torch.nn.functional.normalize(pooled, dim=1)
+            embeddings.append(pooled.numpy())
+        return np.concatenate(embeddings)
+
+    def scores(self, texts):
+        similarities = self.embed(texts) @ self.label_embeddings.T
+        logits = similarities / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return [dict(zip(self.labels, row.tolist())) for row in probabilities]
+
+
+class RelevanceClassifier():
+    """
+    Parameters
+    ----------
+    task : str, default 'zero-shot-classification'
+        Pipeline task for the 'zero-shot' backend.
+    model : str, default "facebook/bart-large-mnli"
+        Model for the 'zero-shot' backend.
+    label_dict : dict
+        {label text: whether the label is relevant}.
+    backend : str, default 'zero-shot'
+        'zero-shot' or 'embedding'.
+    embedding_model : str, default 'sentence-transformers/all-MiniLM-L6-v2'
+        Model for the 'embedding' backend.
+    batch_size : int, default 16
+    temperature : float, default .05
+        Softmax temperature for the 'embedding' backend.
+    cache_args : dict, optional
+        Args for SQLiteCache (see sqlite_cache.py). If given, results are
+        cached by description, backend, model and labels.
+    """
+
+    def __init__(self,
+                 task='zero-shot-classification',
+                 model="facebook/bart-large-mnli",
+                 label_dict={'cybersecurity software': True,
+                             'other software': False
+                             },
+                 backend='zero-shot',
+                 embedding_model='sentence-transformers/all-MiniLM-L6-v2',
+                 batch_size=16,
+                 temperature=.05,
+                 cache_args=None
+                 ):
+
+        self.label_dict = label_dict
+        self.labels = list(label_dict.keys())
+        if backend == 'embedding':
+            self.backend = EmbeddingBackend(
+                embedding_model, self.labels, batch_size=batch_size, temperature=temperature)
+            self.model_id = ['embedding', embedding_model, temperature]
+        else:
+            self.backend = ZeroShotBackend(
+                model, self.labels, task=task, batch_size=batch_size)
+            self.model_id = ['zero-shot', model]
+        self.cache = SQLiteCache(
+            table='relevance', **cache_args) if cache_args else None
+
+    def classify_text(self, text, print_=False):
+        result = self.classify_texts([text])[0]
+        if print_:
+            print(result)
+        return result
+
+    def classify_texts(self, texts):
+        """
+        Returns {'label': bool, 'score': float} for each text, classifying
+        texts that aren't cached in one batch.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        if self.cache:
+            results = self.cache.get_many(
+                unique_texts, self._classify, key=self._cache_key)
+        else:
+            results = self._classify(unique_texts)
+        results = dict(zip(unique_texts, results))
+        return [results[text] for text in texts]
+
+    def _classify(self, texts):
+        if not texts:
+            return []
+        results = []
+        for scores in self.backend.scores(texts):
+            label_text = max(scores, key=scores.get)
+            results.append({'label': self.label_dict[label_text],
+                            'score': scores[label_text]})
+        return results
+
+    def _cache_key(self, text):
+        return hashlib.sha256(json.dumps(
+            [self.model_id, self.label_dict, text]).encode('utf-8')).hexdigest()
@@ -1,17 +1,55 @@
 """
 Gets repo, user information from Github.
 """
+import copy
 import datetime
 import json
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from func_timeout import func_timeout, FunctionTimedOut
-from github import Github
-from github import RateLimitExceededException
-from transformers import pipeline
+from github import RateLimitExceededException, UnknownObjectException
 
 from get_posts.get_posts import get_posts
+from github_graphql import GithubGraphQL, GraphQLRateLimitError, SearchFailed
+from github_quota import BACKGROUND, INTERACTIVE, QuotaExhausted, TokenPool
+from metrics import GITHUB_CALLS, time_stage
+from recency_index import RecencyIndex
+from relevance_classifier import RelevanceClassifier
+from sqlite_cache import SQLiteCache
+
+RATE_LIMIT_EXCEPTIONS = (RateLimitExceededException,
+                         GraphQLRateLimitError, QuotaExhausted)
+RATE_LIMITED_USER_RECENT = {'recentBlog': {'error': 'Rate limit exceded.'},
+                            'recentRepos': {'error': 'Rate limit exceded.'}}
+
+
+def get_user_recent_error(user_login, ex):
+    """
+    user_recent for a user that getting recent posts/repos failed for with ex
+    (so one deleted or renamed user doesn't fail a whole watchlist update).
+    """
+    if isinstance(ex, RATE_LIMIT_EXCEPTIONS):
+        return copy.deepcopy(RATE_LIMITED_USER_RECENT)
+    if isinstance(ex, (IndexError, UnknownObjectException)):
+        # No search result or profile for the login.
+        error = 'User not found.'
+    else:
+        print(f'Getting recent posts/repos of {user_login} failed: {ex!r}')
+        error = 'Getting user failed.'
+    return {'recentBlog': {'error': error}, 'recentRepos': {'error': error}}
+
+
+def timed(func, *args):
+    """Returns (result of func(*args), seconds taken)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def format_timings(user_login, timings):
+    return f'{user_login}: ' + ', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in timings.items())
 
 
 class GithubAPI():
@@ -24,10 +62,25 @@ class GithubAPI():
                  filter_no_links=False,
                  relevance_classifier_args={},
                  sort_by_relevance=False,
-                 exclude_terms_without_relevant_repo=False
+                 exclude_terms_without_relevant_repo=False,
+                 max_workers=8,
+                 cache_args=None,
+                 backend='rest',
+                 graphql_batch_size=10,
+                 github_workers=4,
+                 blog_workers=4,
+                 quota_args={},
+                 base_url=None
                  ):
 
-        self.api = Github(token)
+        self.tokens = TokenPool(token, base_url=base_url, **quota_args)
+        self.backend = backend
+        self.graphql_batch_size = graphql_batch_size
+        if backend == 'graphql':
+            self.graphql = GithubGraphQL(
+                url=f"{base_url.rstrip('/')}/graphql") if base_url else GithubGraphQL()
+        else:
+            self.graphql = None
         self.dummy_results = dummy_results
         self.filter_no_links = filter_no_links
         self.n_recent_activity = n_recent_activity
@@ -35,11 +88,25 @@ class GithubAPI():
         self.n_repo_results = n_repo_results
         self.sort_by_relevance = sort_by_relevance
         self.exclude_terms_without_relevant_repo = exclude_terms_without_relevant_repo
+        self.max_workers = max_workers
+        self.github_workers = github_workers
+        self.blog_workers = blog_workers
+        self.relevance_classifier_args = relevance_classifier_args
         if self.sort_by_relevance or self.exclude_terms_without_relevant_repo:
             self.relevance_classifier = RelevanceClassifier(
                 **relevance_classifier_args)
         else:
             self.relevance_classifier = None
+        if cache_args:
+            self.cache = SQLiteCache(
+                table='term_repos',
+                is_negative=lambda results_dict: results_dict is not None and not results_dict.get(
+                    'repos'),
+                is_cacheable=lambda results_dict: results_dict is None or results_dict.get(
+                    'error') not in ('Rate limit exceeded', 'Search failed'),
+                **cache_args)
+        else:
+            self.cache = None
 
     def search_repos(self, terms):
         """
@@ -57,6 +124,25 @@ class GithubAPI():
             Dummy results for each term.  
         filter_no_links : bool, default False
             Excludes terms without search results. 
+        max_workers : int, default 8
+            Number of terms searched concurrently. Results keep the order of 
+            terms.
+        cache_args : dict, optional
+            Args for SQLiteCache (see sqlite_cache.py). If given, results are 
+            cached by normalized term, n_repo_results and relevance settings.
+        backend : str, default 'rest'
+            'rest' (PyGithub) or 'graphql', which searches graphql_batch_size 
+            terms per request and returns the same results.
+        token : str or list of str
+            GitHub tokens. Calls are spread over them by remaining quota.
+        quota_args : dict, optional
+            Args for TokenPool (see github_quota.py). Term searches are 
+            interactive and wait up to max_wait for quota; background user
+            refreshes wait longer and leave some quota for them.
+        base_url : str, optional
+            GitHub API URL (REST, and base_url + '/graphql' for GraphQL) 
+            instead of https://api.github.com, e.g. a stand-in server for 
+            offline benchmarks (see benchmarks/github_standin.py).
 
         Returns
         -------
@@ -153,248 +239,437 @@ class GithubAPI():
             return results
 
         terms = list(terms)
-        for index, term in enumerate(terms):
-            try:
-                results_dict = {'term': term, 'repos': [], 'relevance': 0}
-                repos = self.api.search_repositories(
-                    query=f'{term} in:name')
-
-                if repos.totalCount:
-                    for repo in repos[:self.n_repo_results]:
-                        description = repo.description
-                        if self.relevance_classifier and description:
-                            relevance = self.relevance_classifier.classify_text(
-                                repo.description)
-                        else:
-                            relevance = {'label': None, 'score': None}
-                        results_dict['repos'].append(
-                            {
-                                'url': repo.html_url,
-                                'name': repo.name,
-                                'description': repo.description,
-                                'downloadLink': repo.get_archive_link('zipball'),
-                                'author': {
-                                    'name': repo.owner.login,
-                                    'blogURL': repo.owner.blog,
-                                    'bio': repo.owner.bio,
-                                    'url': repo.owner.html_url,
-                                    'twitter': repo.owner.twitter_username
-                                },
-                                'relevance': {
-                                    'label': relevance['label'],
-                                    'score': relevance['score']
-                                }
-                            }
-                        )
+        with time_stage('search_repos'):
+            results = [results_dict for results_dict in self._search_terms_cached(terms)
+                       if results_dict]
 
-                    if self.exclude_terms_without_relevant_repo:
-                        if not any([repo['relevance']['label'] for repo in results_dict['repos']]):
-                            continue
+        if self.relevance_classifier:
+            results.sort(key=lambda x: x['relevance'], reverse=True)
 
-                    for repo in results_dict['repos']:
-                        if repo['relevance']['label'] is True:
-                            results_dict['relevance'] += repo['relevance']['score']
+        return results
+
+    def iter_search_repos(self, terms):
+        """
+        Same as search_repos, but yields each term's result as soon as it's 
+        found instead of returning all results at once (results are in the 
+        order they're found, not sorted by relevance).
 
-                elif not self.filter_no_links:
-                    results_dict['error'] = 'No repos found'
-                    results_dict['relevance'] = -1
+        REST terms, or GraphQL batches, are searched concurrently on max_workers
+        threads. When the rate limit is exceeded, searches that haven't started
+        are cancelled and their terms are yielded with a rate limit error.
 
-                results.append(results_dict)
+        Timed as the search_repos stage, until the last result is yielded.
+        """
+        terms = list(terms)
+        if self.dummy_results:
+            yield from self.search_repos(terms)
+            return
+        size = self.graphql_batch_size if self.backend == 'graphql' else 1
+        batches = [terms[i:i + size] for i in range(0, len(terms), size)]
+        if not batches:
+            return
+        with time_stage('search_repos'), \
+                ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            futures = {executor.submit(self._search_terms_cached, batch): batch
+                       for batch in batches}
+            rate_limited = False
+            for future in as_completed(futures):
+                if future.cancelled():
+                    term_results = [{'term': term, 'error': 'Rate limit exceeded'}
+                                    for term in futures[future]]
+                else:
+                    term_results = future.result()
+                for results_dict in term_results:
+                    if not results_dict:
+                        continue
+                    if results_dict.get('error') == 'Rate limit exceeded' and not rate_limited:
+                        rate_limited = True
+                        for pending in futures:
+                            pending.cancel()
+                    yield results_dict
+
+    def _search_terms_cached(self, terms):
+        """
+        Runs _search_terms through the cache if there is one.
 
-            except RateLimitExceededException:
-                for term in terms[index:]:
-                    results.append(
-                        {'term': term, 'error': 'Rate limit exceeded'})
-                break
+        Returns a list with a result (dictionary) for each term, or None for 
+        excluded terms.
+        """
+        if self.cache:
+            term_results = self.cache.get_many(
+                terms, self._search_terms, key=self._cache_key)
+        else:
+            term_results = self._search_terms(terms)
+        # Cached results may be for the term with different casing.
+        return [dict(results_dict, term=term) if results_dict else None
+                for term, results_dict in zip(terms, term_results)]
 
-        if self.relevance_classifier:
-            results.sort(key=lambda x: x['relevance'], reverse=True)
+    def _search_terms(self, terms):
+        """
+        Searches GitHub for each term.
 
+        Returns a list with a result (dictionary) for each term, or None for 
+        excluded terms.
+        """
+        results = []
+        repos_lists = self._fetch_repos_many(terms)
+        relevances = self._classify_repos(
+            [repos for repos in repos_lists if repos and not isinstance(repos, SearchFailed)])
+        for index, term in enumerate(terms):
+            repos = repos_lists[index] if index < len(repos_lists) else None
+            if isinstance(repos, SearchFailed):
+                # Not cached, and not shown as a term without repos.
+                results.append({'term': term, 'error': 'Search failed'})
+            elif repos is not None:
+                results.append(self._make_results_dict(
+                    term, repos, relevances))
+            else:
+                results.append({'term': term, 'error': 'Rate limit exceeded'})
         return results
 
-    def get_user_recent(self, user_login, get_posts_args, return_all_info=False):
-        try:
-            user = self.api.search_users(f'{user_login} in:login')[0]
-            if user.blog and 'classifier' in get_posts_args:
-                if not user.blog.startswith('http://') and not user.blog.startswith('https://'):
-                    blog_url = 'http://' + user.blog
-                else:
-                    blog_url = user.blog
-                try:
-                    recent_blog = func_timeout(100, get_posts, args=(
-                        blog_url,), kwargs=get_posts_args)
-                except FunctionTimedOut:
-                    recent_blog = {'error': 'Getting posts timed out.'}
+    def _cache_key(self, term):
+        return json.dumps([
+            ' '.join(term.lower().split()),
+            self.n_repo_results,
+            self.filter_no_links,
+            self.sort_by_relevance,
+            self.exclude_terms_without_relevant_repo,
+            self.relevance_classifier_args
+        ], sort_keys=True)
+
+    def _fetch_repos(self, term):
+        """
+        Searches GitHub for repos with term in their name.
 
-            else:
-                blog_url = None
-                recent_blog = {'error': 'No blog page listed on Github.'}
-
-            repos = self.api.search_repositories(
-                query=f'user:{user_login}', sort='updated')[:self.n_recent_repos]
-            if repos:
-                recent_repos = []
-                for repo in repos:
-                    recent_repos.append({
-                        'name': repo.name,
-                        'url': repo.html_url,
-                        'downloadLink': repo.get_archive_link('zipball'),
-                        'description': repo.description,
-                        'topics': repo.topics,
-                        'pushed_at': str(repo.pushed_at),
-                    })
-            else:
-                recent_repos = {'error': 'No repos found.'}
-            user_recent = {'recentBlog': recent_blog,
-                           'recentRepos': recent_repos}
-            if return_all_info:
-                user_recent.update({
-                    'name': user.login,
-                    'bio': user.bio,
-                    'url': user.html_url,
-                    'blogURL': blog_url,
-                    'twitter': user.twitter_username,
-                })
-            return user_recent
-
-        except RateLimitExceededException:
-            return {'recentBlog': {'error': 'Rate limit exceded.'}, 'recentRepos': {'error': 'Rate limit exceded.'}}
+        Returns a list of the top n_repo_results repos (dictionaries, without
+        relevance). The search uses 'search' quota and each repo's archive
+        link and owner use 'core' quota. Raises QuotaExhausted.
+        """
+        found = self.tokens.call(
+            'search', lambda token: self._search_repos_with(token, term))
+        return [self.tokens.call('core', lambda token: self._get_repo_with(token, repo))
+                for repo in found]
 
-    def get_recent_from_watchlist(self, watchlist, author_to_match=None):
+    def _search_repos_with(self, token, term):
+        """
+        Top n_repo_results repos for term, with the fields that come with
+        search results.
         """
-        Gets n most recent posts and repos fom authors in author watchlist.
+        repos = token.client.search_repositories(query=f'{term} in:name')
+        GITHUB_CALLS.inc(kind='search_repositories')
+        found = []
+        if repos.totalCount:
+            found = [{'full_name': repo.full_name,
+                      'url': repo.html_url,
+                      'name': repo.name,
+                      'description': repo.description,
+                      'owner': repo.owner.login}
+                     for repo in repos[:self.n_repo_results]]
+        self.tokens.update_from_client(token, 'search')
+        return found
+
+    def _get_repo_with(self, token, repo):
+        """Adds the archive link and owner to a repo from _search_repos_with."""
+        download_link = self._get_archive_link_with(token, repo['full_name'])
+        GITHUB_CALLS.inc(kind='get_user')
+        owner = token.client.get_user(repo['owner'])
+        self.tokens.update_from_client(token, 'core')
+        return {
+            'url': repo['url'],
+            'name': repo['name'],
+            'description': repo['description'],
+            'downloadLink': download_link,
+            'author': {
+                'name': owner.login,
+                'blogURL': owner.blog,
+                'bio': owner.bio,
+                'url': owner.html_url,
+                'twitter': owner.twitter_username
+            }
+        }
 
-        Parameters
-        ----------
-        watchlist : str or dict
-            Path to JSON file or dictionary. 
-        n:  int
-            Number of posts and repos (maybe do this client side?)
-        author_name: str
-            (Used when updating, not populating, the Recent panel)
-            When adding an author to the watchlist, will check if the author is included in
-            the most recent posts and/or repos. If not, returns None for the respective 
-            value.
+    def _fetch_repos_many(self, terms):
+        """
+        Fetches repos for each term, running up to max_workers searches (REST
+        terms or GraphQL batches of graphql_batch_size terms) concurrently.
 
+        Returns a list of repo lists in the same order as terms. If the rate
+        limit is exceeded, the list stops at the first term that failed and
+        ends with None, so the term at that index and all later terms can be
+        marked as failed (same as the sequential search).
+        """
+        if self.backend == 'graphql':
+            size = self.graphql_batch_size
+            batches = [terms[i:i + size] for i in range(0, len(terms), size)]
+
+            def fetch(batch):
+                def search(token):
+                    return self.graphql.search_repos(
+                        batch, self.n_repo_results, token=token.token,
+                        on_headers=lambda headers: self.tokens.update_from_headers(
+                            token, headers, resource='graphql'))
+                return self.tokens.call('graphql', search)
+        else:
+            batches = [[term] for term in terms]
 
+            def fetch(batch):
+                return [self._fetch_repos(batch[0])]
 
-        Returns
-        ----------
-        Dictionary of lists of dictionaries:
+        results = []
+        if self.max_workers <= 1 or len(batches) <= 1:
+            for batch in batches:
+                try:
+                    results.extend(fetch(batch))
+                except RATE_LIMIT_EXCEPTIONS:
+                    results.append(None)
+                    break
+            return results
 
-        {'recentPosts': [
-            {
-            'author': author (str), 
-            'index': index of post in watchlist[author]['recentBlog']['posts'] (int)
-            }
-            ,...],
-        'recentRepos': [
-            {
-            'author': author (str), 
-            'index': index of repo in watchlist[author]['recentRepos'] (int)
-            }
-            ,...]
-        }
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(fetch, batch) for batch in batches]
+            for index, future in enumerate(futures):
+                try:
+                    results.extend(future.result())
+                except RATE_LIMIT_EXCEPTIONS:
+                    for future in futures[index:]:
+                        future.cancel()
+                    results.append(None)
+                    break
+        return results
+
+    def _classify_repos(self, repos_lists):
         """
-        if type(watchlist) == str:
-            watchlist = json.load(open(watchlist, encoding='utf-8'))
+        Classifies the descriptions of all repos in repos_lists in one batch.
+        Returns {description: relevance}.
+        """
+        if not self.relevance_classifier:
+            return {}
+        descriptions = list(dict.fromkeys(
+            repo['description'] for repos in repos_lists for repo in repos
+            if repo['description']))
+        with time_stage('classify_relevance'):
+            relevances = self.relevance_classifier.classify_texts(descriptions)
+        return dict(zip(descriptions, relevances))
+
+    def _make_results_dict(self, term, repos, relevances):
+        """
+        Makes the result for term from repos from _fetch_repos, adding relevance
+        from relevances (from _classify_repos).
 
-        post_index_dicts = []
-        for author, props in watchlist.items():
-            try:
-                for index, post_dict in enumerate(props['recentBlog']['posts']):
+        Returns None if the term should be excluded from the results.
+        """
+        results_dict = {'term': term, 'repos': [], 'relevance': 0}
+        if repos:
+            for repo in repos:
+                description = repo['description']
+                if self.relevance_classifier and description:
+                    relevance = relevances[description]
+                else:
+                    relevance = {'label': None, 'score': None}
+                repo = dict(repo)
+                repo['relevance'] = {
+                    'label': relevance['label'],
+                    'score': relevance['score']
+                }
+                results_dict['repos'].append(repo)
 
-                    post_index_dicts.append(
-                        {
-                            'date': post_dict['date'],
-                            'author': {
-                                'name': author,
-                                'url': props['url'],
-                                'blogURL': props['blogURL'],
-                                'twitter': props['twitter']
-                            },
-                            'index': index
-                        })
+            if self.exclude_terms_without_relevant_repo:
+                if not any([repo['relevance']['label'] for repo in results_dict['repos']]):
+                    return None
 
-            except KeyError:
-                pass
+            for repo in results_dict['repos']:
+                if repo['relevance']['label'] is True:
+                    results_dict['relevance'] += repo['relevance']['score']
 
-        repo_index_dicts = []
-        for author, props in watchlist.items():
-            try:
-                for index, repo in enumerate(props['recentRepos']):
-                    if type(repo) == dict:
-                        repo_index_dicts.append(
-                            {
-                                'date': repo['pushed_at'],
-                                'author': {
-                                    'name': author,
-                                    'url': props['url'],
-                                    'blogURL': props['blogURL'],
-                                    'twitter': props['twitter']
-                                },
-                                'index': index
-                            })
-
-            except KeyError:
-                pass
-
-        post_dates_index_dicts, post_null_dates_index_dicts = [], []
-        for post_dict in post_index_dicts:
-            if post_dict['date']:
-                post_dates_index_dicts.append(post_dict)
-            else:
-                # Do something with this later
-                post_null_dates_index_dicts.append(post_dict)
+        elif not self.filter_no_links:
+            results_dict['error'] = 'No repos found'
+            results_dict['relevance'] = -1
 
-        post_dates_index_dicts.sort(
-            key=lambda x: x['date'], reverse=True)
+        return results_dict
 
-        repo_index_dicts.sort(
-            key=lambda x: x['date'], reverse=True)
+    def get_user_recent(self, user_login, get_posts_args, return_all_info=False, priority=INTERACTIVE):
+        try:
+            user = self._get_user(user_login, priority)
+            blog_url, recent_blog = self._get_recent_blog(user, get_posts_args)
+            recent_repos = self._get_recent_repos(user_login, priority)
+            return self._make_user_recent(user, blog_url, recent_blog, recent_repos, return_all_info)
 
-        return_recent_posts = True if not author_to_match else False
-        return_recent_repos = True if not author_to_match else False
+        except Exception as ex:
+            return get_user_recent_error(user_login, ex)
 
-        post_dates_index_dicts = post_dates_index_dicts[:self.n_recent_activity]
-        if author_to_match:
-            for posts_index_dict in post_dates_index_dicts:
-                if author_to_match == posts_index_dict['author']['name']:
-                    return_recent_posts = True
-                    break
+    def iter_users_recent(self, user_logins, get_posts_args, return_all_info=False, priority=INTERACTIVE):
+        """
+        Runs get_user_recent for several users concurrently, using a pool of
+        github_workers threads for GitHub calls and a separate pool of 
+        blog_workers threads for getting blog posts, so a slow blog doesn't 
+        hold up GitHub calls for other users.
+
+        Yields (user_login, user_recent, timings) as each user finishes, where
+        timings has the seconds spent on 'github' calls, on the 'blog' and in 
+        'total' (including time waiting for a free thread). Users that fail
+        get an error user_recent (see get_user_recent_error) instead of
+        raising, so the others are still yielded.
+
+        priority is INTERACTIVE or BACKGROUND (see github_quota.py).
+        """
+        user_logins = list(user_logins)
+        if not user_logins:
+            return
+        with ThreadPoolExecutor(max_workers=self.github_workers) as github_executor, \
+                ThreadPoolExecutor(max_workers=self.blog_workers) as blog_executor, \
+                ThreadPoolExecutor(max_workers=self.github_workers + self.blog_workers) as user_executor:
+            futures = {
+                user_executor.submit(
+                    self._get_user_recent_pooled, user_login, get_posts_args,
+                    return_all_info, github_executor, blog_executor, priority): user_login
+                for user_login in user_logins
+            }
+            for future in as_completed(futures):
+                user_recent, timings = future.result()
+                yield futures[future], user_recent, timings
+
+    def _get_user_recent_pooled(self, user_login, get_posts_args, return_all_info,
+                                github_executor, blog_executor, priority=INTERACTIVE):
+        start = time.perf_counter()
+        timings = {'github': 0, 'blog': 0}
+        try:
+            user, seconds = github_executor.submit(
+                timed, self._get_user, user_login, priority).result()
+            timings['github'] += seconds
+            blog_future = blog_executor.submit(
+                timed, self._get_recent_blog, user, get_posts_args)
+            recent_repos, seconds = github_executor.submit(
+                timed, self._get_recent_repos, user_login, priority).result()
+            timings['github'] += seconds
+            (blog_url, recent_blog), timings['blog'] = blog_future.result()
+            user_recent = self._make_user_recent(
+                user, blog_url, recent_blog, recent_repos, return_all_info)
+        except Exception as ex:
+            user_recent = get_user_recent_error(user_login, ex)
+        timings['total'] = time.perf_counter() - start
+        return user_recent, timings
+
+    def _get_user(self, user_login, priority=INTERACTIVE):
+        """
+        Gets user info: the login from a user search ('search' quota), then
+        the user's profile ('core' quota), so calls are made now.
+        """
+        def search_user(token):
+            user = token.client.search_users(f'{user_login} in:login')[0]
+            GITHUB_CALLS.inc(kind='search_users')
+            self.tokens.update_from_client(token, 'search')
+            return user.login
+
+        def get_user(token):
+            user = token.client.get_user(login)
+            GITHUB_CALLS.inc(kind='get_user')
+            self.tokens.update_from_client(token, 'core')
+            return {
+                'login': user.login,
+                'bio': user.bio,
+                'html_url': user.html_url,
+                'blog': user.blog,
+                'twitter_username': user.twitter_username
+            }
 
-        repo_index_dicts = repo_index_dicts[:self.n_recent_activity]
-        if author_to_match:
-            for repo_index_dict in repo_index_dicts:
-                if author_to_match == repo_index_dict['author']['name']:
-                    return_recent_repos = True
-                    break
+        login = self.tokens.call('search', search_user, priority=priority)
+        return self.tokens.call('core', get_user, priority=priority)
 
-        return {
-            'recentPostIndices': post_dates_index_dicts if return_recent_posts else [],
-            'recentRepoIndices': repo_index_dicts if return_recent_repos else []
-        }
+    def _get_recent_blog(self, user, get_posts_args):
+        """Returns (blog_url, recent_blog) for user from _get_user."""
+        if user['blog'] and 'classifier' in get_posts_args:
+            if not user['blog'].startswith('http://') and not user['blog'].startswith('https://'):
+                blog_url = 'http://' + user['blog']
+            else:
+                blog_url = user['blog']
+            try:
+                recent_blog = func_timeout(100, get_posts, args=(
+                    blog_url,), kwargs=get_posts_args)
+            except FunctionTimedOut:
+                recent_blog = {'error': 'Getting posts timed out.'}
 
+        else:
+            blog_url = None
+            recent_blog = {'error': 'No blog page listed on Github.'}
+        return blog_url, recent_blog
 
-class RelevanceClassifier():
-    def __init__(self,
-                 task='zero-shot-classification',
-                 model="facebook/bart-large-mnli",
-                 label_dict={'cybersecurity software': True,
-                             'other software': False
-                             },
-                 ):
+    def _get_recent_repos(self, user_login, priority=INTERACTIVE):
+        """
+        n_recent_repos most recently updated repos of user ('search' quota),
+        with their archive links ('core' quota).
+        """
+        found = self.tokens.call(
+            'search', lambda token: self._search_recent_repos_with(token, user_login),
+            priority=priority)
+        if not found:
+            return {'error': 'No repos found.'}
+        recent_repos = []
+        for repo in found:
+            download_link = self.tokens.call(
+                'core', lambda token: self._get_archive_link_with(token, repo['full_name']),
+                priority=priority)
+            recent_repos.append({
+                'name': repo['name'],
+                'url': repo['url'],
+                'downloadLink': download_link,
+                'description': repo['description'],
+                'topics': repo['topics'],
+                'pushed_at': repo['pushed_at'],
+            })
+        return recent_repos
+
+    def _search_recent_repos_with(self, token, user_login):
+        repos = token.client.search_repositories(
+            query=f'user:{user_login}', sort='updated')[:self.n_recent_repos]
+        GITHUB_CALLS.inc(kind='search_repositories')
+        found = [{'full_name': repo.full_name,
+                  'name': repo.name,
+                  'url': repo.html_url,
+                  'description': repo.description,
+                  'topics': repo.topics,
+                  'pushed_at': str(repo.pushed_at)}
+                 for repo in repos]
+        self.tokens.update_from_client(token, 'search')
+        return found
+
+    def _get_archive_link_with(self, token, full_name):
+        GITHUB_CALLS.inc(kind='get_archive_link')
+        download_link = token.client.get_repo(
+            full_name, lazy=True).get_archive_link('zipball')
+        self.tokens.update_from_client(token, 'core')
+        return download_link
+
+    def _make_user_recent(self, user, blog_url, recent_blog, recent_repos, return_all_info):
+        user_recent = {'recentBlog': recent_blog,
+                       'recentRepos': recent_repos}
+        if return_all_info:
+            user_recent.update({
+                'name': user['login'],
+                'bio': user['bio'],
+                'url': user['html_url'],
+                'blogURL': blog_url,
+                'twitter': user['twitter_username'],
+            })
+        return user_recent
 
-        self.classifier = pipeline(task, model)
-        self.label_dict = label_dict
-        self.labels = list(label_dict.keys())
-
-    def classify_text(self, text, print_=False):
-        result = self.classifier(text, self.labels)
-        labels, scores = result['labels'], result['scores']
-        if print_:
-            print(labels)
-            print(scores)
-        max_score = max(scores)
-        label = self.label_dict[labels[scores.index(max_score)]]
-        return {'label': label, 'score': max_score}
+    def get_recent_from_watchlist(self, watchlist, author_to_match=None):
+        """
+        Gets n_recent_activity most recent posts and repos from authors in 
+        author watchlist (see RecencyIndex.get_recent).
+
+        Builds a RecencyIndex each call. To serve the Recent panel repeatedly,
+        keep a RecencyIndex updated as authors change instead.
+
+        Parameters
+        ----------
+        watchlist : str or dict
+            Path to JSON file or dictionary. 
+        author_to_match: str
+            (Used when updating, not populating, the Recent panel)
+            When adding an author to the watchlist, will check if the author is included in
+            the most recent posts and/or repos. If not, returns an empty list for the 
+            respective value.
+        """
+        if type(watchlist) == str:
+            watchlist = json.load(open(watchlist, encoding='utf-8'))
+        return RecencyIndex(self.n_recent_activity, watchlist).get_recent(author_to_match)
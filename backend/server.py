@@ -3,83 +3,240 @@ Server for Tool Fetcher Web App/Extension
 """
 
 import base64
-import json
-import requests
+import os
 from datetime import datetime
+import threading
+import time
 
 from bs4 import BeautifulSoup
-from flask import Flask, jsonify, json, Response, request
+from flask import Flask, g, jsonify, json, Response, request
 from flask_cors import CORS
-from func_timeout import func_timeout, FunctionTimedOut
-import newspaper
+import requests
 
+from config import load_config
 from find_terms.find_terms import FindTerms
-from find_terms.pdf_utils import pdf_highlight
-from find_terms.utils import read_lines
 from get_posts.classifier import Classifier
-from search_github import GithubAPI
+from jobs import JobRunner, JobStore
+from metrics import REGISTRY, REQUEST_SECONDS, time_stage
+from page_fetcher import PageFetcher
+from recency_index import RecencyIndex
+from search_github import GithubAPI, format_timings
+from watchlist_refresher import WatchlistRefresher
+from watchlist_store import WatchlistStore
 
 
-config_text = read_lines('server_config.jsonc')
-config_text = '\n'.join(
-    line for line in config_text if not line.strip().startswith('/'))
-CONFIG = json.loads(config_text)
+CONFIG = load_config()
 
-AUTHOR_WATCHLIST = json.load(
-    open(CONFIG['author_watchlist_file'], encoding='utf-8'))
-AUTHOR_WATCHLIST.setdefault('users', {})
+WATCHLIST_STORE = WatchlistStore(CONFIG['author_watchlist_db'],
+                                 json_path=CONFIG['author_watchlist_file'])
+# In-memory copy of the watchlist, reloaded when another process changes it.
+AUTHOR_WATCHLIST = WATCHLIST_STORE.load()
 FOLLOWING_USERS = AUTHOR_WATCHLIST['users']
-AUTHOR_WATCHLIST.setdefault('updated', str(
-    datetime.now().replace(second=0, microsecond=0)))
-
+WATCHLIST_VERSION = WATCHLIST_STORE.version()
 
 FIND_TERMS = FindTerms(**CONFIG['find_terms_args'])
-EXCLUDED_BY_USER_FILE = CONFIG['find_terms_args']['excluded_words_by_user_file']
-EXCLUDED_BY_USER = set(read_lines(EXCLUDED_BY_USER_FILE))
 
 
+FETCHER = PageFetcher(**CONFIG.get('fetch_args', {}))
+
 GET_POSTS_ARGS = CONFIG.get('get_posts_args', {})
 POST_SET_CLASSIFIER = Classifier(
-    GET_POSTS_ARGS.pop('post-set-classifier-csv'), type_='post_set')
-GET_POSTS_ARGS.update({'classifier': POST_SET_CLASSIFIER})
+    GET_POSTS_ARGS.pop('post-set-classifier-csv'),
+    type_='post_set',
+    model_path=GET_POSTS_ARGS.pop('post-set-classifier-model', None))
+GET_POSTS_ARGS.update({'classifier': POST_SET_CLASSIFIER, 'fetcher': FETCHER})
 
 GITHUB = GithubAPI(**CONFIG['github_args'])
+# Most recent posts and repos of FOLLOWING_USERS, updated with it.
+RECENCY_INDEX = RecencyIndex(GITHUB.n_recent_activity, FOLLOWING_USERS)
+
+
+WATCHLIST_LOCK = threading.Lock()
+
+
+def reload_watchlist_if_changed():
+    """
+    Reloads AUTHOR_WATCHLIST and FOLLOWING_USERS (in place) and RECENCY_INDEX
+    from WATCHLIST_STORE if another process or the refresher changed it. Call 
+    with WATCHLIST_LOCK held.
+    """
+    global WATCHLIST_VERSION
+    version = WATCHLIST_STORE.version()
+    if version == WATCHLIST_VERSION:
+        return
+    watchlist = WATCHLIST_STORE.load()
+    FOLLOWING_USERS.clear()
+    FOLLOWING_USERS.update(watchlist['users'])
+    AUTHOR_WATCHLIST['updated'] = watchlist['updated']
+    RECENCY_INDEX.rebuild(FOLLOWING_USERS)
+    WATCHLIST_VERSION = version
+
+
+def watchlist_written():
+    """
+    Call after writing a change already made to AUTHOR_WATCHLIST to
+    WATCHLIST_STORE, so it isn't reloaded unless another process also wrote.
+    """
+    global WATCHLIST_VERSION
+    if WATCHLIST_STORE.last_write_version == WATCHLIST_VERSION + 1:
+        WATCHLIST_VERSION = WATCHLIST_STORE.last_write_version
+
+
+def export_watchlist():
+    """Writes the watchlist to the JSON file used before WatchlistStore."""
+    WATCHLIST_STORE.export_json(CONFIG['author_watchlist_file'])
+
 
+WATCHLIST_REFRESHER = WatchlistRefresher(
+    GITHUB,
+    WATCHLIST_STORE,
+    GET_POSTS_ARGS,
+    CONFIG['update_followers_interval'],
+    on_finish=export_watchlist,
+    lock_path=CONFIG['author_watchlist_db'] + '.refresher.lock'
+)
+
+
+def run_pdf_job(pdf, report):
+    """
+    Same as a PDF request, as a job (see submitPDFJob), reporting the stage,
+    pages processed, terms found and terms searched.
+    """
+    report(stage='extracting')
+    found_terms = FIND_TERMS.find_terms_in_doc(
+        pdf, pdf=True,
+        progress=lambda done, total: report(pagesDone=done, pagesTotal=total))
+    report(stage='highlighting', termsFound=len(found_terms))
+    highlighted_pdf = FIND_TERMS.highlight_pdf(pdf, found_terms)
+    with time_stage('base64_encode'):
+        encoded_pdf = base64.b64encode(highlighted_pdf).decode()
+    report(stage='searching', termsSearched=0)
+    term_dicts = []
+    for term_dict in GITHUB.iter_search_repos(found_terms):
+        term_dicts.append(term_dict)
+        report(termsSearched=len(term_dicts))
+    if GITHUB.relevance_classifier:
+        term_dicts.sort(key=lambda x: x.get('relevance', -1), reverse=True)
+    return {'foundTerms': sorted(found_terms),
+            'encodedPDF': encoded_pdf,
+            'termResults': term_dicts}
+
+
+JOB_STORE = JobStore(**CONFIG['jobs_args']['store_args'])
+JOB_RUNNER = JobRunner(JOB_STORE, {'PDF': run_pdf_job},
+                       **CONFIG['jobs_args']['runner_args'])
 
 app = Flask(__name__)
 CORS(app)
 app.config.update(SECRET_KEY=CONFIG['flask_key'])
 
 
-def get_html(url):
-    try:
-        r = requests.get(url)
-    except Exception:
-        r = None
-    if not r or r.status_code != 200:
-        html = newspaper.build(url).html
-    else:
-        html = r.text
-    return html
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+# Request types recorded in REQUEST_SECONDS (others are recorded as 'other', so
+# clients can't add label values).
+REQUEST_TYPES = {'HTML', 'PDF', 'submitPDFJob', 'jobStatus', 'findResultsForTerms',
+                 'updateWatchlist', 'findTermsInURL', 'rateResults',
+                 'recentActivityGet'}
+
+
+@app.after_request
+def record_request_time(response):
+    # For streamed responses, this is the time until the first message (the
+    # searches are timed by the search_repos stage).
+    if request.path == '/home' and request.method == 'POST':
+        request_type = request.headers.get('type')
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - g.start_time,
+            type=request_type if request_type in REQUEST_TYPES else 'other')
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Metrics in the Prometheus text format (see metrics.py)."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def stream_messages(messages, format_):
+    """
+    Streams messages (dictionaries). format_ is 'ndjson' (newline-delimited 
+    JSON) or 'sse' (server-sent events).
+    """
+    def encode(message):
+        if format_ == 'sse':
+            return f'data: {json.dumps(message)}\n\n'
+        return json.dumps(message) + '\n'
 
+    mimetype = 'text/event-stream' if format_ == 'sse' else 'application/x-ndjson'
+    return Response((encode(message) for message in messages), mimetype=mimetype)
 
-def is_update_tme(last_updated_time_str, interval):
-    format = "%Y-%m-%d %H:%M:%S"
-    current_time = datetime.now()
-    last_update_time = datetime.strptime(last_updated_time_str, format)
-    delta = current_time - last_update_time
-    elapsed = delta.total_seconds() / 3600
-    if elapsed >= interval:
-        return True
+
+def stream_term_results(first_results, terms, format_):
+    """
+    Streams results: first_results (with the found terms) is sent immediately,
+    then a {'termResult': term_dict} message for each term as soon as its
+    GitHub search finishes, then {'done': True}.
+    """
+    def generate():
+        yield first_results
+        for term_dict in GITHUB.iter_search_repos(terms):
+            yield {'termResult': term_dict}
+        yield {'done': True}
+
+    return stream_messages(generate(), format_)
+
+
+def job_status(job):
+    """
+    {'jobId', 'status', 'progress'}, plus 'results' (the same as the job 
+    type's request would return) if the job is done, or 'error' if it failed.
+    """
+    status = {'jobId': job['id'], 'status': job['status'],
+              'progress': job['progress']}
+    if job['status'] == 'done':
+        status['results'] = JOB_STORE.read_result(job['id'])
+    elif job['status'] == 'failed':
+        status['error'] = job['error']
+    return status
+
+
+def stream_job_status(job_id, format_, poll_interval=1):
+    """Streams job_status messages whenever the job changes, until it ends."""
+    def generate():
+        last = None
+        while True:
+            job = JOB_STORE.get(job_id)
+            if not job:
+                yield {'jobId': job_id, 'error': 'Job not found.'}
+                return
+            if job != last:
+                yield job_status(job)
+                last = job
+            if job['status'] in ('done', 'failed'):
+                return
+            time.sleep(poll_interval)
+
+    return stream_messages(generate(), format_)
 
 
 @app.route('/home', methods=['GET', 'POST'])
 def main():
     if request.method == 'POST':
+        # 'ndjson' or 'sse' to stream term results for HTML, PDF and
+        # findTermsInURL requests (see stream_term_results).
+        stream_format = request.headers.get('stream')
+
         if request.headers['type'] == 'HTML':
             paragraphs = request.get_json()
             doc = '\n'.join(paragraphs)
             found_terms = FIND_TERMS.find_terms_in_doc(doc)
+            if stream_format:
+                return stream_term_results(
+                    {'foundTerms': sorted(found_terms)}, found_terms, stream_format)
             term_dicts = GITHUB.search_repos(
                 found_terms)
             results = {'termResults': term_dicts}
@@ -89,14 +246,34 @@ def main():
         elif request.headers['type'] == 'PDF':
             pdf = request.get_data()
             found_terms = FIND_TERMS.find_terms_in_doc(pdf, pdf=True)
-            highlighted_pdf = pdf_highlight(pdf, found_terms)
-            encoded_pdf = base64.b64encode(highlighted_pdf)
-            encoded_pdf = encoded_pdf.decode()
+            highlighted_pdf = FIND_TERMS.highlight_pdf(pdf, found_terms)
+            with time_stage('base64_encode'):
+                encoded_pdf = base64.b64encode(highlighted_pdf)
+                encoded_pdf = encoded_pdf.decode()
+            if stream_format:
+                return stream_term_results(
+                    {'foundTerms': sorted(found_terms), 'encodedPDF': encoded_pdf},
+                    found_terms, stream_format)
             term_dicts = GITHUB.search_repos(found_terms)
             results = {'encodedPDF': encoded_pdf,
                        'termResults': term_dicts}
             return Response(json.dumps(results), mimetype='text/plain')
 
+        elif request.headers['type'] == 'submitPDFJob':
+            # Same as PDF, but returns a job id right away. Poll jobStatus
+            # for progress and results.
+            job_id = JOB_RUNNER.submit('PDF', request.get_data())
+            return jsonify({'jobId': job_id})
+
+        elif request.headers['type'] == 'jobStatus':
+            job_id = request.get_json()['jobId']
+            job = JOB_STORE.get(job_id)
+            if not job:
+                return jsonify({'jobId': job_id, 'error': 'Job not found.'})
+            if stream_format:
+                return stream_job_status(job_id, stream_format)
+            return jsonify(job_status(job))
+
         elif request.headers['type'] == 'findResultsForTerms':
             terms = request.get_json()
             results = GITHUB.search_repos(terms)
@@ -114,52 +291,88 @@ def main():
                     get_posts_args=GET_POSTS_ARGS
                 )
                 author_info.update(new_author)
-                FOLLOWING_USERS.setdefault(author_name, {})
-                FOLLOWING_USERS[author_name].update(author_info)
-                recent = GITHUB.get_recent_from_watchlist(
-                    FOLLOWING_USERS, author_to_match=author_name)
+                with WATCHLIST_LOCK:
+                    reload_watchlist_if_changed()
+                    FOLLOWING_USERS.setdefault(author_name, {})
+                    FOLLOWING_USERS[author_name].update(author_info)
+                    WATCHLIST_STORE.upsert_author(
+                        author_name, FOLLOWING_USERS[author_name])
+                    watchlist_written()
+                    RECENCY_INDEX.set_author(
+                        author_name, FOLLOWING_USERS[author_name])
+                    recent = RECENCY_INDEX.get_recent(
+                        author_to_match=author_name)
                 response = jsonify({
                     'newAuthor': author_info,
                     'recentPostIndices': recent['recentPostIndices'],
                     'recentRepoIndices': recent['recentRepoIndices']
                 })
             elif action == 'update_all':
-                AUTHOR_WATCHLIST['updated'] = str(
-                    datetime.now().replace(second=0, microsecond=0))
-                for author in FOLLOWING_USERS:
-                    FOLLOWING_USERS[author] = GITHUB.get_user_recent(
-                        author, get_posts_args=GET_POSTS_ARGS, return_all_info=True)
-                recent = GITHUB.get_recent_from_watchlist(
-                    FOLLOWING_USERS)
-                response = jsonify({
-                    'updated': AUTHOR_WATCHLIST['updated'],
-                    'watchlist': FOLLOWING_USERS,
-                    'recentPostIndices': recent['recentPostIndices'],
-                    'recentRepoIndices': recent['recentRepoIndices']
-                })
+                updated = str(datetime.now().replace(second=0, microsecond=0))
+                with WATCHLIST_LOCK:
+                    reload_watchlist_if_changed()
+                    authors = list(FOLLOWING_USERS)
+                # Authors that can't be refreshed (deleted or renamed users,
+                # GitHub errors) get an error entry, like in
+                # WatchlistRefresher, instead of failing the request.
+                refreshed = {}
+                for author, author_info, timings in GITHUB.iter_users_recent(
+                        authors, GET_POSTS_ARGS, return_all_info=True):
+                    print(format_timings(author, timings))
+                    refreshed[author] = author_info
+                with WATCHLIST_LOCK:
+                    reload_watchlist_if_changed()
+                    refreshed = {author: author_info for author, author_info in refreshed.items()
+                                 if author in FOLLOWING_USERS}
+                    FOLLOWING_USERS.update(refreshed)
+                    AUTHOR_WATCHLIST['updated'] = updated
+                    WATCHLIST_STORE.upsert_authors(refreshed, updated=updated)
+                    watchlist_written()
+                    export_watchlist()
+                    for author, author_info in refreshed.items():
+                        RECENCY_INDEX.set_author(author, author_info)
+                    recent = RECENCY_INDEX.get_recent()
+                    response = jsonify({
+                        'updated': AUTHOR_WATCHLIST['updated'],
+                        'watchlist': FOLLOWING_USERS,
+                        'recentPostIndices': recent['recentPostIndices'],
+                        'recentRepoIndices': recent['recentRepoIndices']
+                    })
             else:
                 author_name = request_obj['authorName']
-                if author_name:
-                    FOLLOWING_USERS.pop(author_name)
-                else:
-                    FOLLOWING_USERS.clear()
+                with WATCHLIST_LOCK:
+                    reload_watchlist_if_changed()
+                    if author_name:
+                        # Another worker may have removed the author already.
+                        FOLLOWING_USERS.pop(author_name, None)
+                        WATCHLIST_STORE.delete_author(author_name)
+                        RECENCY_INDEX.remove_author(author_name)
+                    else:
+                        FOLLOWING_USERS.clear()
+                        WATCHLIST_STORE.clear_authors()
+                        RECENCY_INDEX.clear()
+                    watchlist_written()
                 response = jsonify('success')
 
-            with open(CONFIG['author_watchlist_file'], 'w') as w:
-                w.write(json.dumps(AUTHOR_WATCHLIST))
             return response
 
         elif request.headers['type'] == 'findTermsInURL':
             url = request.get_json()
             try:
-                doc = func_timeout(30, get_html, args=(url,))
-            except FunctionTimedOut:
+                doc = FETCHER.fetch(url)
+            except requests.Timeout:
                 return jsonify({'error': 'Timeout.'})
+            except requests.RequestException:
+                doc = None
             if not doc:
                 return jsonify({'error': 'No content found on page.'})
             soup = BeautifulSoup(doc, 'lxml')
             text = soup.get_text()
             found_terms = FIND_TERMS.find_terms_in_doc(text)
+            if stream_format:
+                return stream_term_results(
+                    {'foundTerms': sorted(found_terms), 'webPageText': text},
+                    found_terms, stream_format)
             term_dicts = GITHUB.search_repos(found_terms)
             results = {'termResults': term_dicts,
                        'webPageText': text}
@@ -170,35 +383,40 @@ def main():
             rating_dict = request.get_json()
             term, rating = rating_dict['term'], rating_dict['rating']
             if rating:
-                EXCLUDED_BY_USER.difference_update([term])
-                with open(EXCLUDED_BY_USER_FILE, 'w') as w:
-                    w.write('\n'.join(EXCLUDED_BY_USER))
+                FIND_TERMS.excluded_words.remove(term)
             else:
-                EXCLUDED_BY_USER.update([term])
-                with open(EXCLUDED_BY_USER_FILE, 'w') as w:
-                    w.write('\n'.join(EXCLUDED_BY_USER))
-            FIND_TERMS.update_excluded()
+                FIND_TERMS.excluded_words.add(term)
 
             return jsonify('success')
 
         elif request.headers['type'] == 'recentActivityGet':
-            if is_update_tme(AUTHOR_WATCHLIST['updated'], CONFIG['update_followers_interval']):
-                AUTHOR_WATCHLIST['updated'] = str(
-                    datetime.now().replace(second=0, microsecond=0))
-                for user in FOLLOWING_USERS:
-                    FOLLOWING_USERS[user] = GITHUB.get_user_recent(
-                        user, get_posts_args=GET_POSTS_ARGS, return_all_info=True)
-                with open(CONFIG['author_watchlist_file'], 'w') as w:
-                    w.write(json.dumps(AUTHOR_WATCHLIST))
-            recent = GITHUB.get_recent_from_watchlist(
-                FOLLOWING_USERS)
-            response = jsonify({
-                'updated': AUTHOR_WATCHLIST['updated'],
-                'watchlist': FOLLOWING_USERS,
-                'recentPostIndices': recent['recentPostIndices'],
-                'recentRepoIndices': recent['recentRepoIndices']
-            })
+            # Followed users are refreshed by WATCHLIST_REFRESHER, so this
+            # returns the last completed refresh.
+            with WATCHLIST_LOCK:
+                reload_watchlist_if_changed()
+                recent = RECENCY_INDEX.get_recent()
+                response = jsonify({
+                    'updated': AUTHOR_WATCHLIST['updated'],
+                    'watchlist': FOLLOWING_USERS,
+                    'recentPostIndices': recent['recentPostIndices'],
+                    'recentRepoIndices': recent['recentRepoIndices']
+                })
             return response
 
 
-app.run(debug=True)
+def start_worker_tasks():
+    """
+    Tasks that run in every process serving requests. Call after forking. Only
+    one process refreshes the watchlist at a time (see WatchlistRefresher).
+    """
+    JOB_RUNNER.start()
+    WATCHLIST_REFRESHER.start()
+
+
+# Development server. For production, see gunicorn.conf.py.
+if __name__ == '__main__':
+    # With debug=True, the reloader runs this module in a parent process that
+    # doesn't serve requests, so background tasks only start in the child.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker_tasks()
+    app.run(debug=True)
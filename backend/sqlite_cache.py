@@ -0,0 +1,239 @@
+"""
+Disk-backed (SQLite) cache for JSON-serializable values.
+
+Supports a TTL, stale-while-revalidate, a separate TTL for negative results,
+least-recently-used eviction above max_entries, and coalescing of identical
+in-flight lookups (concurrent lookups of the same key share a single fetch).
+get_many reads and writes all of its keys in one transaction each.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import CACHE_LOOKUPS
+
+
+class SQLiteCache():
+    """
+    Parameters
+    ----------
+    path : str
+        Path to SQLite database (created if it doesn't exist).
+    table : str, default 'cache'
+        Table name, so several caches can share a database.
+    ttl : float or None, default None
+        Seconds a value is fresh. None means values never expire.
+    stale_ttl : float, default 0
+        Seconds after ttl during which an expired value is still returned
+        while it's refreshed in the background.
+    negative_ttl : float or None, default None
+        ttl for values that is_negative returns True for. Defaults to ttl.
+    max_entries : int or None, default 10000
+        Least recently used entries are evicted above this number.
+    is_negative : callable, optional
+        Takes a value and returns whether it's a negative result.
+    is_cacheable : callable, optional
+        Takes a value and returns whether it should be stored.
+    revalidate_workers : int, default 2
+        Threads used to refresh stale values.
+    """
+
+    def __init__(self,
+                 path,
+                 table='cache',
+                 ttl=None,
+                 stale_ttl=0,
+                 negative_ttl=None,
+                 max_entries=10000,
+                 is_negative=None,
+                 is_cacheable=None,
+                 revalidate_workers=2):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.max_entries = max_entries
+        self.is_negative = is_negative or (lambda value: False)
+        self.is_cacheable = is_cacheable or (lambda value: True)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn, self._pid = None, None
+        with self.conn:
+            self.conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                created REAL,
+                accessed REAL,
+                negative INTEGER)''')
+            self.conn.execute(f'''CREATE INDEX IF NOT EXISTS {self.table}_accessed
+                ON {self.table} (accessed)''')
+        self.size = self.conn.execute(
+            f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+        self.lock = threading.RLock()
+        self.in_flight = {}
+        self.revalidate_executor = ThreadPoolExecutor(
+            max_workers=revalidate_workers)
+
+    @property
+    def conn(self):
+        # SQLite connections can't be shared with forked processes (gunicorn
+        # workers), so each process opens its own.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """
+        Returns (value, state), where state is 'fresh', 'stale' or 'miss'.
+        """
+        return self.get_batch([key])[key]
+
+    def get_batch(self, keys):
+        """
+        Same as get for several keys, with one query and one transaction.
+        Returns {key: (value, state)}.
+        """
+        keys = list(dict.fromkeys(keys))
+        results = {key: (None, 'miss') for key in keys}
+        now = time.time()
+        with self.lock:
+            accessed = []
+            for key, value, created, negative in self._select(
+                    'key, value, created, negative', keys):
+                ttl = self.negative_ttl if negative else self.ttl
+                age = now - created
+                if ttl is None or age < ttl:
+                    state = 'fresh'
+                elif age < ttl + self.stale_ttl:
+                    state = 'stale'
+                else:
+                    continue
+                results[key] = (json.loads(value), state)
+                accessed.append(key)
+            if accessed:
+                with self.conn:
+                    self.conn.executemany(
+                        f'UPDATE {self.table} SET accessed = ? WHERE key = ?',
+                        [(now, key) for key in accessed])
+        return results
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Stores (key, value) pairs in one transaction."""
+        items = {key: value for key, value in items if self.is_cacheable(value)}
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            existing = len(self._select('key', list(items)))
+            with self.conn:
+                self.conn.executemany(
+                    f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)',
+                    [(key, json.dumps(value), now, now, int(bool(self.is_negative(value))))
+                     for key, value in items.items()])
+            self.size += len(items) - existing
+            if self.max_entries and self.size > self.max_entries:
+                self.evict()
+
+    def _select(self, columns, keys, chunk_size=500):
+        """Rows of columns for keys (in chunks, under SQLite's variable limit)."""
+        rows = []
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows.extend(self.conn.execute(
+                f'SELECT {columns} FROM {self.table} WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk).fetchall())
+        return rows
+
+    def evict(self):
+        """Deletes least recently used entries above max_entries."""
+        with self.lock, self.conn:
+            self.conn.execute(f'''DELETE FROM {self.table} WHERE key IN (
+                SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?)''',
+                              (self.size - self.max_entries,))
+            self.size = self.conn.execute(
+                f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def get_many(self, items, fetch, key=None):
+        """
+        Gets values for items, fetching the ones that aren't cached.
+
+        Parameters
+        ----------
+        items : list
+        fetch : callable
+            Takes a list of items and returns a list of their values, in the
+            same order.
+        key : callable, optional
+            Takes an item and returns its cache key (str). Defaults to the
+            item itself.
+
+        Returns
+        -------
+        list
+            Values in the same order as items.
+        """
+        key = key or (lambda item: item)
+        keys = [key(item) for item in items]
+        values, waiting = {}, {}
+        to_fetch, to_fetch_keys = [], []
+        with self.lock:
+            cached = self.get_batch(keys)
+            for item, item_key in zip(items, keys):
+                if item_key in values or item_key in waiting or item_key in to_fetch_keys:
+                    continue
+                value, state = cached[item_key]
+                if state != 'miss':
+                    values[item_key] = value
+                    if state == 'stale':
+                        self.revalidate(item, item_key, fetch)
+                elif item_key in self.in_flight:
+                    waiting[item_key] = self.in_flight[item_key]
+                    state = 'coalesced'
+                else:
+                    self.in_flight[item_key] = Future()
+                    to_fetch.append(item)
+                    to_fetch_keys.append(item_key)
+                CACHE_LOOKUPS.inc(cache=self.table, result=state)
+
+        if to_fetch:
+            values.update(self._fetch(to_fetch, to_fetch_keys, fetch))
+        for item_key, future in waiting.items():
+            values[item_key] = future.result()
+        return [values[item_key] for item_key in keys]
+
+    def revalidate(self, item, item_key, fetch):
+        """Refreshes item in the background unless it's already being fetched."""
+        with self.lock:
+            if item_key in self.in_flight:
+                return
+            self.in_flight[item_key] = Future()
+        self.revalidate_executor.submit(
+            self._fetch, [item], [item_key], fetch)
+
+    def _fetch(self, items, keys, fetch):
+        try:
+            fetched = fetch(items)
+        except BaseException as ex:
+            with self.lock:
+                for item_key in keys:
+                    self.in_flight.pop(item_key).set_exception(ex)
+            raise
+        values = dict(zip(keys, fetched))
+        try:
+            self.set_many(values.items())
+        finally:
+            with self.lock:
+                for item_key, value in values.items():
+                    self.in_flight.pop(item_key).set_result(value)
+        return values
@@ -0,0 +1,76 @@
+import pytest
+
+from find_terms.exclusions import ExclusionList
+
+
+@pytest.fixture
+def paths(tmp_path):
+    excluded = tmp_path / 'excluded_words.txt'
+    excluded.write_text('The\nand\n', encoding='utf-8')
+    user = tmp_path / 'excluded_words_by_user.txt'
+    user.write_text('Foo\n', encoding='utf-8')
+    return str(excluded), str(user)
+
+
+def test_base_and_user_words(paths):
+    exclusions = ExclusionList(*paths)
+    assert 'the' in exclusions and 'foo' in exclusions
+    assert 'The' not in exclusions
+    assert exclusions.user_terms() == ['Foo']
+
+
+def test_changes_are_synced_between_instances(paths):
+    # Each instance stands in for a process.
+    first, second = ExclusionList(*paths), ExclusionList(*paths)
+    first.add('Bar  Baz')
+    assert 'bar baz' not in second
+    second.sync()
+    assert 'bar baz' in second
+    second.remove('Foo')
+    first.sync()
+    assert 'foo' not in first
+    assert first.user_terms() == second.user_terms() == ['Bar Baz']
+
+
+def test_case_variants_are_counted(paths):
+    exclusions = ExclusionList(*paths)
+    exclusions.add('FOO')
+    exclusions.remove('Foo')
+    assert 'foo' in exclusions
+    exclusions.remove('FOO')
+    assert 'foo' not in exclusions
+
+
+def test_compaction(paths):
+    first = ExclusionList(*paths, compact_after=3)
+    second = ExclusionList(*paths, compact_after=3)
+    for term in ('a1', 'a2', 'a3'):
+        first.add(term)
+    with open(paths[1], encoding='utf-8') as f:
+        assert f.read().split('\n') == ['Foo', 'a1', 'a2', 'a3']
+    with open(paths[1] + '.journal', encoding='utf-8') as f:
+        assert f.read() == ''
+    second.add('b1')
+    assert second.user_terms() == ['Foo', 'a1', 'a2', 'a3', 'b1']
+    first.sync()
+    assert first.user_terms() == second.user_terms()
+    assert ExclusionList(*paths).user_terms() == second.user_terms()
+
+
+def test_partial_journal_line_is_not_applied(paths):
+    exclusions = ExclusionList(*paths)
+    with open(paths[1] + '.journal', 'ab') as f:
+        f.write(b'+Bar')
+    exclusions.sync()
+    assert 'bar' not in exclusions
+    with open(paths[1] + '.journal', 'ab') as f:
+        f.write(b'\n')
+    exclusions.sync()
+    assert 'bar' in exclusions
+
+
+def test_without_user_file(paths):
+    exclusions = ExclusionList(paths[0])
+    exclusions.add('Foo')
+    assert 'foo' in exclusions
+    assert exclusions.user_terms() == ['Foo']
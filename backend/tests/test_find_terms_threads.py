@@ -0,0 +1,44 @@
+import threading
+
+import torch
+
+from find_terms.find_terms import FindTerms
+
+
+def make_find_terms(extractor_torch_threads, seen):
+    """FindTerms with stub extractors that record their torch threads."""
+    find_terms = FindTerms.__new__(FindTerms)
+    find_terms.term_patterns = object()
+    find_terms.use_roster = True
+    find_terms.use_flair = True
+    find_terms.concurrent_extractors = True
+    find_terms.extractor_torch_threads = extractor_torch_threads
+    find_terms.match_terms_re = lambda sents: seen.update(
+        re=torch.get_num_threads()) or set()
+    find_terms.get_ner_terms = lambda model, sents, predict: seen.update(
+        {model: torch.get_num_threads()}) or set()
+    return find_terms
+
+
+def new_thread_torch_threads():
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(torch.get_num_threads()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_extractor_torch_threads_are_not_left_behind():
+    previous = torch.get_num_threads()
+    torch.set_num_threads(3)
+    try:
+        seen = {}
+        make_find_terms({'roster': 2, 'flair': 1}, seen).find_terms_in_sents(
+            ['A sentence about PyTorch.'], filter_sents=False, filter_terms=False)
+        # Extractors without an entry get the caller's number.
+        assert seen == {'re': 3, 'roster': 2, 'flair': 1}
+        assert torch.get_num_threads() == 3
+        assert new_thread_torch_threads() == 3
+    finally:
+        torch.set_num_threads(previous)
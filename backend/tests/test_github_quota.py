@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+from github import RateLimitExceededException
+
+from github_quota import BACKGROUND, INTERACTIVE, QuotaExhausted, TokenPool
+
+
+def rate_limited(resource):
+    return RateLimitExceededException(403, headers={
+        'X-RateLimit-Resource': resource,
+        'X-RateLimit-Remaining': '0',
+        'X-RateLimit-Reset': str(time.time() + 3600)})
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(.01)
+
+
+def test_picks_token_with_most_quota():
+    pool = TokenPool(['a', 'b', 'c'])
+    for token, remaining in zip(pool.tokens, (5, 20, 10)):
+        pool.update(token, 'search', remaining, time.time() + 60)
+    token = pool.acquire('search')
+    assert token.token == 'b'
+    assert token.quota['search'][0] == 19
+
+
+def test_exhausted_quota_raises_after_max_wait():
+    pool = TokenPool(['a', 'b'], max_wait=.2)
+    for token in pool.tokens:
+        pool.update(token, 'search', 0, time.time() + 3600)
+    start = time.monotonic()
+    with pytest.raises(QuotaExhausted):
+        pool.acquire('search')
+    assert .2 <= time.monotonic() - start < 2
+    # Other resources aren't affected.
+    assert pool.acquire('core')
+
+
+def test_quota_is_available_again_after_reset():
+    pool = TokenPool('a', max_wait=5)
+    pool.update(pool.tokens[0], 'search', 0, time.time() + .3)
+    assert pool.acquire('search').token == 'a'
+
+
+def test_background_calls_leave_reserve():
+    pool = TokenPool('a', background_max_wait=.2,
+                     background_reserve={'core': 10})
+    pool.update(pool.tokens[0], 'core', 10, time.time() + 3600)
+    with pytest.raises(QuotaExhausted):
+        pool.acquire('core', priority=BACKGROUND)
+    assert pool.acquire('core', priority=INTERACTIVE).token == 'a'
+
+
+def test_interactive_calls_are_served_first():
+    pool = TokenPool('a', max_wait=5, background_max_wait=5,
+                     background_reserve={'search': 0})
+    token = pool.tokens[0]
+    pool.update(token, 'search', 0, time.time() + 3600)
+    order = []
+
+    def acquire(priority):
+        pool.acquire('search', priority=priority)
+        order.append(priority)
+
+    threads = []
+    for priority in (BACKGROUND, INTERACTIVE):
+        threads.append(threading.Thread(target=acquire, args=(priority,)))
+        threads[-1].start()
+        wait_for(lambda: len(pool.waiting['search']) == len(threads))
+    pool.update(token, 'search', 1, time.time() + 3600)
+    wait_for(lambda: order)
+    pool.update(token, 'search', 1, time.time() + 3600)
+    for thread in threads:
+        thread.join(5)
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_call_retries_with_another_token():
+    pool = TokenPool(['a', 'b'])
+    used = []
+
+    def func(token):
+        used.append(token.token)
+        if token.token == 'a':
+            raise rate_limited('search')
+        return 'result'
+
+    pool.update(pool.tokens[0], 'search', 10, time.time() + 60)
+    pool.update(pool.tokens[1], 'search', 5, time.time() + 60)
+    assert pool.call('search', func) == 'result'
+    assert used == ['a', 'b']
+    assert pool.tokens[0].remaining('search') == 0
+
+
+def test_call_raises_when_another_resource_is_exhausted():
+    pool = TokenPool(['a', 'b'])
+    used = []
+
+    def func(token):
+        used.append(token.token)
+        raise rate_limited('core')
+
+    with pytest.raises(RateLimitExceededException):
+        pool.call('search', func)
+    assert len(used) == 1
+    assert pool.tokens[0].remaining('core') == 0
+    assert pool.tokens[0].remaining('search') is None
@@ -0,0 +1,86 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from metrics import (Counter, Histogram, MemoryStore, MmapStore, Registry,
+                     clear_metrics_dir)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_metrics(directory):
+    registry = Registry(MmapStore(directory, initial_size=64))
+    calls = Counter('calls_total', 'Calls.', ['kind'], registry=registry)
+    seconds = Histogram('seconds', 'Seconds.', ['type'], buckets=(1, 10),
+                        registry=registry)
+    return registry, calls, seconds
+
+
+def record(calls, seconds):
+    # Enough keys to grow the file past initial_size.
+    for index in range(100):
+        calls.inc(kind=f'kind{index}')
+    calls.inc(2, kind='search')
+    seconds.observe(5, type='HTML')
+
+
+def test_memory_store():
+    registry = Registry()
+    calls = Counter('calls_total', 'Calls.', ['kind'], registry=registry)
+    calls.inc(kind='search')
+    calls.inc(.5, kind='search')
+    assert 'calls_total{kind="search"} 1.5' in registry.render()
+
+
+def test_mmap_store_sums_processes(tmp_path):
+    registry, calls, seconds = make_metrics(str(tmp_path))
+    record(calls, seconds)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=record, args=(calls, seconds))
+                 for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert len(list(tmp_path.iterdir())) == 4
+
+    lines = registry.render().split('\n')
+    assert 'calls_total{kind="search"} 8' in lines
+    assert 'calls_total{kind="kind99"} 4' in lines
+    assert 'seconds_bucket{type="HTML",le="1"} 0' in lines
+    assert 'seconds_bucket{type="HTML",le="10"} 4' in lines
+    assert 'seconds_count{type="HTML"} 4' in lines
+
+    clear_metrics_dir(str(tmp_path))
+    assert registry.store.read() == {}
+
+
+def test_default_store_is_picked_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.delenv('TOOL_FETCHER_METRICS_DIR', raising=False)
+    registry = Registry()
+    calls = Counter('calls_total', 'Calls.', registry=registry)
+    monkeypatch.setenv('TOOL_FETCHER_METRICS_DIR', str(tmp_path))
+    calls.inc()
+    assert isinstance(registry.store, MmapStore)
+    assert registry.store.directory == str(tmp_path)
+    monkeypatch.delenv('TOOL_FETCHER_METRICS_DIR')
+    assert isinstance(Registry().store, MemoryStore)
+
+
+def test_gunicorn_conf_makes_registry_use_mmap_store(tmp_path):
+    config_path = tmp_path / 'server_config.jsonc'
+    metrics_dir = str(tmp_path / 'metrics')
+    config_path.write_text(json.dumps({'serving': {'metrics_dir': metrics_dir}}))
+    env = dict(os.environ, TOOL_FETCHER_CONFIG=str(config_path))
+    env.pop('TOOL_FETCHER_METRICS_DIR', None)
+    # A new interpreter, since metrics is already imported here.
+    output = subprocess.run(
+        [sys.executable, '-c',
+         'import runpy; runpy.run_path("gunicorn.conf.py"); import metrics; '
+         'store = metrics.REGISTRY.store; '
+         'print(type(store).__name__, store.directory)'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ['MmapStore', metrics_dir]
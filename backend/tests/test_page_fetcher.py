@@ -0,0 +1,147 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from page_fetcher import PageFetcher
+
+
+class Handler(BaseHTTPRequestHandler):
+    # {path: number of requests}
+    requests_seen = {}
+
+    def do_GET(self):
+        count = self.requests_seen[self.path] = self.requests_seen.get(self.path, 0) + 1
+        if self.path == '/flaky' and count == 1:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/down':
+            self.send_response(503)
+            self.send_header('Retry-After', '60')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/trickle':
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            for _ in range(1000):
+                self.wfile.write(b'a')
+                self.wfile.flush()
+                time.sleep(.1)
+        else:
+            body = b'<html>page</html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(params=['HTTP/1.0', 'HTTP/1.1'])
+def server(request, monkeypatch):
+    # The connection keeps its socket after the headers only with HTTP/1.1.
+    monkeypatch.setattr(Handler, 'protocol_version', request.param)
+    Handler.requests_seen = {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def stalled_connect():
+    """URL whose connections aren't accepted (the listen backlog is full)."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    clients = []
+    for _ in range(8):
+        client = socket.socket()
+        client.setblocking(False)
+        try:
+            client.connect(('127.0.0.1', port))
+        except BlockingIOError:
+            pass
+        clients.append(client)
+    time.sleep(.1)
+    yield f'http://127.0.0.1:{port}/'
+    for client in clients:
+        client.close()
+    listener.close()
+
+
+@pytest.fixture
+def no_response():
+    """URL whose connections are accepted, but never answered."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    connections = []
+    thread = threading.Thread(
+        target=lambda: connections.extend(listener.accept() for _ in range(3)),
+        daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{listener.getsockname()[1]}/'
+    for connection, _ in connections:
+        connection.close()
+    listener.close()
+
+
+def timed_fetch(fetcher, url):
+    start = time.monotonic()
+    try:
+        return fetcher.fetch(url), time.monotonic() - start
+    except requests.RequestException as ex:
+        return ex, time.monotonic() - start
+
+
+def test_fetch(server):
+    assert PageFetcher().fetch(server + '/page') == '<html>page</html>'
+
+
+def test_deadline_covers_stalled_connects(stalled_connect):
+    fetcher = PageFetcher(connect_timeout=5, read_timeout=5, deadline=1,
+                          retries=2)
+    result, seconds = timed_fetch(fetcher, stalled_connect)
+    assert isinstance(result, requests.Timeout)
+    assert seconds < 2
+
+
+def test_deadline_covers_waiting_for_headers(no_response):
+    fetcher = PageFetcher(connect_timeout=5, read_timeout=10, deadline=1,
+                          retries=2)
+    result, seconds = timed_fetch(fetcher, no_response)
+    assert isinstance(result, requests.Timeout)
+    assert seconds < 2
+
+
+def test_deadline_covers_reading_body(server):
+    fetcher = PageFetcher(read_timeout=5, deadline=1)
+    result, seconds = timed_fetch(fetcher, server + '/trickle')
+    assert isinstance(result, requests.Timeout)
+    assert seconds < 2
+
+
+def test_retries_error_status(server):
+    fetcher = PageFetcher(backoff_factor=.01)
+    assert fetcher.fetch(server + '/flaky') == '<html>page</html>'
+    assert Handler.requests_seen['/flaky'] == 2
+
+
+def test_no_retry_when_retry_after_passes_deadline(server):
+    fetcher = PageFetcher(deadline=2)
+    result, seconds = timed_fetch(fetcher, server + '/down')
+    assert isinstance(result, requests.HTTPError)
+    assert result.response.status_code == 503
+    assert Handler.requests_seen['/down'] == 1
+    assert seconds < 1
@@ -0,0 +1,73 @@
+import random
+
+from recency_index import RecencyIndex, get_author_props
+
+
+def baseline_recent(watchlist, n_recent, author_to_match=None):
+    """What get_recent_from_watchlist returned before RecencyIndex."""
+    posts, repos = [], []
+    for author, info in watchlist.items():
+        for index, post in enumerate(info.get('recentBlog', {}).get('posts', [])):
+            if post['date']:
+                posts.append({'date': post['date'],
+                              'author': get_author_props(author, info),
+                              'index': index})
+        for index, repo in enumerate(info.get('recentRepos', [])):
+            if type(repo) == dict:
+                repos.append({'date': repo['pushed_at'],
+                              'author': get_author_props(author, info),
+                              'index': index})
+    recent = {}
+    for key, index_dicts in (('recentPostIndices', posts), ('recentRepoIndices', repos)):
+        index_dicts.sort(key=lambda index_dict: index_dict['date'], reverse=True)
+        index_dicts = index_dicts[:n_recent]
+        if author_to_match and not any(index_dict['author']['name'] == author_to_match
+                                       for index_dict in index_dicts):
+            index_dicts = []
+        recent[key] = index_dicts
+    return recent
+
+
+def make_author(rand, author):
+    # Few distinct dates, so there are ties.
+    dates = [f'2024-01-0{day}' for day in range(1, 6)]
+    info = {'url': f'https://github.com/{author}', 'blogURL': None,
+            'twitter': None,
+            'recentBlog': {'posts': [{'date': rand.choice(dates + [None])}
+                                     for _ in range(rand.randint(0, 4))]},
+            'recentRepos': [{'pushed_at': rand.choice(dates)}
+                            if rand.random() < .8 else 'No repos found.'
+                            for _ in range(rand.randint(0, 4))]}
+    if rand.random() < .2:
+        del info['recentBlog']
+    return info
+
+
+def test_same_as_baseline_sort():
+    rand = random.Random(0)
+    for n_recent in (1, 3, 10):
+        watchlist = {f'author{index}': make_author(rand, f'author{index}')
+                     for index in range(8)}
+        index = RecencyIndex(n_recent, watchlist)
+        for _ in range(50):
+            author = f'author{rand.randint(0, 10)}'
+            if author in watchlist and rand.random() < .3:
+                del watchlist[author]
+                index.remove_author(author)
+            else:
+                watchlist[author] = make_author(rand, author)
+                index.set_author(author, watchlist[author])
+            assert index.get_recent() == baseline_recent(watchlist, n_recent)
+            assert index.get_recent(author) == baseline_recent(
+                watchlist, n_recent, author)
+
+
+def test_clear_and_rebuild():
+    rand = random.Random(1)
+    watchlist = {f'author{index}': make_author(rand, f'author{index}')
+                 for index in range(5)}
+    index = RecencyIndex(5, watchlist)
+    index.clear()
+    assert index.get_recent() == {'recentPostIndices': [], 'recentRepoIndices': []}
+    index.rebuild(watchlist)
+    assert index.get_recent() == baseline_recent(watchlist, 5)
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from sqlite_cache import SQLiteCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return SQLiteCache(str(tmp_path / 'cache.sqlite'), **kwargs)
+
+
+def age(cache, seconds):
+    """Makes every entry seconds older."""
+    with cache.conn:
+        cache.conn.execute(
+            f'UPDATE {cache.table} SET created = created - ?', (seconds,))
+
+
+def test_get_set(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get('a') == (None, 'miss')
+    cache.set('a', {'repos': [1, 2]})
+    assert cache.get('a') == ({'repos': [1, 2]}, 'fresh')
+
+
+def test_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=10)
+    cache.set('a', 1)
+    age(cache, 5)
+    assert cache.get('a') == (1, 'fresh')
+    age(cache, 10)
+    assert cache.get('a') == (None, 'miss')
+
+
+def test_stale_value_is_returned_and_revalidated(tmp_path):
+    cache = make_cache(tmp_path, ttl=10, stale_ttl=100)
+    cache.set('a', 'old')
+    age(cache, 50)
+    assert cache.get('a') == ('old', 'stale')
+    fetched = []
+
+    def fetch(items):
+        fetched.append(items)
+        return ['new' for _ in items]
+
+    assert cache.get_many(['a'], fetch) == ['old']
+    cache.revalidate_executor.shutdown(wait=True)
+    assert fetched == [['a']]
+    assert cache.get('a') == ('new', 'fresh')
+    age(cache, 200)
+    assert cache.get('a') == (None, 'miss')
+
+
+def test_negative_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=None, negative_ttl=10,
+                       is_negative=lambda value: not value)
+    cache.set('found', [1])
+    cache.set('not_found', [])
+    age(cache, 100)
+    assert cache.get('found') == ([1], 'fresh')
+    assert cache.get('not_found') == (None, 'miss')
+
+
+def test_is_cacheable(tmp_path):
+    cache = make_cache(tmp_path, is_cacheable=lambda value: 'error' not in value)
+    cache.set_many([('a', {'error': 'Search failed'}), ('b', {'repos': []})])
+    assert cache.get('a') == (None, 'miss')
+    assert cache.get('b') == ({'repos': []}, 'fresh')
+    assert cache.size == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=3)
+    cache.set_many([('a', 1), ('b', 2), ('c', 3)])
+    time.sleep(.01)
+    cache.get('a')
+    cache.set('d', 4)
+    assert cache.get('b') == (None, 'miss')
+    assert [cache.get(key)[1] for key in 'acd'] == ['fresh'] * 3
+    cache.set('a', 5)
+    assert cache.size == 3
+
+
+def test_get_many_fetches_misses_once(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set('a', 'cached')
+    fetched = []
+
+    def fetch(items):
+        fetched.append(items)
+        return [item.upper() for item in items]
+
+    assert cache.get_many(['a', 'b', 'c', 'b'], fetch) == [
+        'cached', 'B', 'C', 'B']
+    assert fetched == [['b', 'c']]
+    assert cache.get_many(['c'], fetch, key=lambda item: item) == ['C']
+    assert fetched == [['b', 'c']]
+
+
+def test_get_many_uses_one_transaction_for_reads_and_writes(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set_many([(str(index), index) for index in range(600)])
+    statements = []
+    cache.conn.set_trace_callback(statements.append)
+    items = [str(index) for index in range(1000)]
+    assert cache.get_many(items, lambda items: [int(item) for item in items]) == list(range(1000))
+    assert sum(statement.startswith('COMMIT') for statement in statements) == 2
+
+
+def test_concurrent_lookups_are_coalesced(tmp_path):
+    cache = make_cache(tmp_path)
+    started, release = threading.Event(), threading.Event()
+    fetched, results = [], {}
+
+    def fetch(items):
+        fetched.append(items)
+        started.set()
+        release.wait(5)
+        return ['value' for _ in items]
+
+    def lookup(name):
+        results[name] = cache.get_many(['a'], fetch)
+
+    first = threading.Thread(target=lookup, args=('first',))
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=lookup, args=('second',))
+    second.start()
+    second.join(.2)
+    # Waiting on the first lookup's fetch instead of fetching again.
+    assert second.is_alive()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert fetched == [['a']]
+    assert results == {'first': ['value'], 'second': ['value']}
+
+
+def test_failed_fetch_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+
+    def fetch(items):
+        raise ValueError('fetch failed')
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.get_many(['a'], fetch)
+    assert cache.in_flight == {}
+    assert cache.get('a') == (None, 'miss')
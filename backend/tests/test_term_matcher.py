@@ -0,0 +1,83 @@
+import pickle
+import random
+import re
+
+import pytest
+
+from find_terms.term_matcher import TermMatcher
+from find_terms.utils import make_term_patterns
+
+TERMS = ['a', 'ab', 'a b', 'C++', '.NET', 'ab-c', 'ſs', 'Σσ', 'İx', 'i', 'K',
+         'scikit-learn', 'PyTorch', 'R']
+CHARS = 'aAbBcC +.NnETet-sSſσςΣİiIıxKk_ͅ'
+
+
+def make_regex(terms, ignore_case):
+    """The alternation regex TermMatcher replaced."""
+    terms = sorted(set(terms), key=len, reverse=True)
+    return re.compile(rf'\b({"|".join(re.escape(term) for term in terms)})\b',
+                      flags=re.IGNORECASE if ignore_case else 0)
+
+
+def random_texts(n, seed=0):
+    rand = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rand.randint(1, 6)):
+            term = rand.choice(TERMS)
+            if rand.random() < .5:
+                term = ''.join(char.upper() if rand.random() < .3 else char
+                               for char in term)
+            if rand.random() < .3:
+                term = term[:rand.randint(0, len(term))]
+            parts.append(term)
+            parts.append(''.join(rand.choice(CHARS)
+                                 for _ in range(rand.randint(0, 3))))
+        texts.append(''.join(parts))
+    return texts
+
+
+@pytest.mark.parametrize('ignore_case', [True, False])
+def test_same_matches_as_regex(ignore_case):
+    regex, matcher = make_regex(TERMS, ignore_case), TermMatcher(TERMS, ignore_case)
+    for text in random_texts(5000):
+        assert [match.span() for match in matcher.finditer(text)] == \
+            [match.span() for match in regex.finditer(text)], text
+        regex_match, match = regex.match(text), matcher.match(text)
+        assert (match and match.span()) == (regex_match and regex_match.span()), text
+        assert matcher.sub(lambda match: f'<{match.group(1)}>', text) == \
+            regex.sub(lambda match: f'<{match.group(1)}>', text), text
+
+
+def test_longest_term_at_word_boundaries():
+    matcher = TermMatcher(['Py', 'PyTorch', 'Torch'], ignore_case=True)
+    assert [match.group() for match in matcher.finditer(
+        'pytorch, PyTorchLightning, torch and py.')] == ['pytorch', 'torch', 'py']
+
+
+def test_sub_with_string_is_literal():
+    matcher = TermMatcher(['R'])
+    assert matcher.sub(r'\1', 'R and R') == r'\1 and \1'
+
+
+def test_make_term_patterns_matches_hyphen_and_space_variants(tmp_path):
+    cache_path = str(tmp_path / 'term_patterns.pickle')
+    term_patterns = make_term_patterns(['scikit-learn', 'hugging face'], ['R'],
+                                       cache_path=cache_path)
+    text = 'Scikit learn, Hugging-Face and R, not r.'
+    assert [match.group() for match in term_patterns['ignore_case'].finditer(text)] == \
+        ['Scikit learn', 'Hugging-Face']
+    assert [match.group() for match in term_patterns['keep_case'].finditer(text)] == ['R']
+    # The second call loads the matchers from cache_path.
+    cached = make_term_patterns(['scikit-learn', 'hugging face'], ['R'],
+                                cache_path=cache_path)
+    assert cached['ignore_case'].root == term_patterns['ignore_case'].root
+
+
+def test_pickle_round_trip():
+    matcher = TermMatcher(TERMS, ignore_case=True)
+    loaded = pickle.loads(pickle.dumps(matcher))
+    text = 'A B, c++ and .net'
+    assert [match.span() for match in loaded.finditer(text)] == \
+        [match.span() for match in matcher.finditer(text)]
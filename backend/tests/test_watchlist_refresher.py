@@ -0,0 +1,62 @@
+from github import GithubException
+
+from search_github import GithubAPI
+from watchlist_refresher import WatchlistRefresher
+from watchlist_store import WatchlistStore
+
+
+def make_github():
+    github = GithubAPI('token')
+
+    def get_user(user_login, priority):
+        if user_login == 'gone':
+            # search_users(...)[0] with no results.
+            raise IndexError('list index out of range')
+        if user_login == 'broken':
+            raise GithubException(502, {'message': 'Server Error'})
+        return {'login': user_login, 'bio': None, 'blog': None,
+                'html_url': f'https://github.com/{user_login}',
+                'twitter_username': None}
+
+    github._get_user = get_user
+    github._get_recent_repos = lambda user_login, priority: [
+        {'name': 'repo', 'pushed_at': '2024-01-01 00:00:00'}]
+    return github
+
+
+def make_store(tmp_path, authors):
+    store = WatchlistStore(str(tmp_path / 'watchlist.sqlite'))
+    store.upsert_authors({author: {'recentBlog': {}, 'recentRepos': []}
+                          for author in authors}, updated='2000-01-01 00:00:00')
+    return store
+
+
+def test_iter_users_recent_yields_failed_users():
+    results = {author: author_info for author, author_info, _ in
+               make_github().iter_users_recent(['ok', 'gone', 'broken'], {})}
+    assert results['ok']['recentRepos'][0]['name'] == 'repo'
+    assert results['gone'] == {'recentBlog': {'error': 'User not found.'},
+                               'recentRepos': {'error': 'User not found.'}}
+    assert results['broken']['recentRepos'] == {'error': 'Getting user failed.'}
+
+
+def test_refresh_finishes_when_a_user_does_not_resolve(tmp_path):
+    store = make_store(tmp_path, ['ok', 'gone'])
+    finished = []
+    refresher = WatchlistRefresher(make_github(), store, {}, update_interval=1,
+                                   on_finish=lambda: finished.append(True))
+    assert refresher.is_due()
+    refresher.refresh()
+    assert finished == [True]
+    assert store.get_refresh() is None
+    assert not refresher.is_due()
+    users = store.load()['users']
+    assert users['ok']['name'] == 'ok'
+    assert users['gone']['recentRepos'] == {'error': 'User not found.'}
+
+
+def test_get_user_recent_returns_error_for_failed_user():
+    github = make_github()
+    assert github.get_user_recent('gone', {}, return_all_info=True) == {
+        'recentBlog': {'error': 'User not found.'},
+        'recentRepos': {'error': 'User not found.'}}
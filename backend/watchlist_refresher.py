@@ -0,0 +1,137 @@
+"""
+Refreshes recent posts/repos of followed GitHub users in a background thread.
+"""
+from datetime import datetime
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No locking between processes on Windows (only one process is run there).
+    fcntl = None
+
+from github_quota import BACKGROUND
+from search_github import format_timings
+
+
+def is_update_tme(last_updated_time_str, interval):
+    format = "%Y-%m-%d %H:%M:%S"
+    current_time = datetime.now()
+    last_update_time = datetime.strptime(last_updated_time_str, format)
+    delta = current_time - last_update_time
+    elapsed = delta.total_seconds() / 3600
+    if elapsed >= interval:
+        return True
+
+
+class WatchlistRefresher():
+    """
+    Refreshes every author in the watchlist once update_interval hours have
+    passed since the last refresh.
+
+    Authors are refreshed concurrently (see GithubAPI.iter_users_recent), and
+    each result is saved to the store's refresh progress as soon as it's done,
+    so an interrupted refresh resumes where it stopped. The store's authors are
+    only replaced when every author is done, so they're always the last 
+    completed snapshot. GitHub calls have background priority, so they wait
+    behind term searches.
+
+    Parameters
+    ----------
+    github : GithubAPI
+    store : WatchlistStore
+    get_posts_args : dict
+        Args for get_posts.
+    update_interval : float
+        Hours between refreshes.
+    poll_interval : float, default 60
+        Seconds between checks for whether a refresh is due.
+    on_finish : callable, optional
+        Called after each completed refresh.
+    lock_path : str, optional
+        File locked by the process that refreshes, so that when every worker
+        process starts a refresher, only one refreshes at a time. The others
+        check for the lock every poll_interval and take over if that process
+        exits. Start refreshers after forking (a forked child gets copies of
+        any locks the refresher thread holds, which are never released).
+    """
+
+    def __init__(self,
+                 github,
+                 store,
+                 get_posts_args,
+                 update_interval,
+                 poll_interval=60,
+                 on_finish=None,
+                 lock_path=None):
+        self.github = github
+        self.store = store
+        self.get_posts_args = get_posts_args
+        self.update_interval = update_interval
+        self.poll_interval = poll_interval
+        self.on_finish = on_finish or (lambda: None)
+        self.lock_path = lock_path
+        self.lock_file = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.run, name='watchlist-refresher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def claim(self):
+        """Whether this process holds (or just took) the refresher lock."""
+        if not self.lock_path or not fcntl or self.lock_file:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held until the process exits.
+        self.lock_file = lock_file
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.claim() and self.is_due():
+                try:
+                    self.refresh()
+                except Exception as ex:
+                    print(f'Watchlist refresh failed: {ex!r}')
+            self.stop_event.wait(self.poll_interval)
+
+    def is_due(self):
+        return self.store.get_refresh() is not None or \
+            is_update_tme(self.store.get_updated(), self.update_interval)
+
+    def refresh(self):
+        progress = self.store.get_refresh()
+        if not progress:
+            self.store.start_refresh(
+                str(datetime.now().replace(second=0, microsecond=0)))
+            progress = self.store.get_refresh()
+        authors = [author for author in self.store.load()['users']
+                   if author not in progress['done']]
+
+        users_recent = self.github.iter_users_recent(
+            authors, self.get_posts_args, return_all_info=True, priority=BACKGROUND)
+        for author, author_info, timings in users_recent:
+            print(format_timings(author, timings))
+            self.store.save_refresh_progress(author, author_info)
+            if self.stop_event.is_set():
+                users_recent.close()
+                return
+
+        self.store.finish_refresh()
+        self.on_finish()
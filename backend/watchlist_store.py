@@ -0,0 +1,201 @@
+"""
+SQLite storage for the author watchlist.
+
+Authors are stored one row each, so adding, updating or removing an author is a
+single atomic upsert or delete instead of rewriting the whole watchlist, and
+several processes (gunicorn workers) can share it safely. The watchlist can be
+exported to (and is imported once from) the old JSON format:
+
+    {'users': {author: author_info, ...}, 'updated': 'YYYY-MM-DD HH:MM:SS'}
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+
+
+class WatchlistStore():
+    """
+    Parameters
+    ----------
+    path : str
+        Path to SQLite database (created if it doesn't exist).
+    json_path : str, optional
+        Watchlist JSON file to import if the database is new.
+    """
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn, self._pid = None, None
+        self.lock = threading.RLock()
+        self.last_write_version = None
+        with self.transaction():
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS authors (
+                name TEXT PRIMARY KEY,
+                position INTEGER,
+                info TEXT)''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT)''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS refresh_progress (
+                name TEXT PRIMARY KEY,
+                info TEXT)''')
+            is_new = self._get_meta('updated') is None
+            if is_new:
+                watchlist = {}
+                if json_path and os.path.exists(json_path):
+                    watchlist = json.load(open(json_path, encoding='utf-8'))
+                for name, info in watchlist.get('users', {}).items():
+                    self._upsert_author(name, info)
+                self._set_meta('updated', watchlist.get('updated') or str(
+                    datetime.now().replace(second=0, microsecond=0)))
+
+    @property
+    def conn(self):
+        # SQLite connections can't be shared with forked processes (gunicorn
+        # workers), so each process opens its own.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def transaction(self, changes_watchlist=True):
+        """
+        Runs the statements in the block in one transaction (nested blocks
+        join the outer transaction). Increments the version if 
+        changes_watchlist.
+        """
+        with self.lock:
+            if self.conn.in_transaction:
+                yield
+                return
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+                if changes_watchlist:
+                    self.conn.execute('''INSERT INTO meta VALUES ('version', '1')
+                        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1''')
+                    self.last_write_version = int(self._get_meta('version'))
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def version(self):
+        """Incremented whenever any process changes the watchlist."""
+        return int(self._get_meta('version') or 0)
+
+    def load(self):
+        """Returns the watchlist as a dictionary in the old JSON format."""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT name, info FROM authors ORDER BY position').fetchall()
+            return {
+                'users': {name: json.loads(info) for name, info in rows},
+                'updated': self._get_meta('updated')
+            }
+
+    def get_author(self, name):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT info FROM authors WHERE name = ?', (name,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def upsert_author(self, name, info):
+        with self.transaction():
+            self._upsert_author(name, info)
+
+    def upsert_authors(self, authors, updated=None):
+        """Updates several authors (dict of name: info) at once."""
+        with self.transaction():
+            for name, info in authors.items():
+                self._upsert_author(name, info)
+            if updated:
+                self._set_meta('updated', updated)
+
+    def delete_author(self, name):
+        with self.transaction():
+            self.conn.execute('DELETE FROM authors WHERE name = ?', (name,))
+
+    def clear_authors(self):
+        with self.transaction():
+            self.conn.execute('DELETE FROM authors')
+
+    def get_updated(self):
+        return self._get_meta('updated')
+
+    def set_updated(self, updated):
+        with self.transaction():
+            self._set_meta('updated', updated)
+
+    def get_refresh(self):
+        """
+        Returns the refresh in progress ({'started': str, 'done': {name: info}})
+        or None.
+        """
+        with self.lock:
+            started = self._get_meta('refresh_started')
+            if not started:
+                return None
+            rows = self.conn.execute(
+                'SELECT name, info FROM refresh_progress').fetchall()
+            return {'started': started,
+                    'done': {name: json.loads(info) for name, info in rows}}
+
+    def start_refresh(self, started):
+        with self.transaction(changes_watchlist=False):
+            self.conn.execute('DELETE FROM refresh_progress')
+            self._set_meta('refresh_started', started)
+
+    def save_refresh_progress(self, name, info):
+        with self.transaction(changes_watchlist=False):
+            self.conn.execute('INSERT OR REPLACE INTO refresh_progress VALUES (?, ?)',
+                              (name, json.dumps(info)))
+
+    def finish_refresh(self):
+        """
+        Replaces authors with their refreshed info (authors removed during the
+        refresh aren't added back) and sets 'updated' to when the refresh
+        started.
+        """
+        with self.transaction():
+            refresh = self.get_refresh()
+            if not refresh:
+                return
+            for name, info in refresh['done'].items():
+                self.conn.execute('UPDATE authors SET info = ? WHERE name = ?',
+                                  (json.dumps(info), name))
+            self._set_meta('updated', refresh['started'])
+            self.conn.execute('DELETE FROM refresh_progress')
+            self.conn.execute(
+                "DELETE FROM meta WHERE key = 'refresh_started'")
+
+    def export_json(self, path):
+        """Writes the watchlist to path in the old JSON format."""
+        watchlist = self.load()
+        with open(path + '.tmp', 'w', encoding='utf-8') as w:
+            w.write(json.dumps(watchlist))
+        os.replace(path + '.tmp', path)
+
+    def _upsert_author(self, name, info):
+        self.conn.execute('''INSERT INTO authors VALUES (
+                ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM authors), ?)
+            ON CONFLICT(name) DO UPDATE SET info = excluded.info''',
+                          (name, json.dumps(info)))
+
+    def _get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))